@@ -1,6 +1,8 @@
 # app/api/v1/api.py
 from fastapi import APIRouter
-from app.api.v1.endpoints import stocks
+from app.api.v1.endpoints import jobs, metrics, stocks
 
 api_router = APIRouter()
-api_router.include_router(stocks.router, tags=["stocks"])
\ No newline at end of file
+api_router.include_router(stocks.router, tags=["stocks"])
+api_router.include_router(jobs.router, tags=["jobs"])
+api_router.include_router(metrics.router, tags=["metrics"])
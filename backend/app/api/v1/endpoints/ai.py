@@ -1,19 +1,35 @@
 # app/api/v1/endpoints/ai.py
+import logging
+from typing import Optional
+
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from starlette.websockets import WebSocketState
 from app.services.ai_service import AIService
+from app.services.market_context import get_market_context_builder
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 ai_service = AIService()
+market_context = get_market_context_builder()
 
 @router.websocket("/ws/analyze")
-async def analyze_market_ws(websocket: WebSocket):
+async def analyze_market_ws(websocket: WebSocket, stock_code: str = "000001.SZ",
+                            date: Optional[str] = None):
     try:
         await websocket.accept()
-        test_data = "平安银行(000001.SZ)是一家深圳的银行类上市公司，于1991年上市。"
-        await ai_service.analyze_market_stream(test_data, websocket)
+        # 预先生成的行情摘要作为分析输入
+        summary = await market_context.get(stock_code, date)
+        if summary is None:
+            await websocket.send_json({"status": "error",
+                                       "message": f"No market context for {stock_code}"})
+        else:
+            await ai_service.analyze_market_stream(summary, websocket)
+        # 分析结束后主动关闭，客户端据此判断输出完毕
+        await websocket.close()
     except WebSocketDisconnect:
-        print("WebSocket disconnected")
+        logger.info("WebSocket disconnected")
     except Exception as e:
-        print(f"Error in websocket: {str(e)}")
-        if websocket.client_state.CONNECTED:
-            await websocket.send_text(f"Error: {str(e)}")
\ No newline at end of file
+        logger.error(f"Error in websocket: {str(e)}")
+        if websocket.client_state == WebSocketState.CONNECTED:
+            await websocket.send_text(f"Error: {str(e)}")
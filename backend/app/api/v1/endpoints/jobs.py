@@ -0,0 +1,76 @@
+# app/api/v1/endpoints/jobs.py
+from typing import List, Optional
+
+from fastapi import APIRouter, HTTPException, Query
+from pydantic import BaseModel, Field
+
+from app.services.backfill import JOB_COMPLETED, get_backfill_service
+from app.services.job_history import JobHistoryService
+
+router = APIRouter()
+job_history_service = JobHistoryService()
+backfill_service = get_backfill_service()
+
+@router.get("/jobs/history")
+async def get_job_history(
+    job_id: Optional[str] = None,
+    status: Optional[str] = Query(None, pattern="^(success|failed|skipped)$"),
+    limit: int = Query(50, ge=1, le=1000)
+):
+    """查询定时任务的执行记录，按开始时间倒序"""
+    try:
+        return await job_history_service.recent(job_id, status, limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+class BackfillRequest(BaseModel):
+    """历史回补请求；不指定 codes 时回补全部股票"""
+    start_date: str = Field(..., pattern=r"^\d{8}$")
+    end_date: Optional[str] = Field(None, pattern=r"^\d{8}$")
+    codes: Optional[List[str]] = None
+
+@router.post("/jobs/backfill", status_code=202)
+async def create_backfill(request: BackfillRequest):
+    """创建回补任务并在后台运行，返回任务进度"""
+    try:
+        job = await backfill_service.create_job(request.start_date, request.end_date, request.codes)
+        backfill_service.start(job['id'])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return await backfill_service.progress(job['id'])
+
+@router.get("/jobs/backfill")
+async def list_backfills(limit: int = Query(20, ge=1, le=200)):
+    """最近的回补任务及进度"""
+    try:
+        return await backfill_service.list_jobs(limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/jobs/backfill/{job_id}")
+async def get_backfill(job_id: int):
+    """回补任务进度：已完成单元数、百分比、速率与预计剩余秒数"""
+    try:
+        job = await backfill_service.progress(job_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Backfill job not found")
+    return job
+
+@router.post("/jobs/backfill/{job_id}/resume", status_code=202)
+async def resume_backfill(job_id: int):
+    """从中断处继续：只运行未完成的单元"""
+    job = await backfill_service.progress(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Backfill job not found")
+    if job['status'] == JOB_COMPLETED:
+        raise HTTPException(status_code=409, detail="Backfill job is already completed")
+    try:
+        backfill_service.start(job_id)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return await backfill_service.progress(job_id)
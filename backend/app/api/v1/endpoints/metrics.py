@@ -0,0 +1,11 @@
+# app/api/v1/endpoints/metrics.py
+from fastapi import APIRouter, Response
+
+from app.core.metrics import CONTENT_TYPE, registry
+
+router = APIRouter()
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus 文本格式的进程内指标，只在抓取时格式化"""
+    return Response(content=registry.render(), media_type=CONTENT_TYPE)
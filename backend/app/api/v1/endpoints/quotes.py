@@ -0,0 +1,46 @@
+# app/api/v1/endpoints/quotes.py
+import logging
+
+import orjson
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from starlette.websockets import WebSocketState
+from app.services.quote_broker import QUOTE_FIELDS, get_quote_broker
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+broker = get_quote_broker()
+
+@router.websocket("/ws/quotes")
+async def stream_quotes(websocket: WebSocket):
+    """行情推送：客户端发送 {"action": "subscribe"|"unsubscribe", "codes": [...]}，
+    服务端按 tick 推送订阅代码中发生变化的行情"""
+    await websocket.accept()
+
+    async def close(code: int, reason: str):
+        if websocket.client_state == WebSocketState.CONNECTED:
+            await websocket.close(code=code, reason=reason)
+
+    subscriber = broker.connect(websocket.send_text, close)
+    try:
+        await websocket.send_json({"type": "hello", "fields": QUOTE_FIELDS})
+        while True:
+            try:
+                message = orjson.loads(await websocket.receive_text())
+                action, codes = message["action"], [str(code) for code in message["codes"]]
+                if action == "subscribe":
+                    broker.subscribe(subscriber, codes)
+                elif action == "unsubscribe":
+                    broker.unsubscribe(subscriber, codes)
+                else:
+                    raise ValueError(f"Unknown action '{action}'")
+            except (ValueError, KeyError, TypeError) as e:
+                await websocket.send_json({"type": "error", "message": str(e)})
+    except WebSocketDisconnect:
+        logger.info(f"Quote subscriber {subscriber.id} disconnected")
+    except Exception as e:
+        # 被推送中心断开后继续读取会失败
+        if subscriber.drop_reason is None:
+            logger.error(f"Error in quote websocket: {str(e)}")
+    finally:
+        await broker.disconnect(subscriber)
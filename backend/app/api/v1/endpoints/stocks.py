@@ -1,45 +1,259 @@
 # app/api/v1/endpoints/stocks.py
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List, Dict
+import asyncio
+import io
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from typing import List, Dict, Optional
+import orjson
+from pydantic import BaseModel, Field
 
-from app.core.database import get_db
+from app.core.cache import CachedResponse, reference_cache
+from app.services.daily_query import DailyQueryService, decode_cursor, encode_cursor
+from app.services.indicators import IndicatorEngine
+from app.services.intraday import get_intraday_service
+from app.services.screener import get_screener
 from app.services.stock_service import StockService
-from app.models.stock import StockBasic as Stock  # 将 StockBasic 别名为 Stock
 
 router = APIRouter()
 stock_service = StockService()
+daily_query_service = DailyQueryService()
+indicator_engine = IndicatorEngine()
+screener = get_screener()
+intraday_service = get_intraday_service()
+
+MAX_CODES_PER_REQUEST = 500
+
+def _not_modified(request: Request, cached: CachedResponse) -> bool:
+    """按 If-None-Match 判断客户端缓存是否仍然有效（If-Modified-Since 不作为依据）"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return False
+    return cached.etag in [tag.strip() for tag in if_none_match.split(",")] \
+        or if_none_match.strip() == "*"
+
+def _cached_json(request: Request, cached: CachedResponse) -> Response:
+    headers = {
+        "ETag": cached.etag,
+        "Cache-Control": "no-cache",
+    }
+    if _not_modified(request, cached):
+        return Response(status_code=304, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
+
+def _ndjson_stream(pages):
+    async def generate():
+        async for page in pages:
+            names = page.columns
+            yield b"".join(orjson.dumps(dict(zip(names, row))) + b"\n" for row in page.rows)
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+def _arrow_stream(pages, value_columns: List[str]):
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise HTTPException(status_code=406, detail="Arrow format requires pyarrow")
+
+    schema = pa.schema([("stock_code", pa.string()), ("trade_date", pa.string())]
+                       + [(name, pa.float64()) for name in value_columns])
+
+    async def generate():
+        sink = io.BytesIO()
+        writer = pa.ipc.new_stream(sink, schema)
+
+        def drain() -> bytes:
+            data = sink.getvalue()
+            sink.seek(0)
+            sink.truncate(0)
+            return data
+
+        yield drain()
+        async for page in pages:
+            arrays = [pa.array(values, type=field.type)
+                      for values, field in zip(zip(*page.rows), schema)]
+            writer.write_batch(pa.record_batch(arrays, schema=schema))
+            yield drain()
+        writer.close()
+        yield drain()
+
+    return StreamingResponse(generate(), media_type="application/vnd.apache.arrow.stream")
+
+async def _daily_response(stock_codes: List[str], start_date: Optional[str], end_date: Optional[str],
+                          columns: Optional[str], after: Optional[str], limit: int, format: str,
+                          freq: str = "D"):
+    try:
+        projection = [c.strip() for c in columns.split(",") if c.strip()] if columns else None
+        value_columns = DailyQueryService.resolve_columns(projection)
+        after_key = decode_cursor(after)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if format == "json":
+        page = await daily_query_service.fetch_page(
+            stock_codes, start_date, end_date, value_columns, after_key, limit, freq
+        )
+        body = {
+            "columns": page.columns,
+            "data": [dict(zip(page.columns, row)) for row in page.rows],
+            "next_cursor": encode_cursor(page.next_key),
+        }
+        return Response(content=orjson.dumps(body), media_type="application/json")
+
+    # 流式格式输出整个区间，服务端逐页读取
+    pages = daily_query_service.iter_pages(
+        stock_codes, start_date, end_date, value_columns, after_key, page_size=limit, freq=freq
+    )
+    if format == "ndjson":
+        return _ndjson_stream(pages)
+    return _arrow_stream(pages, value_columns)
+
+@router.get("/stocks/daily")
+async def get_daily_bars_multi(
+    codes: str = Query(..., description="逗号分隔的股票代码"),
+    start_date: Optional[str] = Query(None, pattern=r"^\d{8}$"),
+    end_date: Optional[str] = Query(None, pattern=r"^\d{8}$"),
+    columns: Optional[str] = Query(None, description="逗号分隔的列，如 open,close"),
+    after: Optional[str] = Query(None, description="上一页返回的 next_cursor"),
+    limit: int = Query(5000, ge=1, le=50000),
+    format: str = Query("json", pattern="^(json|ndjson|arrow)$"),
+    freq: str = Query("D", pattern="^(D|W|M)$", description="D 日线，W 周线，M 月线")
+):
+    """批量读取多只股票的K线，按 (stock_code, trade_date) 排序"""
+    stock_codes = sorted({code.strip() for code in codes.split(",") if code.strip()})
+    if not stock_codes:
+        raise HTTPException(status_code=400, detail="No stock codes given")
+    if len(stock_codes) > MAX_CODES_PER_REQUEST:
+        raise HTTPException(status_code=400,
+                            detail=f"At most {MAX_CODES_PER_REQUEST} codes per request")
+    return await _daily_response(stock_codes, start_date, end_date, columns, after, limit,
+                                 format, freq)
+
+@router.get("/stocks/intraday")
+async def get_intraday_bars(
+    codes: str = Query(..., description="逗号分隔的股票代码"),
+    minutes: int = Query(30, ge=1, le=1440),
+    fields: Optional[str] = Query(None, description="逗号分隔的字段，如 close,volume；默认全部")
+):
+    """从内存缓冲读取最近若干分钟的分钟线"""
+    stock_codes = list(dict.fromkeys(code.strip() for code in codes.split(",") if code.strip()))
+    if not stock_codes:
+        raise HTTPException(status_code=400, detail="No stock codes given")
+    if len(stock_codes) > MAX_CODES_PER_REQUEST:
+        raise HTTPException(status_code=400,
+                            detail=f"At most {MAX_CODES_PER_REQUEST} codes per request")
+    field_names = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    try:
+        result = intraday_service.recent(stock_codes, minutes, field_names)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return Response(content=orjson.dumps(result), media_type="application/json")
+
+@router.get("/stocks/{stock_code}/daily")
+async def get_daily_bars(
+    stock_code: str,
+    start_date: Optional[str] = Query(None, pattern=r"^\d{8}$"),
+    end_date: Optional[str] = Query(None, pattern=r"^\d{8}$"),
+    columns: Optional[str] = Query(None, description="逗号分隔的列，如 open,close"),
+    after: Optional[str] = Query(None, description="上一页返回的 next_cursor"),
+    limit: int = Query(5000, ge=1, le=50000),
+    format: str = Query("json", pattern="^(json|ndjson|arrow)$"),
+    freq: str = Query("D", pattern="^(D|W|M)$", description="D 日线，W 周线，M 月线")
+):
+    """读取单只股票的K线"""
+    return await _daily_response([stock_code], start_date, end_date, columns, after, limit,
+                                 format, freq)
 
 @router.get("/stocks/", response_model=List[Dict])
-async def get_stocks(db: Session = Depends(get_db)):
+async def get_stocks(request: Request):
     """获取股票列表"""
-    return await stock_service.get_stock_list()
+    async def load():
+        return CachedResponse.from_data(await stock_service.get_stock_list())
+
+    try:
+        cached = await reference_cache.get_or_load("stock_list", load)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return _cached_json(request, cached)
+
+class ScreenRequest(BaseModel):
+    """选股请求，expression 如 "close > ma20 and vol > 2 * avg_vol_20" 或 "industry == '银行'" """
+    expression: str = Field(..., max_length=1000)
+    date: Optional[str] = Field(None, pattern=r"^\d{8}$")
+    fields: Optional[List[str]] = None
+    sort_by: Optional[str] = None
+    descending: bool = True
+    limit: int = Field(500, ge=1, le=10000)
+
+@router.post("/stocks/screen")
+async def screen_stocks(request: ScreenRequest):
+    """在全市场截面上按表达式选股，默认使用最新交易日"""
+    try:
+        result = await screener.screen(request.expression, request.date, request.fields,
+                                       request.sort_by, request.descending, request.limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return Response(content=orjson.dumps(result), media_type="application/json")
+
+@router.get("/stocks/{stock_code}/indicators")
+async def get_stock_indicators(
+    stock_code: str,
+    names: Optional[str] = Query(None, description="逗号分隔的指标名，如 ma20,rsi14；默认全部"),
+    start_date: Optional[str] = Query(None, pattern=r"^\d{8}$"),
+    end_date: Optional[str] = Query(None, pattern=r"^\d{8}$")
+):
+    """读取单只股票的技术指标序列"""
+    indicator_names = [n.strip() for n in names.split(",") if n.strip()] if names else None
+    try:
+        return await asyncio.to_thread(indicator_engine.read, stock_code, indicator_names,
+                                       start_date, end_date)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/stocks/{stock_code}")
-async def get_stock(stock_code: str, db: Session = Depends(get_db)):
+async def get_stock(stock_code: str, request: Request):
     """获取单个股票信息"""
+    async def load():
+        stock = await stock_service.get_stock(stock_code)
+        return CachedResponse.from_data(stock) if stock is not None else None
+
     try:
-        stock = db.query(Stock).filter(Stock.ts_code == stock_code).first()
-        if stock is None:
-            raise HTTPException(status_code=404, detail="Stock not found")
-        return stock.to_dict()
+        cached = await reference_cache.get_or_load(("stock", stock_code), load)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    if cached is None:
+        raise HTTPException(status_code=404, detail="Stock not found")
+    return _cached_json(request, cached)
 
 @router.post("/stocks/update")
 async def update_stocks():
     """更新股票基础数据"""
     try:
-        result = await stock_service.update_stock_basics()
-        return {"message": "Stock data updated successfully", "status": result}
+        stats = await stock_service.update_stock_basics()
+        return {"message": "Stock data updated successfully", "status": True,
+                "changes": stats.summary()}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/stocks/daily/update")
-async def update_daily_data():
-    """更新股票日线数据"""
+async def update_daily_data(full_refresh: bool = False, dry_run: bool = False):
+    """更新股票日线数据；dry_run=true 时只返回拉取计划"""
     try:
-        result = await stock_service.update_daily_data()
+        if dry_run:
+            plan = await stock_service.plan_daily_update(full_refresh=full_refresh)
+            return {"message": "Dry run, no data fetched", "plan": plan.summary()}
+        result = await stock_service.update_daily_data(full_refresh=full_refresh)
         return {"message": "Daily data updated successfully", "status": result}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/stocks/indicators/update")
+async def update_indicators(full: bool = False):
+    """计算新交易日的技术指标；full=true 时全量重算"""
+    try:
+        summary = await asyncio.to_thread(indicator_engine.update, None, full)
+        return {"message": "Indicators updated successfully", "summary": summary}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -0,0 +1,102 @@
+# app/core/cache.py
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+import orjson
+
+from app.core.config import settings
+
+
+@dataclass
+class CachedResponse:
+    """预先序列化的 JSON 响应及其 ETag
+
+    不提供 Last-Modified：缓存构建时间不代表数据的修改时间，且精度只到秒，
+    同一秒内数据变化时按时间判断会返回过期的 304；条件请求只按内容哈希的 ETag 判断。
+    """
+    body: bytes
+    etag: str
+
+    @classmethod
+    def from_data(cls, data: Any) -> "CachedResponse":
+        body = orjson.dumps(data)
+        etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        return cls(body=body, etag=etag)
+
+
+class TTLCache:
+    """带过期时间与容量上限的进程内 LRU 缓存
+
+    每次 invalidate 递增代数；加载期间代数变化说明数据已更新，加载结果可能读到
+    旧数据，只返回给本次调用方而不写入缓存。
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        # 键 -> [锁, 使用中的调用数]，无人使用时删除
+        self._locks: Dict[Hashable, list] = {}
+        self._generation = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            self._data.pop(key, None)
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """未命中时加载；同一键的并发请求只加载一次"""
+        value = self.get(key)
+        if value is not None:
+            return value
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                value = self.get(key)
+                if value is None:
+                    generation = self._generation
+                    value = await loader()
+                    if value is not None and generation == self._generation:
+                        self.set(key, value)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and self._locks.get(key) is entry:
+                del self._locks[key]
+        return value
+
+    def invalidate(self, key: Optional[Hashable] = None) -> None:
+        """删除指定键；不指定时清空"""
+        self._generation += 1
+        if key is None:
+            self._data.clear()
+        else:
+            self._data.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+# 股票基础信息等参考数据的缓存，update_stock_basics 提交变更后失效
+reference_cache = TTLCache(
+    maxsize=settings.REFERENCE_CACHE_SIZE,
+    ttl=settings.REFERENCE_CACHE_TTL
+)
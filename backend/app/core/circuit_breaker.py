@@ -0,0 +1,82 @@
+# app/core/circuit_breaker.py
+import logging
+import threading
+import time
+from typing import Callable, Optional
+
+from app.core.config import settings
+from app.core.exceptions import CircuitOpenError, CircuitTrialInProgressError
+from app.core.metrics import CIRCUIT_STATE
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+# 导出为 gauge 的状态值
+STATE_VALUES = {CLOSED: 0, OPEN: 1, HALF_OPEN: 2}
+
+
+class CircuitBreaker:
+    """熔断器：连续失败达到阈值后断开，冷却期内直接拒绝调用
+
+    冷却结束后进入半开状态，只放行一次试探调用：成功则闭合，失败则重新断开。
+    调用在拉取线程中进行，状态变更加锁。
+    """
+
+    def __init__(self, name: str,
+                 failure_threshold: Optional[int] = None,
+                 reset_timeout: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold or settings.CIRCUIT_FAILURE_THRESHOLD
+        self.reset_timeout = settings.CIRCUIT_RESET_SECONDS if reset_timeout is None else reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+        CIRCUIT_STATE.set(STATE_VALUES[CLOSED], name=name)
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+                return HALF_OPEN
+            return self._state
+
+    def before_call(self) -> None:
+        """发起调用前检查；断开时抛出 CircuitOpenError"""
+        with self._lock:
+            if self._state == OPEN:
+                remaining = self.reset_timeout - (self.clock() - self._opened_at)
+                if remaining > 0:
+                    raise CircuitOpenError(f"Circuit '{self.name}' is open, retry in {remaining:.0f}s")
+                self._set_state(HALF_OPEN)
+            if self._state == HALF_OPEN:
+                if self._trial_in_flight:
+                    raise CircuitTrialInProgressError(
+                        f"Circuit '{self.name}' is half-open, trial call in progress")
+                self._trial_in_flight = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self._trial_in_flight = False
+            if self._state != CLOSED:
+                logger.info(f"Circuit '{self.name}' closed")
+                self._set_state(CLOSED)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self._state == HALF_OPEN or (self._state == CLOSED and self.failures >= self.failure_threshold):
+                logger.warning(f"Circuit '{self.name}' opened after {self.failures} consecutive failures")
+                self._opened_at = self.clock()
+                self._set_state(OPEN)
+
+    def _set_state(self, state: str) -> None:
+        self._state = state
+        CIRCUIT_STATE.set(STATE_VALUES[state], name=self.name)
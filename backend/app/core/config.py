@@ -14,11 +14,93 @@ class Settings(BaseSettings):
     
     # SQLite配置
     SQLALCHEMY_DATABASE_URL: str = "sqlite:///./quant_trading.db"
+    SQLALCHEMY_ASYNC_DATABASE_URL: str = "sqlite+aiosqlite:///./quant_trading.db"
+    # 异步连接池与 SQLite 性能参数
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024
+    SQLITE_CACHE_SIZE_KB: int = 64 * 1024
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
     
     TUSHARE_TOKEN: str = os.getenv("TUSHARE_TOKEN")
 
     ZHIPU_API_KEY: str  = os.getenv("ZHIPU_API_KEY")
+    # 大模型接口：openai 兼容接口或本地 stub（测试、离线开发）
+    AI_BACKEND: str = "openai"
+    AI_BASE_URL: str = "https://api.lingyiwanwu.com/v1"
+    AI_MODEL: str = "yi-large"
+    AI_TEMPERATURE: float = 0.3
+    AI_REQUEST_TIMEOUT: float = 120.0
+    # 同时进行的模型流数上限；每个会话缓冲的未发送片段数
+    AI_MAX_CONCURRENT_STREAMS: int = 16
+    AI_SESSION_QUEUE_SIZE: int = 64
+    # 已完成分析的缓存（按输入数据哈希）
+    AI_ANALYSIS_CACHE_SIZE: int = 1024
+    AI_ANALYSIS_CACHE_TTL: int = 86400
+    # 行情摘要的 token 预算与保留天数
+    AI_CONTEXT_TOKEN_BUDGET: int = 200
+    AI_CONTEXT_RETENTION_DAYS: int = 30
     DEFAULT_BACKTRACK_DAYS: int = 365
+    # 日线批量写入每个分块的行数
+    UPSERT_CHUNK_SIZE: int = 5000
+    # tushare 每分钟调用配额及拉取并发
+    TUSHARE_CALLS_PER_MINUTE: int = 500
+    FETCH_CONCURRENCY: int = 4
+    # 限流错误时限流器降速的倍数与最低速率（占配额的比例），成功调用后逐步恢复
+    RATE_LIMIT_BACKOFF: float = 0.5
+    RATE_LIMIT_MIN_FRACTION: float = 0.1
+    # 每个拉取单元的最多尝试次数与指数退避的初始、最大间隔（秒）
+    FETCH_UNIT_MAX_ATTEMPTS: int = 4
+    FETCH_RETRY_BASE_DELAY: float = 2.0
+    FETCH_RETRY_MAX_DELAY: float = 60.0
+    # 连续失败多少次后熔断 tushare 调用，及熔断的冷却秒数
+    CIRCUIT_FAILURE_THRESHOLD: int = 5
+    CIRCUIT_RESET_SECONDS: float = 120.0
+    # 收盘后重做失败单元的检查间隔（分钟）
+    FETCH_RETRY_QUEUE_MINUTES: int = 10
+    # 多进程回补：工作进程数（0 为 CPU 核数）、暂存目录、每个暂存文件的行数
+    BACKFILL_WORKERS: int = 0
+    BACKFILL_STAGING_DIR: str = "./data/backfill_staging"
+    BACKFILL_FLUSH_ROWS: int = 500000
+    # 拉取结果等待写入的最大批次数
+    WRITE_QUEUE_SIZE: int = 16
+    # 增量更新时单次 daily 查询最多合并的股票数
+    MAX_CODES_PER_QUERY: int = 200
+    # 全市场股票数估计，用于判断按日查询是否会超过单次行数上限
+    MARKET_SIZE: int = 5500
+    # 列式 OHLCV 存储目录（与 SQLite 并行维护）
+    COLUMNAR_STORE_DIR: str = "./data/columnar"
+    # 股票参考数据接口缓存
+    REFERENCE_CACHE_SIZE: int = 8192
+    REFERENCE_CACHE_TTL: int = 3600
+    # 交易日历所用交易所（沪深交易日一致）
+    TRADE_CALENDAR_EXCHANGE: str = "SSE"
+    # 选股快照保留的最近交易日数（决定 avg_vol_N 等窗口的上限）
+    SCREENER_SNAPSHOT_DAYS: int = 60
+    # tushare 响应磁盘缓存：off 直连，readwrite 读写缓存，replay 只回放已记录的响应（离线）
+    TUSHARE_CACHE_MODE: str = "readwrite"
+    TUSHARE_CACHE_DIR: str = "./data/tushare_cache"
+    # 包含今天及以后日期的请求的缓存秒数；无日期参数的参考数据的缓存秒数
+    TUSHARE_CACHE_RECENT_TTL: int = 600
+    TUSHARE_CACHE_REFERENCE_TTL: int = 86400
+    # 定期清理缓存：除过期文件外，删除早于该天数的文件，并按时间从旧到新删除至总大小不超过上限（0 为不限）
+    TUSHARE_CACHE_MAX_AGE_DAYS: int = 0
+    TUSHARE_CACHE_MAX_MB: int = 0
+    # 分钟线数据源（tushare 实时行情 / fake）、实时行情单次查询的股票数
+    INTRADAY_SOURCE: str = "tushare"
+    INTRADAY_QUOTE_BATCH: int = 50
+    # 实时行情接口的每分钟调用上限，分钟线轮询与行情推送共用
+    INTRADAY_QUOTE_CALLS_PER_MINUTE: int = 200
+    # 内存环形缓冲保留的分钟数；已完成分钟批量落库的间隔（分钟）
+    INTRADAY_BUFFER_MINUTES: int = 240
+    INTRADAY_FLUSH_MINUTES: int = 5
+    # 行情推送：上游轮询间隔（秒）、单连接订阅上限；发送超时或连续合并推送过多的连接会被断开
+    QUOTE_POLL_SECONDS: float = 3.0
+    QUOTE_MAX_CODES_PER_SUBSCRIBER: int = 500
+    QUOTE_SEND_TIMEOUT: float = 5.0
+    QUOTE_MAX_CONFLATED_TICKS: int = 20
+    # 进程内指标（/metrics），关闭后记录操作直接返回
+    METRICS_ENABLED: bool = True
     class Config:
         case_sensitive = True
 
@@ -1,16 +1,58 @@
 # app/core/database.py
-from sqlalchemy import create_engine
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.ext.declarative import declarative_base
 from app.core.config import settings
+from app.models.base import Base
+
+
+def configure_sqlite(engine: Engine) -> None:
+    """为 SQLite 连接设置 WAL 等参数，使读操作与夜间写入并行"""
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA mmap_size={settings.SQLITE_MMAP_SIZE}")
+        # 负数表示以 KiB 为单位
+        cursor.execute(f"PRAGMA cache_size=-{settings.SQLITE_CACHE_SIZE_KB}")
+        cursor.execute(f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+
 
+# 同步引擎：供脚本、建表及批量写入（通过 AsyncSession.run_sync）使用
 engine = create_engine(
     settings.SQLALCHEMY_DATABASE_URL,
     connect_args={"check_same_thread": False}  # 仅用于SQLite
 )
+configure_sqlite(engine)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
+
+# 异步引擎：服务与接口按操作获取短生命周期的会话
+async_engine = create_async_engine(
+    settings.SQLALCHEMY_ASYNC_DATABASE_URL,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_pre_ping=True
+)
+configure_sqlite(async_engine.sync_engine)
+
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
 
 def get_db():
     db = SessionLocal()
@@ -19,7 +61,37 @@ def get_db():
     finally:
         db.close()
 
+
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    """FastAPI 依赖：每个请求一个异步会话"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+@asynccontextmanager
+async def session_scope(session_factory: async_sessionmaker = None) -> AsyncIterator[AsyncSession]:
+    """单次操作的异步会话，异常时回滚"""
+    async with (session_factory or AsyncSessionLocal)() as db:
+        try:
+            yield db
+        except Exception:
+            await db.rollback()
+            raise
+
+
+# 模型中已删除、但旧数据库中可能仍存在的索引
+RETIRED_INDEXES = ('ix_daily_data_code_date_ohlcv',)
+
+
 def init_db():
     # 导入所有模型，以便创建表
     from app.models import stock
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    Base.metadata.create_all(bind=engine)
+    # create_all 不会为已存在的表补建索引
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    # 已移除的索引：覆盖全部 OHLCV 列的索引相当于日线表的第二份拷贝，拖慢批量写入
+    with engine.begin() as connection:
+        for name in RETIRED_INDEXES:
+            connection.execute(text(f"DROP INDEX IF EXISTS {name}"))
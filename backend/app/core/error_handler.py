@@ -6,6 +6,7 @@ from functools import wraps
 from datetime import datetime
 from app.core.exceptions import DataFetchError, DatabaseError
 from app.core.config import settings
+from app.core.metrics import RETRY_ATTEMPTS
 
 # 配置日志
 logging.basicConfig(
@@ -31,11 +32,13 @@ def handle_data_errors(retries: int = 3, delay: int = 1):
                     logger.error(f"Data fetch error: {str(e)}, attempt {attempt + 1}/{retries}")
                     if attempt == retries - 1:
                         raise
+                    RETRY_ATTEMPTS.inc(function=func.__name__, error='data_fetch')
                     await asyncio.sleep(delay * (attempt + 1))
                 except DatabaseError as e:
                     logger.error(f"Database error: {str(e)}, attempt {attempt + 1}/{retries}")
                     if attempt == retries - 1:
                         raise
+                    RETRY_ATTEMPTS.inc(function=func.__name__, error='database')
                     await asyncio.sleep(delay * (attempt + 1))
                 except Exception as e:
                     logger.error(f"Unexpected error: {str(e)}")
@@ -5,4 +5,16 @@ class DataFetchError(Exception):
 
 class DatabaseError(Exception):
     """数据库操作错误"""
-    pass
\ No newline at end of file
+    pass
+
+class RateLimitError(DataFetchError):
+    """超过接口调用配额"""
+    pass
+
+class CircuitOpenError(DataFetchError):
+    """熔断器断开，未发起调用"""
+    pass
+
+class CircuitTrialInProgressError(CircuitOpenError):
+    """熔断器半开且试探调用进行中，未发起调用；试探结束后可再次尝试"""
+    pass
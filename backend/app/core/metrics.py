@@ -0,0 +1,241 @@
+# app/core/metrics.py
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+
+# 默认延迟分桶（秒）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"Metric {self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """单调递增计数"""
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        if not settings.METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    """可增可减的当前值"""
+    kind = 'gauge'
+
+    def set(self, value: float, **labels) -> None:
+        if not settings.METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """延迟分布：记录时只做一次二分查找与计数，累计分桶在导出时计算"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 每个标签组合：[各分桶计数..., +Inf 计数], 总和
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        if not settings.METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][index] += 1
+            entry[1][0] += value
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """计时代码块（异常时同样记录）"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        entry = self._values.get(self._key(labels))
+        return sum(entry[0]) if entry else 0
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            items = sorted((key, (list(counts), total[0])) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """进程内指标注册表，按 Prometheus 文本格式导出"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+TUSHARE_CALLS = registry.counter(
+    'tushare_api_calls_total', 'tushare API calls by interface and outcome', ['api', 'status'])
+TUSHARE_CALL_SECONDS = registry.histogram(
+    'tushare_api_call_seconds', 'tushare API call latency', ['api'])
+BATCH_WRITE_SECONDS = registry.histogram(
+    'ingest_batch_write_seconds', 'Time to write one fetched daily batch', ['status'])
+BATCH_ROWS = registry.counter('ingest_batch_rows_total', 'Daily rows written by ingest batches')
+DB_COMMIT_SECONDS = registry.histogram(
+    'db_commit_seconds', 'Database commit latency', ['operation'])
+RETRY_ATTEMPTS = registry.counter(
+    'retry_attempts_total', 'Failed attempts that were retried', ['function', 'error'])
+RATE_LIMITER_WAIT_SECONDS = registry.histogram(
+    'rate_limiter_wait_seconds', 'Time spent waiting for a rate limiter token',
+    buckets=(0, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0))
+JOB_DURATION_SECONDS = registry.histogram(
+    'scheduler_job_duration_seconds', 'Scheduled job duration', ['job', 'status'],
+    buckets=(0.1, 0.5, 1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600))
+JOB_SKIPPED = registry.counter(
+    'scheduler_job_skipped_total', 'Job runs skipped because the previous run was still active', ['job'])
+HTTP_REQUEST_SECONDS = registry.histogram(
+    'http_request_duration_seconds', 'HTTP request latency by route template', ['method', 'route', 'status'])
+TUSHARE_RATE_LIMITED = registry.counter(
+    'tushare_rate_limited_total', 'tushare calls rejected for exceeding the call quota', ['api'])
+RATE_LIMITER_RATE = registry.gauge(
+    'rate_limiter_calls_per_minute', 'Current adaptive rate of a rate limiter', ['name'])
+CIRCUIT_STATE = registry.gauge(
+    'circuit_breaker_state', 'Circuit breaker state (0 closed, 1 open, 2 half-open)', ['name'])
+INGEST_UNITS_DEFERRED = registry.counter(
+    'ingest_units_deferred_total', 'Fetch units left in the retry queue after a pipeline run', ['reason'])
+QUOTE_SUBSCRIBERS = registry.gauge('quote_subscribers', 'Connected quote stream subscribers')
+QUOTE_MESSAGES = registry.counter('quote_messages_sent_total', 'Quote batches sent to subscribers')
+QUOTE_CONFLATED = registry.counter(
+    'quote_ticks_conflated_total', 'Ticks merged into a pending batch because the subscriber was busy')
+QUOTE_DROPPED = registry.counter(
+    'quote_subscribers_dropped_total', 'Subscribers disconnected by the broker', ['reason'])
+
+
+class MetricsMiddleware:
+    """记录 HTTP 请求延迟；按路由模板而非实际路径打标签，避免标签基数随股票代码膨胀"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not settings.METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status: Optional[int] = None
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get('route')
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - started,
+                method=scope['method'],
+                route=getattr(route, 'path', 'unmatched'),
+                status=status or 500
+            )
@@ -0,0 +1,149 @@
+# app/core/rate_limiter.py
+import asyncio
+import logging
+import multiprocessing
+import time
+from typing import Optional
+
+from app.core.metrics import RATE_LIMITER_RATE, RATE_LIMITER_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# 多个并发调用几乎同时被限流时只降速一次
+SLOW_DOWN_WINDOW = 1.0
+
+
+class TokenBucketRateLimiter:
+    """令牌桶限流器，按每分钟配额匀速发放令牌
+
+    配额是上限而非保证：被上游限流时 slow_down() 按倍数降低发放速率并清空令牌，
+    之后每次成功调用 recover() 按配额的固定比例加回，直至恢复配额（AIMD）。
+    """
+
+    def __init__(self, calls_per_minute: int, burst: Optional[int] = None,
+                 backoff: float = 0.5, min_fraction: float = 0.1, recovery_fraction: float = 0.05,
+                 name: str = 'tushare'):
+        if calls_per_minute <= 0:
+            raise ValueError("calls_per_minute must be positive")
+        self.max_rate = calls_per_minute / 60.0
+        self.rate = self.max_rate
+        self.min_rate = self.max_rate * min_fraction
+        self.backoff = backoff
+        self.recovery_step = self.max_rate * recovery_fraction
+        self.capacity = float(burst or 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._slowed_at = float('-inf')
+        self._lock = asyncio.Lock()
+        self.name = name
+        RATE_LIMITER_RATE.set(self.calls_per_minute, name=name)
+
+    @property
+    def calls_per_minute(self) -> float:
+        return self.rate * 60
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens: float = 1.0) -> float:
+        """获取令牌，必要时等待；返回本次等待的秒数"""
+        waited = 0.0
+        started = time.monotonic()
+        # 持锁等待保证先到先得，避免多个协程同时被唤醒后超发
+        async with self._lock:
+            self._refill()
+            while self._tokens < tokens:
+                delay = (tokens - self._tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+                self._refill()
+            self._tokens -= tokens
+        # 指标包含排队等锁的时间
+        RATE_LIMITER_WAIT_SECONDS.observe(time.monotonic() - started)
+        return waited
+
+    def slow_down(self) -> None:
+        """上游报告超出配额：降低速率并清空已积累的令牌"""
+        now = time.monotonic()
+        if now - self._slowed_at < SLOW_DOWN_WINDOW:
+            return
+        self._slowed_at = now
+        self._refill()
+        self._tokens = min(self._tokens, 0.0)
+        self.rate = max(self.min_rate, self.rate * self.backoff)
+        RATE_LIMITER_RATE.set(self.calls_per_minute, name=self.name)
+        logger.warning(f"Rate limited by upstream, slowing down to {self.calls_per_minute:.0f} calls/min")
+
+    def recover(self) -> None:
+        """调用成功：逐步恢复到配额速率"""
+        if self.rate >= self.max_rate:
+            return
+        self._refill()
+        self.rate = min(self.max_rate, self.rate + self.recovery_step)
+        RATE_LIMITER_RATE.set(self.calls_per_minute, name=self.name)
+
+
+class SharedRateLimiter:
+    """跨进程共享的限流器，供多进程回补的各工作进程共同遵守同一配额
+
+    状态（下一个可用时隙、当前间隔、上次降速时间）放在共享内存中：每次调用在锁内
+    占用一个时隙并把下一个时隙后移一个间隔，再在锁外等待到自己的时隙（GCRA），
+    因此各进程的调用严格按间隔错开。time.monotonic 在同一台机器的进程间一致。
+    与 TokenBucketRateLimiter 接口相同，降速与恢复对所有进程同时生效。
+    在创建工作进程时作为参数传入（spawn 时随进程一起传递）。
+    """
+
+    def __init__(self, calls_per_minute: int, backoff: float = 0.5, min_fraction: float = 0.1,
+                 recovery_fraction: float = 0.05, context=None):
+        if calls_per_minute <= 0:
+            raise ValueError("calls_per_minute must be positive")
+        context = context or multiprocessing.get_context()
+        self.max_rate = calls_per_minute / 60.0
+        self.min_rate = self.max_rate * min_fraction
+        self.backoff = backoff
+        self.recovery_step = self.max_rate * recovery_fraction
+        # [下一个可用时隙, 当前间隔, 上次降速时间]
+        self._state = context.Array('d', [0.0, 1.0 / self.max_rate, float('-inf')])
+
+    @property
+    def rate(self) -> float:
+        return 1.0 / self._state[1]
+
+    @property
+    def calls_per_minute(self) -> float:
+        return self.rate * 60
+
+    def reserve(self, tokens: float = 1.0) -> float:
+        """占用调用时隙，返回需要等待的秒数"""
+        with self._state.get_lock():
+            now = time.monotonic()
+            slot = max(now, self._state[0])
+            self._state[0] = slot + self._state[1] * tokens
+        return slot - now
+
+    async def acquire(self, tokens: float = 1.0) -> float:
+        """获取调用时隙，必要时等待；返回等待的秒数"""
+        waited = self.reserve(tokens)
+        if waited > 0:
+            await asyncio.sleep(waited)
+        RATE_LIMITER_WAIT_SECONDS.observe(waited)
+        return waited
+
+    def slow_down(self) -> None:
+        """上游报告超出配额：所有进程降低速率，并推迟下一个时隙"""
+        with self._state.get_lock():
+            now = time.monotonic()
+            if now - self._state[2] < SLOW_DOWN_WINDOW:
+                return
+            self._state[2] = now
+            self._state[1] = 1.0 / max(self.min_rate, self.rate * self.backoff)
+            self._state[0] = max(self._state[0], now + self._state[1])
+        logger.warning(f"Rate limited by upstream, slowing down to {self.calls_per_minute:.0f} calls/min")
+
+    def recover(self) -> None:
+        """调用成功：逐步恢复到配额速率"""
+        with self._state.get_lock():
+            if self.rate < self.max_rate:
+                self._state[1] = 1.0 / min(self.max_rate, self.rate + self.recovery_step)
@@ -1,50 +1,187 @@
 # app/core/scheduler.py
+import asyncio
+import logging
+from datetime import datetime, time
+from typing import Awaitable, Callable, Optional
+
+from apscheduler.events import EVENT_JOB_MAX_INSTANCES, JobSubmissionEvent
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
+from app.core.config import settings
+from app.core.metrics import JOB_DURATION_SECONDS, JOB_SKIPPED
+from app.services.intraday import IntradayService, get_intraday_service
+from app.services.job_history import JobHistoryService, start_counting
 from app.services.stock_service import StockService
 
+logger = logging.getLogger(__name__)
+
+
 class StockDataScheduler:
-    def __init__(self):
-        self.scheduler = AsyncIOScheduler()
-        # 不在初始化时创建 StockService
-        
+    def __init__(self, stock_service: Optional[StockService] = None,
+                 job_history: Optional[JobHistoryService] = None,
+                 intraday_service: Optional[IntradayService] = None):
+        # 同一任务同时只运行一个实例；积压的多次触发合并为一次
+        self.scheduler = AsyncIOScheduler(job_defaults={'coalesce': True, 'max_instances': 1})
+        self.scheduler.add_listener(self._on_skipped, EVENT_JOB_MAX_INSTANCES)
+        # 服务实例在首次执行时创建并在之后的每次触发中复用
+        self._stock_service = stock_service
+        self._intraday_service = intraday_service
+        self.job_history = job_history or JobHistoryService()
+        self._pending_records = set()
+
+    @property
+    def stock_service(self) -> StockService:
+        if self._stock_service is None:
+            self._stock_service = StockService()
+        return self._stock_service
+
+    @property
+    def intraday_service(self) -> IntradayService:
+        if self._intraday_service is None:
+            self._intraday_service = get_intraday_service()
+        return self._intraday_service
+
     async def setup_jobs(self):
         # 每个交易日9:30-15:00期间每分钟更新
         self.scheduler.add_job(
-            self._update_stock_basics,  # 使用类方法
+            self._run_job,
             CronTrigger(
-                day_of_week='mon-fri', 
-                hour='9-15', 
+                day_of_week='mon-fri',
+                hour='9-15',
                 minute='*',
                 second='0'
             ),
+            args=['update_stock_basics', self._update_stock_basics],
             id='update_stock_basics',
-            misfire_grace_time=30
+            misfire_grace_time=30,
+            replace_existing=True
         )
-        
+
         # 每日收盘后更新日线数据
         self.scheduler.add_job(
-            self._update_daily_data,  # 使用类方法
+            self._run_job,
             CronTrigger(
                 day_of_week='mon-fri',
                 hour='15',
                 minute='30'
             ),
-            id='update_daily_data'
+            args=['update_daily_data', self._update_daily_data],
+            id='update_daily_data',
+            misfire_grace_time=600,
+            replace_existing=True
+        )
+
+        # 收盘后定期重做失败的拉取单元（队列为空时不执行、不记录）
+        self.scheduler.add_job(
+            self._retry_failed_units,
+            CronTrigger(
+                day_of_week='mon-fri',
+                hour='15-23',
+                minute=f'*/{settings.FETCH_RETRY_QUEUE_MINUTES}'
+            ),
+            id='retry_failed_units',
+            misfire_grace_time=300,
+            replace_existing=True
+        )
+
+        # 交易时段内每分钟轮询分钟线，写入内存缓冲
+        self.scheduler.add_job(
+            self._run_job,
+            CronTrigger(
+                day_of_week='mon-fri',
+                hour='9-15',
+                minute='*',
+                second='5'
+            ),
+            args=['poll_intraday', self._poll_intraday],
+            id='poll_intraday',
+            misfire_grace_time=30,
+            replace_existing=True
+        )
+
+        # 定期把已完成的分钟批量落库，收盘后写入最后一分钟
+        self.scheduler.add_job(
+            self._run_job,
+            CronTrigger(
+                day_of_week='mon-fri',
+                hour='9-15',
+                minute=f'*/{settings.INTRADAY_FLUSH_MINUTES}',
+                second='30'
+            ),
+            args=['flush_intraday', self._flush_intraday],
+            id='flush_intraday',
+            misfire_grace_time=120,
+            replace_existing=True
         )
 
+        # 每周清理 tushare 响应缓存
+        self.scheduler.add_job(
+            self._run_job,
+            CronTrigger(
+                day_of_week='sun',
+                hour='3',
+                minute='0'
+            ),
+            args=['prune_tushare_cache', self._prune_tushare_cache],
+            id='prune_tushare_cache',
+            misfire_grace_time=3600,
+            replace_existing=True
+        )
+
+    async def _run_job(self, job_id: str, func: Callable[[], Awaitable[bool]]) -> None:
+        """执行任务并记录耗时、写入行数与接口调用次数"""
+        counters = start_counting()
+        started_at = datetime.now()
+        status, error = 'success', None
+        try:
+            if await func() is False:
+                status, error = 'failed', 'Job reported failure'
+        except Exception as e:
+            status, error = 'failed', str(e)
+            logger.error(f"Job {job_id} failed: {str(e)}")
+        finished_at = datetime.now()
+        JOB_DURATION_SECONDS.observe((finished_at - started_at).total_seconds(), job=job_id, status=status)
+        logger.info(f"Job {job_id} {status} in {(finished_at - started_at).total_seconds():.1f}s: "
+                    f"rows={counters.rows}, api_calls={counters.api_calls}")
+        await self.job_history.record(job_id, status, started_at, finished_at, counters, error)
+
+    def _on_skipped(self, event: JobSubmissionEvent) -> None:
+        """上一次执行尚未结束时 APScheduler 会跳过本次触发，记录为 skipped"""
+        logger.warning(f"Job {event.job_id} skipped: previous run still in progress")
+        JOB_SKIPPED.inc(job=event.job_id)
+        # 与其他记录一致使用本地时间
+        scheduled_at = event.scheduled_run_times[0].astimezone().replace(tzinfo=None)
+        task = asyncio.ensure_future(self.job_history.record(event.job_id, 'skipped', scheduled_at))
+        self._pending_records.add(task)
+        task.add_done_callback(self._pending_records.discard)
+
     async def _update_stock_basics(self):
         """包装更新方法"""
-        stock_service = StockService()
-        await stock_service.update_stock_basics()
+        await self.stock_service.update_stock_basics()
 
     async def _update_daily_data(self):
         """包装更新方法"""
-        stock_service = StockService()
-        await stock_service.update_daily_data()
+        return await self.stock_service.update_daily_data()
+
+    async def _retry_failed_units(self):
+        """重试队列非空时作为任务执行"""
+        if len(self.stock_service.retry_queue):
+            await self._run_job('retry_failed_units', self.stock_service.retry_failed_units)
+
+    async def _prune_tushare_cache(self):
+        """遍历缓存文件较慢，在线程中执行"""
+        await asyncio.to_thread(self.stock_service.ts_api.prune)
+
+    async def _poll_intraday(self):
+        """包装轮询方法"""
+        await self.intraday_service.poll_live()
+
+    async def _flush_intraday(self):
+        """收盘后连同最后一分钟一起落库"""
+        await self.intraday_service.flush(force=datetime.now().time() >= time(15, 1))
 
     def start(self):
         self.scheduler.start()
 
     def shutdown(self):
-        self.scheduler.shutdown()
\ No newline at end of file
+        self.scheduler.shutdown()
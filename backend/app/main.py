@@ -5,13 +5,17 @@ from app.core.database import engine
 from app.models import stock
 from app.api.v1.endpoints import stocks
 from app.api.v1.endpoints import ai
+from app.api.v1.endpoints import jobs
+from app.api.v1.endpoints import metrics
+from app.api.v1.endpoints import quotes
+from app.core.metrics import MetricsMiddleware
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
 from tests import test
 from app.api.v1.api import api_router 
 from app.core.scheduler import StockDataScheduler
 # 确保导入所有模型
-from app.models.stock import StockBasic
+from app.models.stock import Stock
 
 
 app = FastAPI(
@@ -27,6 +31,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# 按路由模板记录请求延迟
+app.add_middleware(MetricsMiddleware)
 
 @app.get("/")
 async def root():
@@ -38,6 +44,10 @@ stock.Base.metadata.create_all(bind=engine)
 
 app.include_router(stocks.router, prefix=settings.API_V1_STR + "/stocks", tags=["stocks"])
 app.include_router(ai.router, prefix=settings.API_V1_STR + "/ai", tags=["ai"])
+app.include_router(jobs.router, prefix=settings.API_V1_STR, tags=["jobs"])
+app.include_router(quotes.router, prefix=settings.API_V1_STR + "/quotes", tags=["quotes"])
+# Prometheus 默认抓取 /metrics
+app.include_router(metrics.router, tags=["metrics"])
 app.include_router(test.router, prefix=settings.API_V1_STR, tags=["test"])
 # 添加静态文件挂载
 app.mount("/static", StaticFiles(directory=Path(__file__).parent.parent / "static"), name="static")
\ No newline at end of file
@@ -1,5 +1,5 @@
 # app/models/__init__.py
 from .base import Base
-from .stock import Stock
+from .stock import Stock, DailyData
 
 __all__ = ['Base', 'Stock', 'DailyData']
\ No newline at end of file
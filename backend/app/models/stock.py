@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Float, DateTime, Integer, ForeignKey, UniqueConstraint
+from sqlalchemy import Column, String, Float, DateTime, Integer, ForeignKey, Index, Text, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .base import Base
@@ -17,6 +17,16 @@ class Stock(Base):
 
     daily_data = relationship("DailyData", back_populates="stock")
 
+    def to_dict(self):
+        return {
+            'ts_code': self.ts_code,
+            'symbol': self.symbol,
+            'name': self.name,
+            'area': self.area,
+            'industry': self.industry,
+            'list_date': self.list_date,
+        }
+
 class DailyData(Base):
     __tablename__ = "daily_data"
 
@@ -35,6 +45,150 @@ class DailyData(Base):
     stock = relationship("Stock", back_populates="daily_data")
 
     __table_args__ = (
+        # 同时服务 (stock_code, trade_date) 区间查询与游标分页
         UniqueConstraint('stock_code', 'trade_date', name='uix_stock_trade_date'),
         {'extend_existing': True}
-    )
\ No newline at end of file
+    )
+
+class DailyWatermark(Base):
+    """每只股票已入库日线的最新交易日，用于增量更新"""
+    __tablename__ = "daily_watermark"
+
+    stock_code = Column(String(10), ForeignKey('stock_basic.ts_code'), primary_key=True)
+    last_trade_date = Column(String(8), nullable=False)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+
+class TradeCalendar(Base):
+    """本地缓存的交易所交易日历"""
+    __tablename__ = "trade_calendar"
+
+    exchange = Column(String(8), primary_key=True)
+    cal_date = Column(String(8), primary_key=True)
+    is_open = Column(Integer, nullable=False)
+
+
+class PeriodBarMixin:
+    """周线/月线共用字段，period 为周期起始的自然日（周一或每月1日）"""
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    stock_code = Column(String(10), ForeignKey('stock_basic.ts_code'), nullable=False)
+    period = Column(String(8), nullable=False)
+    # 周期内首个与最后一个交易日
+    period_start = Column(String(8), nullable=False)
+    trade_date = Column(String(8), nullable=False)
+    open = Column(Float)
+    high = Column(Float)
+    low = Column(Float)
+    close = Column(Float)
+    volume = Column(Float)
+    amount = Column(Float)
+    bar_count = Column(Integer)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+
+class WeeklyData(PeriodBarMixin, Base):
+    __tablename__ = "weekly_data"
+
+    __table_args__ = (
+        UniqueConstraint('stock_code', 'period', name='uix_weekly_stock_period'),
+        Index('ix_weekly_data_code_date', 'stock_code', 'trade_date'),
+    )
+
+
+class MonthlyData(PeriodBarMixin, Base):
+    __tablename__ = "monthly_data"
+
+    __table_args__ = (
+        UniqueConstraint('stock_code', 'period', name='uix_monthly_stock_period'),
+        Index('ix_monthly_data_code_date', 'stock_code', 'trade_date'),
+    )
+
+
+class JobRun(Base):
+    """定时任务的执行记录"""
+    __tablename__ = "job_runs"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    job_id = Column(String(50), nullable=False)
+    # success / failed / skipped（上一次执行尚未结束）
+    status = Column(String(10), nullable=False)
+    started_at = Column(DateTime, nullable=False)
+    finished_at = Column(DateTime)
+    duration = Column(Float)
+    rows = Column(Integer, default=0)
+    api_calls = Column(Integer, default=0)
+    error = Column(Text)
+
+    __table_args__ = (
+        Index('ix_job_runs_job_started', 'job_id', 'started_at'),
+    )
+
+
+class MarketContext(Base):
+    """每只股票每个交易日预先生成的行情摘要，供 AI 分析作为提示词上下文"""
+    __tablename__ = "market_context"
+
+    stock_code = Column(String(10), ForeignKey('stock_basic.ts_code'), primary_key=True)
+    trade_date = Column(String(8), primary_key=True)
+    summary = Column(Text, nullable=False)
+    # 估算的 token 数
+    tokens = Column(Integer)
+    created_at = Column(DateTime, server_default=func.now())
+
+
+class IntradayBar(Base):
+    """分钟线；由内存环形缓冲按分钟批量写入，成交量单位为股、成交额单位为元（与实时行情一致）"""
+    __tablename__ = "intraday_bars"
+
+    stock_code = Column(String(10), ForeignKey('stock_basic.ts_code'), primary_key=True)
+    trade_time = Column(DateTime, primary_key=True)
+    open = Column(Float)
+    high = Column(Float)
+    low = Column(Float)
+    close = Column(Float)
+    volume = Column(Float)
+    amount = Column(Float)
+
+
+class BackfillJob(Base):
+    """历史日线回补任务；进度计数与各单元的完成状态在同一事务中更新"""
+    __tablename__ = "backfill_jobs"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    start_date = Column(String(8), nullable=False)
+    end_date = Column(String(8), nullable=False)
+    # pending / running / completed / failed（部分单元失败或熔断，可恢复）
+    status = Column(String(10), nullable=False)
+    strategy = Column(String(20))
+    stocks = Column(Integer, default=0)
+    units_total = Column(Integer, default=0)
+    units_done = Column(Integer, default=0)
+    rows_written = Column(Integer, default=0)
+    created_at = Column(DateTime, server_default=func.now())
+    # 本次运行的开始时间及当时已完成的单元数，用于估算速率与剩余时间
+    run_started_at = Column(DateTime)
+    run_units_done = Column(Integer, default=0)
+    updated_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    error = Column(Text)
+
+
+class BackfillUnit(Base):
+    """回补任务的工作单元：一批股票 × 一个日期区间，或按日查询的一个交易日"""
+    __tablename__ = "backfill_units"
+
+    job_id = Column(Integer, ForeignKey('backfill_jobs.id'), primary_key=True)
+    seq = Column(Integer, primary_key=True)
+    codes = Column(Text, nullable=False)
+    start_date = Column(String(8), nullable=False)
+    end_date = Column(String(8), nullable=False)
+    trade_date = Column(String(8))
+    # pending / done / failed
+    status = Column(String(10), nullable=False, default='pending')
+    rows = Column(Integer, default=0)
+    attempts = Column(Integer, default=0)
+    completed_at = Column(DateTime)
+
+    __table_args__ = (
+        Index('ix_backfill_units_job_status', 'job_id', 'status'),
+    )
@@ -1,36 +1,159 @@
 # app/services/ai_service.py
-from openai import OpenAI
+import asyncio
+import hashlib
+import logging
+from contextlib import aclosing
+from typing import AsyncIterator, Dict, List, Optional, Protocol
+
 from fastapi import WebSocket
+from app.core.cache import TTLCache
 from app.core.config import settings
 
-class AIService:
-    def __init__(self):
-        self.client = OpenAI(
-            api_key=settings.ZHIPU_API_KEY,
-            base_url="https://api.lingyiwanwu.com/v1"
+logger = logging.getLogger(__name__)
+
+SYSTEM_PROMPT = "你是一个专业的金融分析师，请对给定的市场数据进行分析。"
+# 生产者结束的标记
+_END = object()
+
+
+class CompletionBackend(Protocol):
+    """流式补全接口，可替换为本地 stub"""
+    model: str
+
+    def stream(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        ...
+
+
+class OpenAIBackend:
+    """OpenAI 兼容接口；AsyncOpenAI 内部的 httpx 连接池在所有会话间复用"""
+
+    def __init__(self, client=None, model: Optional[str] = None,
+                 temperature: Optional[float] = None):
+        if client is None:
+            from openai import AsyncOpenAI
+            client = AsyncOpenAI(
+                api_key=settings.ZHIPU_API_KEY,
+                base_url=settings.AI_BASE_URL,
+                timeout=settings.AI_REQUEST_TIMEOUT
+            )
+        self.client = client
+        self.model = model or settings.AI_MODEL
+        self.temperature = settings.AI_TEMPERATURE if temperature is None else temperature
+
+    async def stream(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        stream = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=self.temperature,
+            stream=True
         )
-    
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content is not None:
+                    yield chunk.choices[0].delta.content
+        finally:
+            # 会话提前结束时关闭上游连接
+            await stream.close()
+
+
+class StubBackend:
+    """本地 stub：不访问网络，按固定片段返回可预期的分析文本"""
+
+    model = "stub"
+
+    def __init__(self, chunk_size: int = 16, delay: float = 0.0):
+        self.chunk_size = chunk_size
+        self.delay = delay
+        self.calls = 0
+
+    async def stream(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        self.calls += 1
+        text = f"【本地分析】{messages[-1]['content']}"
+        for i in range(0, len(text), self.chunk_size):
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            yield text[i:i + self.chunk_size]
+
+
+def create_backend() -> CompletionBackend:
+    if settings.AI_BACKEND == "stub":
+        return StubBackend()
+    if settings.AI_BACKEND == "openai":
+        return OpenAIBackend()
+    raise ValueError(f"Unknown AI backend '{settings.AI_BACKEND}'")
+
+
+class AIService:
+    """流式市场分析
+
+    模型调用全部为异步，不阻塞事件循环；同时进行的模型流数受信号量限制。
+    每个 websocket 会话由一个生产者任务读取模型输出，写入有界队列，
+    发送端较慢时队列写满，生产者暂停读取上游，形成逐会话的背压。
+    完成的分析按 模型 + 输入数据 的哈希缓存，重复请求直接回放。
+    """
+
+    def __init__(self, backend: Optional[CompletionBackend] = None,
+                 max_concurrent_streams: Optional[int] = None,
+                 queue_size: Optional[int] = None):
+        self.backend = backend or create_backend()
+        self.queue_size = queue_size or settings.AI_SESSION_QUEUE_SIZE
+        self._streams = asyncio.Semaphore(max_concurrent_streams or settings.AI_MAX_CONCURRENT_STREAMS)
+        self.cache = TTLCache(maxsize=settings.AI_ANALYSIS_CACHE_SIZE,
+                              ttl=settings.AI_ANALYSIS_CACHE_TTL)
+
+    def _messages(self, market_data: str) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": f"请分析以下股票数据：{market_data}"},
+        ]
+
+    def cache_key(self, market_data: str) -> str:
+        payload = "\x1f".join([self.backend.model, SYSTEM_PROMPT, market_data])
+        return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+    async def analyze(self, market_data: str) -> AsyncIterator[str]:
+        """逐段产出分析文本；命中缓存时不调用模型"""
+        key = self.cache_key(market_data)
+        cached = self.cache.get(key)
+        if cached is not None:
+            logger.info(f"Replaying cached analysis {key}")
+            for chunk in cached:
+                yield chunk
+            return
+
+        chunks: List[str] = []
+        async with self._streams, aclosing(self.backend.stream(self._messages(market_data))) as stream:
+            async for chunk in stream:
+                chunks.append(chunk)
+                yield chunk
+        # 只缓存完整结束的分析
+        self.cache.set(key, chunks)
+
     async def analyze_market_stream(self, market_data: str, websocket: WebSocket):
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+
+        async def produce():
+            try:
+                # 显式关闭生成器，取消时立即释放模型流与信号量
+                async with aclosing(self.analyze(market_data)) as chunks:
+                    async for chunk in chunks:
+                        await queue.put(chunk)
+                await queue.put(_END)
+            except Exception as e:
+                await queue.put(e)
+
+        producer = asyncio.create_task(produce())
         try:
-            stream = self.client.chat.completions.create(
-                model="yi-large",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "你是一个专业的金融分析师，请对给定的市场数据进行分析。"
-                    },
-                    {
-                        "role": "user",
-                        "content": f"请分析以下股票数据：{market_data}"
-                    }
-                ],
-                temperature=0.3,
-                stream=True
-            )
-            
-            for chunk in stream:
-                if chunk.choices[0].delta.content is not None:
-                    await websocket.send_text(chunk.choices[0].delta.content)
-                    
-        except Exception as e:
-            await websocket.send_json({"status": "error", "message": str(e)})
\ No newline at end of file
+            while True:
+                item = await queue.get()
+                if item is _END:
+                    break
+                if isinstance(item, Exception):
+                    logger.error(f"AI analysis failed: {str(item)}")
+                    await websocket.send_json({"status": "error", "message": str(item)})
+                    break
+                await websocket.send_text(item)
+        finally:
+            # 客户端断开或发送失败时停止读取上游
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
@@ -0,0 +1,252 @@
+# app/services/backfill.py
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import Session
+
+from app.core.database import session_scope
+from app.core.metrics import DB_COMMIT_SECONDS
+from app.models.stock import BackfillJob, BackfillUnit, Stock
+from app.services.ingest_pipeline import FetchUnit
+from app.services.stock_service import StockService
+from app.services.watermark import WatermarkTracker
+
+logger = logging.getLogger(__name__)
+
+JOB_PENDING = 'pending'
+JOB_RUNNING = 'running'
+JOB_COMPLETED = 'completed'
+JOB_FAILED = 'failed'
+
+UNIT_PENDING = 'pending'
+UNIT_DONE = 'done'
+UNIT_FAILED = 'failed'
+
+
+def unit_from_row(row: BackfillUnit) -> FetchUnit:
+    return FetchUnit(tuple(row.codes.split(',')), row.start_date, row.end_date, row.trade_date)
+
+
+class BackfillService:
+    """可断点续传的历史日线回补
+
+    创建任务时把拉取计划的全部单元写入 backfill_units；每个单元的日线数据、完成标记
+    与任务进度计数在同一事务中提交，因此进程中断后恢复运行只会拉取未完成的单元，
+    已提交的单元不会丢失也不会重做。失败或因熔断未执行的单元保持未完成，可再次恢复。
+    """
+
+    def __init__(self, stock_service: Optional[StockService] = None,
+                 session_factory: Optional[async_sessionmaker] = None):
+        self._stock_service = stock_service
+        self.session_factory = session_factory or (stock_service.session_factory if stock_service else None)
+        # 本进程中正在运行的任务
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    @property
+    def stock_service(self) -> StockService:
+        if self._stock_service is None:
+            self._stock_service = StockService(self.session_factory)
+        return self._stock_service
+
+    def is_active(self, job_id: int) -> bool:
+        task = self._tasks.get(job_id)
+        return task is not None and not task.done()
+
+    async def create_job(self, start_date: str, end_date: Optional[str] = None,
+                         codes: Optional[List[str]] = None) -> Dict:
+        """生成拉取计划并连同全部单元一起保存，返回任务进度"""
+        end_date = end_date or datetime.now().strftime('%Y%m%d')
+        if start_date > end_date:
+            raise ValueError("start_date must not be later than end_date")
+        if codes is None:
+            async with session_scope(self.session_factory) as db:
+                codes = list((await db.execute(select(Stock.ts_code).order_by(Stock.ts_code))).scalars().all())
+        if not codes:
+            raise ValueError("No stocks to backfill")
+
+        plan = await self.stock_service.plan_range(codes, start_date, end_date)
+        async with session_scope(self.session_factory) as db:
+            job = BackfillJob(start_date=start_date, end_date=end_date, status=JOB_PENDING,
+                              strategy=plan.strategy, stocks=len(codes), units_total=len(plan.units),
+                              units_done=0, rows_written=0, run_units_done=0)
+            db.add(job)
+            await db.flush()
+            if plan.units:
+                await db.execute(insert(BackfillUnit), [{
+                    'job_id': job.id,
+                    'seq': seq,
+                    'codes': ','.join(unit.codes),
+                    'start_date': unit.start_date,
+                    'end_date': unit.end_date,
+                    'trade_date': unit.trade_date,
+                    'status': UNIT_PENDING,
+                    'rows': 0,
+                    'attempts': 0,
+                } for seq, unit in enumerate(plan.units)])
+            with DB_COMMIT_SECONDS.time(operation='backfill'):
+                await db.commit()
+        logger.info(f"Created backfill job {job.id}: {start_date}-{end_date}, {plan.summary()}")
+        return await self.progress(job.id)
+
+    def start(self, job_id: int) -> asyncio.Task:
+        """在后台运行（或恢复）任务"""
+        if self.is_active(job_id):
+            raise ValueError(f"Backfill job {job_id} is already running")
+        task = asyncio.create_task(self.run(job_id))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+        return task
+
+    async def run(self, job_id: int) -> Dict:
+        """运行任务中所有未完成的单元；重复调用即从中断处继续"""
+        now = datetime.now()
+        async with session_scope(self.session_factory) as db:
+            job = await db.get(BackfillJob, job_id)
+            if job is None:
+                raise KeyError(job_id)
+            rows = (await db.execute(
+                select(BackfillUnit)
+                .where(BackfillUnit.job_id == job_id, BackfillUnit.status != UNIT_DONE)
+                .order_by(BackfillUnit.seq)
+            )).scalars().all()
+            job.status = JOB_RUNNING
+            job.run_started_at = job.updated_at = now
+            job.run_units_done = job.units_done
+            job.finished_at = job.error = None
+            with DB_COMMIT_SECONDS.time(operation='backfill'):
+                await db.commit()
+
+        seqs = {unit_from_row(row): row.seq for row in rows}
+        logger.info(f"Running backfill job {job_id}: {len(seqs)} units remaining")
+
+        # 水位不越过本次仍未完成的单元
+        tracker = WatermarkTracker(seqs)
+
+        async def write(unit: FetchUnit, df) -> int:
+            seq = seqs[unit]
+            return await self.stock_service._process_stock_batch(
+                unit, df, checkpoint=lambda db, written: self._mark_done(db, job_id, seq, written),
+                tracker=tracker)
+
+        # 被取消（如服务关闭）时记为失败，已提交的单元保持完成
+        status, error, failed = JOB_FAILED, 'Interrupted', []
+        try:
+            if seqs:
+                await self.stock_service._reserve_columnar_dates(list(seqs))
+                result = await self.stock_service._build_pipeline(write).run(list(seqs))
+                failed = result.failed_units
+            status, error = JOB_COMPLETED, None
+            if failed:
+                status = JOB_FAILED
+                error = (f"{len(failed)} units failed"
+                         + (" (circuit open, remaining units not attempted)" if result.circuit_open else ''))
+        except Exception as e:
+            logger.error(f"Backfill job {job_id} failed: {str(e)}")
+            status, error = JOB_FAILED, str(e)[:2000]
+            raise
+        finally:
+            await self._finish(job_id, status, error, [seqs[unit] for unit in failed])
+
+        await self.stock_service._refresh_derived(tracker.earliest_written)
+        return await self.progress(job_id)
+
+    def _mark_done(self, db: Session, job_id: int, seq: int, rows: int) -> None:
+        """在写入日线的同一事务中记录单元完成与任务进度"""
+        now = datetime.now()
+        db.execute(update(BackfillUnit)
+                   .where(BackfillUnit.job_id == job_id, BackfillUnit.seq == seq)
+                   .values(status=UNIT_DONE, rows=rows, attempts=BackfillUnit.attempts + 1,
+                           completed_at=now))
+        db.execute(update(BackfillJob)
+                   .where(BackfillJob.id == job_id)
+                   .values(units_done=BackfillJob.units_done + 1,
+                           rows_written=BackfillJob.rows_written + rows,
+                           updated_at=now))
+
+    async def _finish(self, job_id: int, status: str, error: Optional[str], failed_seqs: List[int]) -> None:
+        now = datetime.now()
+        async with session_scope(self.session_factory) as db:
+            if failed_seqs:
+                await db.execute(update(BackfillUnit)
+                                 .where(BackfillUnit.job_id == job_id, BackfillUnit.seq.in_(failed_seqs))
+                                 .values(status=UNIT_FAILED, attempts=BackfillUnit.attempts + 1))
+            await db.execute(update(BackfillJob)
+                             .where(BackfillJob.id == job_id)
+                             .values(status=status, error=error, updated_at=now, finished_at=now))
+            with DB_COMMIT_SECONDS.time(operation='backfill'):
+                await db.commit()
+        logger.info(f"Backfill job {job_id} {status}" + (f": {error}" if error else ''))
+
+    async def progress(self, job_id: int) -> Optional[Dict]:
+        async with session_scope(self.session_factory) as db:
+            job = await db.get(BackfillJob, job_id)
+            if job is None:
+                return None
+            failed = await self._failed_counts(db, [job_id])
+        return self._describe(job, failed.get(job_id, 0))
+
+    async def list_jobs(self, limit: int = 20) -> List[Dict]:
+        async with session_scope(self.session_factory) as db:
+            jobs = (await db.execute(
+                select(BackfillJob).order_by(BackfillJob.id.desc()).limit(limit)
+            )).scalars().all()
+            failed = await self._failed_counts(db, [job.id for job in jobs])
+        return [self._describe(job, failed.get(job.id, 0)) for job in jobs]
+
+    @staticmethod
+    async def _failed_counts(db, job_ids: List[int]) -> Dict[int, int]:
+        if not job_ids:
+            return {}
+        rows = await db.execute(
+            select(BackfillUnit.job_id, func.count())
+            .where(BackfillUnit.job_id.in_(job_ids), BackfillUnit.status == UNIT_FAILED)
+            .group_by(BackfillUnit.job_id)
+        )
+        return dict(rows.all())
+
+    def _describe(self, job: BackfillJob, units_failed: int) -> Dict:
+        """任务进度；运行中的任务按本次运行的平均速率估算剩余时间"""
+        units_per_minute, eta_seconds = None, None
+        if job.status == JOB_RUNNING and job.run_started_at is not None:
+            elapsed = (datetime.now() - job.run_started_at).total_seconds()
+            done_this_run = job.units_done - (job.run_units_done or 0)
+            if elapsed > 0 and done_this_run > 0:
+                rate = done_this_run / elapsed
+                units_per_minute = round(rate * 60, 2)
+                eta_seconds = round((job.units_total - job.units_done) / rate, 1)
+        return {
+            'id': job.id,
+            'status': job.status,
+            # 状态为 running 但不在本进程中运行，说明进程已中断，可以恢复
+            'active': self.is_active(job.id),
+            'start_date': job.start_date,
+            'end_date': job.end_date,
+            'strategy': job.strategy,
+            'stocks': job.stocks,
+            'units_total': job.units_total,
+            'units_done': job.units_done,
+            'units_failed': units_failed,
+            'rows_written': job.rows_written,
+            'percent': round(100 * job.units_done / job.units_total, 2) if job.units_total else 100.0,
+            'units_per_minute': units_per_minute,
+            'eta_seconds': eta_seconds,
+            'created_at': job.created_at.isoformat() if job.created_at else None,
+            'run_started_at': job.run_started_at.isoformat() if job.run_started_at else None,
+            'updated_at': job.updated_at.isoformat() if job.updated_at else None,
+            'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+            'error': job.error,
+        }
+
+
+_service: Optional[BackfillService] = None
+
+
+def get_backfill_service() -> BackfillService:
+    global _service
+    if _service is None:
+        _service = BackfillService()
+    return _service
@@ -0,0 +1,254 @@
+# app/services/backtester.py
+import itertools
+import logging
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from app.services.columnar_store import ColumnarStore, get_columnar_store
+
+logger = logging.getLogger(__name__)
+
+TRADING_DAYS_PER_YEAR = 252
+# 共享面板文件优先放在内存文件系统中
+SHARED_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None
+# 每个进程均线缓存的内存上限（全市场 10 年单条约 100MB），至少保留 2 条（快线与慢线）
+SMA_CACHE_BYTES = 256 * 1024 * 1024
+# 由主进程计算一次、以内存映射共享给工作进程的数组
+SHARED_ARRAYS = ('close', 'returns', 'cumsum', 'count')
+
+
+class PriceContext:
+    """回测面板（股票 × 日期 收盘价）及按需计算的中间量
+
+    面板已按时间向前填充停牌日，上市前为 NaN。收益率与 sma 所用的累加和、计数可以预先传入
+    （进程池中为主进程计算好的只读内存映射），否则首次使用时计算。均线本身按参数变化，
+    在每个进程内单独缓存，总量受 SMA_CACHE_BYTES 限制。
+    """
+
+    def __init__(self, close: np.ndarray, returns: Optional[np.ndarray] = None,
+                 cumsum: Optional[np.ndarray] = None, count: Optional[np.ndarray] = None):
+        self.close = close
+        self._returns = returns
+        self._cumsum = cumsum
+        self._count = count
+        self._sma: "OrderedDict[int, np.ndarray]" = OrderedDict()
+        self._sma_limit = max(2, SMA_CACHE_BYTES // max(close.nbytes, 1))
+
+    @property
+    def returns(self) -> np.ndarray:
+        """日收益率，首日与上市前为 0"""
+        if self._returns is None:
+            returns = np.zeros_like(self.close)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                returns[:, 1:] = self.close[:, 1:] / self.close[:, :-1] - 1.0
+            self._returns = np.nan_to_num(returns, nan=0.0, posinf=0.0, neginf=0.0)
+        return self._returns
+
+    @property
+    def cumsum(self) -> np.ndarray:
+        """按日累加的收盘价（缺失记 0），首列为 0"""
+        if self._cumsum is None:
+            valid = ~np.isnan(self.close)
+            self._cumsum = np.concatenate(
+                [np.zeros((len(self.close), 1)), np.cumsum(np.where(valid, self.close, 0.0), axis=1)], axis=1)
+        return self._cumsum
+
+    @property
+    def count(self) -> np.ndarray:
+        """按日累计的有效价格数，首列为 0"""
+        if self._count is None:
+            valid = ~np.isnan(self.close)
+            self._count = np.concatenate(
+                [np.zeros((len(self.close), 1), dtype=np.int32),
+                 np.cumsum(valid, axis=1, dtype=np.int32)], axis=1)
+        return self._count
+
+    def sma(self, window: int) -> np.ndarray:
+        """简单移动平均，窗口内数据不足时为 NaN"""
+        if window in self._sma:
+            self._sma.move_to_end(window)
+        else:
+            total = self.cumsum[:, window:] - self.cumsum[:, :-window]
+            count = self.count[:, window:] - self.count[:, :-window]
+            sma = np.full_like(self.close, np.nan)
+            sma[:, window - 1:] = np.where(count == window, total / window, np.nan)
+            self._sma[window] = sma
+            if len(self._sma) > self._sma_limit:
+                self._sma.popitem(last=False)
+        return self._sma[window]
+
+
+def ma_crossover(ctx: PriceContext, fast: int, slow: int) -> np.ndarray:
+    """均线金叉持有：快线在慢线之上时持仓"""
+    if fast >= slow:
+        return np.zeros(ctx.close.shape, dtype=bool)
+    return ctx.sma(fast) > ctx.sma(slow)
+
+
+SignalFunction = Callable[..., np.ndarray]
+
+
+@dataclass
+class BacktestResult:
+    """单组参数的回测结果"""
+    params: Dict
+    equity: np.ndarray
+    stats: Dict[str, float] = field(default_factory=dict)
+
+
+def evaluate(ctx: PriceContext, positions: np.ndarray, cost_bps: float = 0.0) -> tuple:
+    """按信号计算等权组合的净值曲线与统计
+
+    t 日收盘产生的信号在 t+1 日持有；当日持仓股票等权，换手按 cost_bps 扣除成本。
+    """
+    weights = np.zeros(positions.shape, dtype=np.float64)
+    weights[:, 1:] = positions[:, :-1]
+    n_held = weights.sum(axis=0)
+    weights /= np.maximum(n_held, 1.0)
+    gross = np.einsum('ij,ij->j', weights, ctx.returns)
+    # 换手：相邻两日权重差的绝对值之和，原地计算避免额外的整面板临时数组
+    turnover = np.empty(len(n_held))
+    turnover[0] = 0.0
+    delta = np.subtract(weights[:, 1:], weights[:, :-1])
+    turnover[1:] = np.abs(delta, out=delta).sum(axis=0)
+    daily = gross - turnover * cost_bps / 10000.0
+    equity = np.cumprod(1.0 + daily)
+    return equity, summary_stats(equity, daily, turnover, n_held)
+
+
+def summary_stats(equity: np.ndarray, daily: np.ndarray, turnover: np.ndarray,
+                  n_held: np.ndarray) -> Dict[str, float]:
+    periods = len(equity)
+    if not periods:
+        return {}
+    std = daily.std()
+    drawdown = equity / np.maximum.accumulate(equity) - 1.0
+    return {
+        'total_return': float(equity[-1] - 1.0),
+        'annual_return': float(equity[-1] ** (TRADING_DAYS_PER_YEAR / periods) - 1.0)
+        if equity[-1] > 0 else -1.0,
+        'annual_volatility': float(std * np.sqrt(TRADING_DAYS_PER_YEAR)),
+        'sharpe': float(daily.mean() / std * np.sqrt(TRADING_DAYS_PER_YEAR)) if std > 0 else 0.0,
+        'max_drawdown': float(drawdown.min()),
+        'avg_turnover': float(turnover.mean()),
+        'avg_positions': float(n_held.mean()),
+    }
+
+
+# ---- 进程池 ----
+
+_worker_ctx: Optional[PriceContext] = None
+_worker_signal: Optional[SignalFunction] = None
+_worker_cost_bps: float = 0.0
+
+
+def _init_worker(paths: Dict[str, str], signal: SignalFunction, cost_bps: float) -> None:
+    """工作进程以只读内存映射打开共享的面板与中间量，不复制数据"""
+    global _worker_ctx, _worker_signal, _worker_cost_bps
+    _worker_ctx = PriceContext(**{name: np.load(path, mmap_mode='r') for name, path in paths.items()})
+    _worker_signal = signal
+    _worker_cost_bps = cost_bps
+
+
+def _run_one(params: Dict) -> BacktestResult:
+    positions = _worker_signal(_worker_ctx, **params)
+    equity, stats = evaluate(_worker_ctx, positions, _worker_cost_bps)
+    return BacktestResult(params=params, equity=equity, stats=stats)
+
+
+def expand_grid(grid: Union[Mapping[str, Sequence], Iterable[Dict]]) -> List[Dict]:
+    """{'fast': [5, 10], 'slow': [20]} -> [{'fast': 5, 'slow': 20}, {'fast': 10, 'slow': 20}]"""
+    if isinstance(grid, Mapping):
+        keys = list(grid)
+        return [dict(zip(keys, values)) for values in itertools.product(*grid.values())]
+    return [dict(params) for params in grid]
+
+
+class Backtester:
+    """基于列式存储收盘价面板的向量化回测
+
+    每组参数对全部股票一次性计算持仓与收益；参数扫描分发到进程池。收盘价面板、
+    收益率及均线所用的累加和由主进程计算一次，写入内存文件系统中的 .npy 文件，
+    各进程以内存映射共享同一份物理内存；只有各组参数的均线在进程内单独计算与缓存。
+    """
+
+    def __init__(self, store: Optional[ColumnarStore] = None, cost_bps: float = 0.0):
+        self._store = store
+        self.cost_bps = cost_bps
+
+    @property
+    def store(self) -> ColumnarStore:
+        if self._store is None:
+            self._store = get_columnar_store()
+        return self._store
+
+    def load_panel(self, codes: Optional[Sequence[str]] = None,
+                   start_date: Optional[str] = None,
+                   end_date: Optional[str] = None) -> tuple:
+        """读取收盘价面板并向前填充停牌日，返回 (close, codes, dates)"""
+        self.store.refresh()
+        panel = self.store.panel('close', codes, start_date, end_date)
+        close = pd.DataFrame(np.asarray(panel.values).T).ffill().to_numpy().T
+        return np.ascontiguousarray(close), panel.codes, panel.dates
+
+    def run(self, signal: SignalFunction,
+            grid: Union[Mapping[str, Sequence], Iterable[Dict]],
+            codes: Optional[Sequence[str]] = None,
+            start_date: Optional[str] = None,
+            end_date: Optional[str] = None,
+            workers: Optional[int] = None) -> List[BacktestResult]:
+        """按参数网格运行回测，结果顺序与网格一致
+
+        signal(ctx, **params) 返回 股票 × 日期 的持仓矩阵（布尔或 0/1），
+        需为模块级函数以便进程池按引用传递。workers=1 时在当前进程内执行。
+        """
+        param_list = expand_grid(grid)
+        close, _, dates = self.load_panel(codes, start_date, end_date)
+        workers = workers or os.cpu_count() or 1
+        started = time.perf_counter()
+        if workers <= 1 or len(param_list) <= 1:
+            ctx = PriceContext(close)
+            results = []
+            for params in param_list:
+                equity, stats = evaluate(ctx, signal(ctx, **params), self.cost_bps)
+                results.append(BacktestResult(params=params, equity=equity, stats=stats))
+        else:
+            results = self._run_pool(signal, param_list, close, workers)
+        logger.info(f"Backtest finished: {len(param_list)} runs over {close.shape[0]} stocks x "
+                    f"{len(dates)} days in {time.perf_counter() - started:.1f}s")
+        return results
+
+    def _run_pool(self, signal: SignalFunction, param_list: List[Dict],
+                  close: np.ndarray, workers: int) -> List[BacktestResult]:
+        paths: Dict[str, str] = {}
+        try:
+            ctx = PriceContext(close)
+            for name in SHARED_ARRAYS:
+                fd, paths[name] = tempfile.mkstemp(suffix='.npy', prefix=f'backtest_{name}_', dir=SHARED_DIR)
+                os.close(fd)
+                # 逐个写出后释放主进程中的副本
+                np.save(paths[name], getattr(ctx, name))
+                if name != 'close':
+                    setattr(ctx, f'_{name}', None)
+            del ctx
+            # 同一进程内的参数共享均线缓存，按块分发减少调度开销
+            chunksize = max(1, len(param_list) // (workers * 4))
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(paths, signal, self.cost_bps)) as pool:
+                return list(pool.map(_run_one, param_list, chunksize=chunksize))
+        finally:
+            for path in paths.values():
+                os.remove(path)
+
+    @staticmethod
+    def summary_frame(results: Sequence[BacktestResult]) -> pd.DataFrame:
+        """每组参数一行：参数列 + 统计列"""
+        return pd.DataFrame([{**result.params, **result.stats} for result in results])
@@ -0,0 +1,159 @@
+# app/services/bulk_upsert.py
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import List, Dict, Any
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import DB_COMMIT_SECONDS
+from app.models.stock import DailyData
+
+logger = logging.getLogger(__name__)
+
+# tushare 字段 -> DailyData 字段
+DAILY_COLUMN_MAP = {
+    'ts_code': 'stock_code',
+    'trade_date': 'trade_date',
+    'open': 'open',
+    'high': 'high',
+    'low': 'low',
+    'close': 'close',
+    'vol': 'volume',
+    'amount': 'amount',
+}
+DAILY_VALUE_COLUMNS = ['open', 'high', 'low', 'close', 'volume', 'amount']
+
+
+@dataclass
+class ChunkStats:
+    """单个分块的写入统计"""
+    rows: int
+    inserted: int
+    updated: int
+    elapsed: float
+
+
+@dataclass
+class UpsertStats:
+    """一次批量写入的汇总统计"""
+    chunks: List[ChunkStats] = field(default_factory=list)
+
+    @property
+    def inserted(self) -> int:
+        return sum(c.inserted for c in self.chunks)
+
+    @property
+    def updated(self) -> int:
+        return sum(c.updated for c in self.chunks)
+
+    @property
+    def rows(self) -> int:
+        return sum(c.rows for c in self.chunks)
+
+    @property
+    def elapsed(self) -> float:
+        return sum(c.elapsed for c in self.chunks)
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.elapsed if self.elapsed > 0 else 0.0
+
+
+def dialect_insert(db: Session):
+    """根据数据库方言选择支持 ON CONFLICT 的 insert"""
+    dialect = db.get_bind().dialect.name
+    if dialect == 'sqlite':
+        return sqlite.insert
+    if dialect == 'postgresql':
+        return postgresql.insert
+    raise NotImplementedError(f"Bulk upsert is not supported for dialect '{dialect}'")
+
+
+def frame_to_columns(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """将 tushare 日线 DataFrame 转换为按列组织的数组"""
+    missing = [col for col in DAILY_COLUMN_MAP if col not in df.columns]
+    if missing:
+        raise ValueError(f"Daily frame is missing columns: {missing}")
+
+    columns = {}
+    for src, dst in DAILY_COLUMN_MAP.items():
+        if dst in DAILY_VALUE_COLUMNS:
+            values = df[src].to_numpy(dtype=np.float64, na_value=np.nan)
+            # NaN 写入数据库时转为 NULL
+            columns[dst] = np.where(np.isnan(values), None, values).astype(object)
+        else:
+            columns[dst] = df[src].astype(str).to_numpy(dtype=object)
+    return columns
+
+
+class DailyDataUpserter:
+    """基于 INSERT ... ON CONFLICT 的日线批量写入"""
+
+    def __init__(self, chunk_size: int = None):
+        self.chunk_size = chunk_size or settings.UPSERT_CHUNK_SIZE
+
+    def upsert(self, db: Session, df: pd.DataFrame, commit: bool = True) -> UpsertStats:
+        """按 (stock_code, trade_date) 分块写入日线数据，已存在的行执行更新"""
+        stats = UpsertStats()
+        if df is None or df.empty:
+            return stats
+
+        # 同一批数据中重复的键只保留最后一条，避免同一语句内冲突
+        df = df.drop_duplicates(subset=['ts_code', 'trade_date'], keep='last')
+        columns = frame_to_columns(df)
+        names = list(columns)
+        total = len(df)
+
+        insert = dialect_insert(db)
+        table = DailyData.__table__
+
+        try:
+            for start in range(0, total, self.chunk_size):
+                began = time.perf_counter()
+                stop = min(start + self.chunk_size, total)
+                rows = [
+                    dict(zip(names, values))
+                    for values in zip(*(columns[name][start:stop] for name in names))
+                ]
+
+                # 新插入的行 id 一定大于写入前的最大 id，借此区分插入与更新
+                max_id = db.execute(select(func.coalesce(func.max(table.c.id), 0))).scalar()
+
+                stmt = insert(table)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=['stock_code', 'trade_date'],
+                    set_={
+                        **{col: stmt.excluded[col] for col in DAILY_VALUE_COLUMNS},
+                        'updated_at': func.now(),
+                    },
+                ).returning(table.c.id)
+
+                ids = db.execute(stmt, rows).scalars().all()
+                inserted = sum(1 for row_id in ids if row_id > max_id)
+                chunk = ChunkStats(
+                    rows=len(rows),
+                    inserted=inserted,
+                    updated=len(ids) - inserted,
+                    elapsed=time.perf_counter() - began,
+                )
+                stats.chunks.append(chunk)
+                logger.debug(f"Upserted chunk {start // self.chunk_size + 1}: "
+                             f"rows={chunk.rows}, inserted={chunk.inserted}, "
+                             f"updated={chunk.updated}, elapsed={chunk.elapsed:.3f}s")
+
+            if commit:
+                with DB_COMMIT_SECONDS.time(operation='daily_data'):
+                    db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+        logger.info(f"Bulk upsert finished: rows={stats.rows}, inserted={stats.inserted}, "
+                    f"updated={stats.updated}, {stats.rows_per_second:.0f} rows/s")
+        return stats
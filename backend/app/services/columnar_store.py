@@ -0,0 +1,304 @@
+# app/services/columnar_store.py
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.stock import DailyData
+from app.services.bulk_upsert import DAILY_COLUMN_MAP, DAILY_VALUE_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+META_FILE = 'meta.json'
+MIN_DATE_CAPACITY = 256
+MIN_CODE_CAPACITY = 1024
+
+
+@dataclass
+class Panel:
+    """股票 × 日期 的二维数据切片"""
+    values: np.ndarray
+    codes: List[str]
+    dates: List[str]
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(self.values, index=self.codes, columns=self.dates)
+
+
+class ColumnarStore:
+    """与 daily_data 表并行维护的列式 OHLCV 存储
+
+    每个字段一个 .npy 文件，布局为 股票 × 日期（float64，缺失为 NaN），
+    以内存映射方式打开。股票按首次出现顺序追加，日期保持升序；
+    文件按容量预分配，追加新交易日通常只需更新元数据。插入历史日期需要重排全部字段文件，
+    回补前用 reserve_dates 一次性预留整个区间。
+    """
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = Path(root or settings.COLUMNAR_STORE_DIR)
+        self._lock = threading.RLock()
+        self._load()
+
+    # ---- 元数据与文件 ----
+
+    def _path(self, name: str) -> Path:
+        return self.root / f"{name}.npy"
+
+    def _load(self) -> None:
+        meta_path = self.root / META_FILE
+        if meta_path.exists():
+            meta = json.loads(meta_path.read_text(encoding='utf-8'))
+        else:
+            meta = {'version': 0, 'codes': [], 'dates': [], 'fields': [],
+                    'code_capacity': 0, 'date_capacity': 0}
+        self._meta_mtime = meta_path.stat().st_mtime_ns if meta_path.exists() else None
+        self.version: int = meta['version']
+        self._codes: List[str] = meta['codes']
+        self._dates: List[str] = meta['dates']
+        self.fields: List[str] = meta['fields']
+        self.code_capacity: int = meta['code_capacity']
+        self.date_capacity: int = meta['date_capacity']
+        self._code_index = pd.Index(self._codes)
+        self._date_index = pd.Index(self._dates)
+        self._arrays: Dict[str, np.memmap] = {
+            name: np.load(self._path(name), mmap_mode='r+') for name in self.fields
+        }
+
+    def _save_meta(self) -> None:
+        self.version += 1
+        meta = {
+            'version': self.version,
+            'codes': self._codes,
+            'dates': self._dates,
+            'fields': self.fields,
+            'code_capacity': self.code_capacity,
+            'date_capacity': self.date_capacity,
+        }
+        tmp = self.root / f"{META_FILE}.tmp"
+        tmp.write_text(json.dumps(meta), encoding='utf-8')
+        os.replace(tmp, self.root / META_FILE)
+        self._meta_mtime = (self.root / META_FILE).stat().st_mtime_ns
+
+    def refresh(self) -> bool:
+        """其他进程写入后重新加载元数据，返回是否有变化"""
+        meta_path = self.root / META_FILE
+        if not meta_path.exists():
+            return False
+        with self._lock:
+            if meta_path.stat().st_mtime_ns == self._meta_mtime:
+                return False
+            self._load()
+            return True
+
+    def _allocate(self, name: str, code_capacity: int, date_capacity: int) -> np.memmap:
+        tmp = self.root / f"{name}.npy.tmp"
+        array = np.lib.format.open_memmap(tmp, mode='w+', dtype=np.float64,
+                                          shape=(code_capacity, date_capacity))
+        array[:] = np.nan
+        return array
+
+    def _relayout(self, codes: List[str], dates: List[str], fields: List[str]) -> None:
+        """扩容或插入历史日期时重建文件，旧数据按新坐标复制"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        code_capacity = max(self.code_capacity, MIN_CODE_CAPACITY)
+        while code_capacity < len(codes):
+            code_capacity *= 2
+        date_capacity = max(self.date_capacity, MIN_DATE_CAPACITY)
+        while date_capacity < len(dates):
+            date_capacity *= 2
+
+        # 股票只会追加，行号不变；日期可能插入，需按新位置映射
+        date_positions = pd.Index(dates).get_indexer(self._dates)
+        n_codes = len(self._codes)
+        for name in fields:
+            array = self._allocate(name, code_capacity, date_capacity)
+            old = self._arrays.get(name)
+            if old is not None and n_codes and len(self._dates):
+                array[:n_codes, date_positions] = old[:n_codes, :len(self._dates)]
+            array.flush()
+            del array, old
+
+        # 先释放旧的映射再替换文件（Windows 下无法替换仍被映射的文件）
+        self._arrays = {}
+        for name in fields:
+            os.replace(self.root / f"{name}.npy.tmp", self._path(name))
+
+        self._codes = list(codes)
+        self._dates = list(dates)
+        self.fields = list(fields)
+        self.code_capacity = code_capacity
+        self.date_capacity = date_capacity
+        self._code_index = pd.Index(self._codes)
+        self._date_index = pd.Index(self._dates)
+        self._arrays = {name: np.load(self._path(name), mmap_mode='r+') for name in self.fields}
+        logger.info(f"Columnar store relayout: {len(codes)} codes x {len(dates)} dates "
+                    f"(capacity {code_capacity} x {date_capacity})")
+
+    def _ensure_axes(self, codes: Sequence[str], dates: Sequence[str],
+                     fields: Sequence[str]) -> None:
+        new_codes = [c for c in pd.unique(np.asarray(codes, dtype=object))
+                     if c not in self._code_index]
+        new_dates = sorted(set(dates) - set(self._dates))
+        new_fields = [f for f in fields if f not in self.fields]
+        if not (new_codes or new_dates or new_fields):
+            return
+
+        codes = self._codes + new_codes
+        appended_only = not new_dates or not self._dates or new_dates[0] > self._dates[-1]
+        dates = self._dates + new_dates if appended_only else sorted(self._dates + new_dates)
+        if (new_fields or not appended_only or not self.fields
+                or len(codes) > self.code_capacity or len(dates) > self.date_capacity):
+            self._relayout(codes, dates, self.fields + new_fields)
+        else:
+            # 容量足够且只在末尾追加：只更新坐标，预分配区域已是 NaN
+            self._codes = codes
+            self._dates = dates
+            self._code_index = pd.Index(self._codes)
+            self._date_index = pd.Index(self._dates)
+
+    # ---- 写入 ----
+
+    def reserve_dates(self, dates: Sequence[str]) -> int:
+        """预先插入已知的交易日（NaN 列），返回新增的日期数
+
+        存储已有数据时只预留早于最新日期的交易日：之后乱序写入的历史批次都落在已有的列上，
+        只重排一次文件；更晚的日期追加时本就不需要重排，也避免最新日期变成没有数据的空列。
+        """
+        with self._lock:
+            self.refresh()
+            if self._dates:
+                dates = [date for date in dates if date < self._dates[-1]]
+            new_dates = sorted(set(dates) - set(self._dates))
+            if not new_dates:
+                return 0
+            self._ensure_axes([], new_dates, self.fields or DAILY_VALUE_COLUMNS)
+            self._save_meta()
+        logger.info(f"Reserved {len(new_dates)} dates in columnar store "
+                    f"({new_dates[0]}-{new_dates[-1]})")
+        return len(new_dates)
+
+    def write_frame(self, df: pd.DataFrame) -> int:
+        """写入 tushare 日线格式的数据，返回写入行数"""
+        if df is None or df.empty:
+            return 0
+        frame = df[list(DAILY_COLUMN_MAP)].rename(columns=DAILY_COLUMN_MAP)
+        frame = frame.assign(trade_date=frame['trade_date'].astype(str))
+        return self.write_columns(frame, DAILY_VALUE_COLUMNS)
+
+    def write_columns(self, frame: pd.DataFrame, fields: Sequence[str]) -> int:
+        """写入包含 stock_code、trade_date 及指定字段列的长表"""
+        if frame.empty:
+            return 0
+        with self._lock:
+            self.refresh()
+            self._ensure_axes(frame['stock_code'].tolist(), frame['trade_date'].tolist(), fields)
+            rows = self._code_index.get_indexer(frame['stock_code'])
+            cols = self._date_index.get_indexer(frame['trade_date'])
+            for name in fields:
+                self._arrays[name][rows, cols] = frame[name].to_numpy(dtype=np.float64,
+                                                                      na_value=np.nan)
+            for name in fields:
+                self._arrays[name].flush()
+            self._save_meta()
+        return len(frame)
+
+    def write_block(self, blocks: Dict[str, np.ndarray],
+                    codes: Sequence[str], dates: Sequence[str]) -> None:
+        """按 股票 × 日期 二维块写入字段，供派生数据（如技术指标）整块回写"""
+        if not len(codes) or not len(dates):
+            return
+        with self._lock:
+            self.refresh()
+            self._ensure_axes(codes, dates, list(blocks))
+            rows = self._code_index.get_indexer(codes)
+            cols = self._date_index.get_indexer(dates)
+            contiguous = ((np.diff(rows) == 1).all() and (np.diff(cols) == 1).all())
+            for name, values in blocks.items():
+                if contiguous:
+                    self._arrays[name][rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1] = values
+                else:
+                    self._arrays[name][np.ix_(rows, cols)] = values
+                self._arrays[name].flush()
+            self._save_meta()
+
+    def rebuild(self, db: Session, chunk_size: int = 500_000) -> int:
+        """从 daily_data 表全量重建"""
+        query = db.query(
+            DailyData.stock_code, DailyData.trade_date,
+            *[getattr(DailyData, name) for name in DAILY_VALUE_COLUMNS]
+        ).order_by(DailyData.trade_date)
+        total = 0
+        for chunk in pd.read_sql(query.statement, db.get_bind(), chunksize=chunk_size):
+            total += self.write_columns(chunk, DAILY_VALUE_COLUMNS)
+        logger.info(f"Columnar store rebuilt from daily_data: {total} rows")
+        return total
+
+    # ---- 读取 ----
+
+    @property
+    def codes(self) -> List[str]:
+        return list(self._codes)
+
+    @property
+    def dates(self) -> List[str]:
+        return list(self._dates)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._arrays
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        """返回字段的 股票 × 日期 视图（零拷贝），如 store['close'][i, j0:j1]"""
+        if name not in self._arrays:
+            raise KeyError(f"Unknown field '{name}'")
+        return self._arrays[name][:len(self._codes), :len(self._dates)]
+
+    def code_positions(self, codes: Sequence[str]) -> np.ndarray:
+        positions = self._code_index.get_indexer(codes)
+        if (positions < 0).any():
+            missing = [c for c, p in zip(codes, positions) if p < 0]
+            raise KeyError(f"Unknown stock codes: {missing[:5]}")
+        return positions
+
+    def date_slice(self, start: Optional[str] = None, end: Optional[str] = None) -> slice:
+        """日期区间 [start, end] 对应的列切片"""
+        dates = self._dates
+        lo = 0 if start is None else int(np.searchsorted(dates, start, side='left'))
+        hi = len(dates) if end is None else int(np.searchsorted(dates, end, side='right'))
+        return slice(lo, hi)
+
+    def panel(self, name: str,
+              codes: Optional[Sequence[str]] = None,
+              start: Optional[str] = None,
+              end: Optional[str] = None) -> Panel:
+        """读取字段的二维切片
+
+        日期区间与全部股票时返回内存映射上的视图，不复制数据；
+        指定股票列表时只复制这些行。
+        """
+        with self._lock:
+            columns = self.date_slice(start, end)
+            view = self[name][:, columns]
+            dates = self._dates[columns]
+            if codes is None:
+                return Panel(view, list(self._codes), dates)
+            positions = self.code_positions(codes)
+            return Panel(view[positions], list(codes), dates)
+
+
+_store: Optional[ColumnarStore] = None
+
+
+def get_columnar_store() -> ColumnarStore:
+    """进程内共享的列式存储实例"""
+    global _store
+    if _store is None:
+        _store = ColumnarStore()
+    return _store
@@ -0,0 +1,130 @@
+# app/services/daily_query.py
+import logging
+from dataclasses import dataclass
+from typing import AsyncIterator, List, Optional, Sequence, Tuple
+
+import pandas as pd
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.core.database import session_scope
+from app.models.stock import DailyData
+from app.services.bulk_upsert import DAILY_VALUE_COLUMNS
+from app.services.resampler import PERIOD_MODELS
+
+logger = logging.getLogger(__name__)
+
+KEY_COLUMNS = ['stock_code', 'trade_date']
+# 频率代码：D 日线，W 周线，M 月线（周期线的 trade_date 为周期内最后一个交易日）
+BAR_MODELS = {'D': DailyData, **PERIOD_MODELS}
+
+
+@dataclass
+class DailyPage:
+    """一页日线查询结果"""
+    columns: List[str]
+    rows: List[tuple]
+    # 下一页游标 (stock_code, trade_date)，None 表示已到末尾
+    next_key: Optional[Tuple[str, str]]
+
+
+def encode_cursor(key: Optional[Tuple[str, str]]) -> Optional[str]:
+    return f"{key[0]}:{key[1]}" if key else None
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[str, str]]:
+    if not cursor:
+        return None
+    code, sep, trade_date = cursor.rpartition(':')
+    if not sep or not code or len(trade_date) != 8 or not trade_date.isdigit():
+        raise ValueError(f"Invalid cursor '{cursor}'")
+    return code, trade_date
+
+
+def bar_model(freq: str):
+    if freq not in BAR_MODELS:
+        raise ValueError(f"Unknown frequency '{freq}'; available: {list(BAR_MODELS)}")
+    return BAR_MODELS[freq]
+
+
+class DailyQueryService:
+    """按 (stock_code, trade_date) 键集分页读取日线及周期线
+
+    查询按 (stock_code, trade_date) 排序并以上一页最后一行为起点，
+    每页在独立的短会话中执行，可命中覆盖索引，流式输出时不在内存中构建完整结果。
+    """
+
+    def __init__(self, session_factory: Optional[async_sessionmaker] = None):
+        self.session_factory = session_factory
+
+    @staticmethod
+    def resolve_columns(columns: Optional[Sequence[str]]) -> List[str]:
+        """校验列投影，返回值列列表"""
+        if not columns:
+            return list(DAILY_VALUE_COLUMNS)
+        unknown = [c for c in columns if c not in DAILY_VALUE_COLUMNS and c not in KEY_COLUMNS]
+        if unknown:
+            raise ValueError(f"Unknown columns: {unknown}; available: {DAILY_VALUE_COLUMNS}")
+        return [c for c in columns if c in DAILY_VALUE_COLUMNS]
+
+    async def fetch_page(self,
+                         stock_codes: Sequence[str],
+                         start_date: Optional[str] = None,
+                         end_date: Optional[str] = None,
+                         columns: Optional[Sequence[str]] = None,
+                         after: Optional[Tuple[str, str]] = None,
+                         limit: int = 5000,
+                         freq: str = 'D') -> DailyPage:
+        model = bar_model(freq)
+        value_columns = self.resolve_columns(columns)
+        names = KEY_COLUMNS + value_columns
+        query = select(*[getattr(model, name) for name in names])
+        if len(stock_codes) == 1:
+            query = query.where(model.stock_code == stock_codes[0])
+        else:
+            query = query.where(model.stock_code.in_(list(stock_codes)))
+        if start_date:
+            query = query.where(model.trade_date >= start_date)
+        if end_date:
+            query = query.where(model.trade_date <= end_date)
+        if after:
+            query = query.where(tuple_(model.stock_code, model.trade_date) > tuple_(*after))
+        query = query.order_by(model.stock_code, model.trade_date).limit(limit)
+
+        async with session_scope(self.session_factory) as db:
+            rows = [tuple(row) for row in (await db.execute(query)).all()]
+
+        next_key = (rows[-1][0], rows[-1][1]) if len(rows) == limit else None
+        return DailyPage(columns=names, rows=rows, next_key=next_key)
+
+    async def iter_pages(self,
+                         stock_codes: Sequence[str],
+                         start_date: Optional[str] = None,
+                         end_date: Optional[str] = None,
+                         columns: Optional[Sequence[str]] = None,
+                         after: Optional[Tuple[str, str]] = None,
+                         page_size: int = 5000,
+                         freq: str = 'D') -> AsyncIterator[DailyPage]:
+        """逐页读取区间内的全部数据"""
+        while True:
+            page = await self.fetch_page(stock_codes, start_date, end_date, columns,
+                                         after, page_size, freq)
+            if page.rows:
+                yield page
+            if page.next_key is None:
+                return
+            after = page.next_key
+
+    async def load_frame(self,
+                         stock_codes: Sequence[str],
+                         start_date: Optional[str] = None,
+                         end_date: Optional[str] = None,
+                         columns: Optional[Sequence[str]] = None,
+                         freq: str = 'D') -> pd.DataFrame:
+        """读取为 DataFrame，供分析代码按任意频率取数"""
+        frames = [pd.DataFrame(page.rows, columns=page.columns)
+                  async for page in self.iter_pages(stock_codes, start_date, end_date,
+                                                    columns, freq=freq, page_size=50000)]
+        if not frames:
+            return pd.DataFrame(columns=KEY_COLUMNS + self.resolve_columns(columns))
+        return pd.concat(frames, ignore_index=True)
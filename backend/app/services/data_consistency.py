@@ -1,49 +1,188 @@
 # app/services/data_consistency.py
-from datetime import datetime, timedelta
-from typing import List, Optional
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
 from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
 from sqlalchemy.orm import Session
 from app.models import Stock
 from app.models.stock import DailyData
-from app.core.database import get_db
+from app.core.database import session_scope
+from app.services.columnar_store import ColumnarStore
+from app.services.trading_calendar import TradingCalendar
+import numpy as np
 import pandas as pd
 
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class GapReport:
+    """单只股票的缺口报告"""
+    stock_code: str
+    expected_days: int
+    present_days: int
+    # 连续缺失的交易日区间 [(start_date, end_date), ...]
+    gaps: List[Tuple[str, str]] = field(default_factory=list)
+
+    @property
+    def missing_days(self) -> int:
+        return self.expected_days - self.present_days
+
+
+@dataclass
+class IntegrityReport:
+    """全市场完整性检查结果，只包含存在缺口的股票"""
+    start_date: str
+    end_date: str
+    stocks_checked: int
+    trading_days: int
+    reports: Dict[str, GapReport] = field(default_factory=dict)
+
+    @property
+    def complete(self) -> bool:
+        return not self.reports
+
+    def gap_groups(self) -> Dict[Tuple[str, str], List[str]]:
+        """按缺口区间分组：{(start_date, end_date): [stock_code, ...]}，供定向补拉使用"""
+        groups: Dict[Tuple[str, str], List[str]] = {}
+        for code, report in self.reports.items():
+            for gap in report.gaps:
+                groups.setdefault(gap, []).append(code)
+        return groups
+
+    def summary(self) -> Dict:
+        return {
+            'start_date': self.start_date,
+            'end_date': self.end_date,
+            'stocks_checked': self.stocks_checked,
+            'trading_days': self.trading_days,
+            'stocks_with_gaps': len(self.reports),
+            'missing_days': sum(r.missing_days for r in self.reports.values()),
+        }
+
+
 class DataConsistencyService:
-    def __init__(self):
-        self.db: Session = next(get_db())
-    
-    async def verify_data_integrity(self, 
-                                  stock_code: str, 
-                                  start_date: datetime, 
+    """基于交易日历的日线完整性检查
+
+    以 股票 × 交易日 的布尔矩阵一次性比较整个股票池：应有数据从
+    max(上市日, start_date) 开始。停牌日在 tushare 中没有日线，同样会报告为缺口。
+    """
+
+    def __init__(self,
+                 session_factory: Optional[async_sessionmaker] = None,
+                 calendar: Optional[TradingCalendar] = None,
+                 columnar_store: Optional[ColumnarStore] = None):
+        self.session_factory = session_factory
+        self.calendar = calendar
+        self.columnar_store = columnar_store
+
+    async def verify_data_integrity(self,
+                                  stock_code: str,
+                                  start_date: datetime,
                                   end_date: datetime) -> bool:
         # 检查数据连续性
-        daily_data = self.db.query(DailyData).filter(
-            DailyData.stock_code == stock_code,
-            DailyData.trade_date.between(
-                start_date.strftime('%Y%m%d'), 
-                end_date.strftime('%Y%m%d')
-            )
-        ).all()
-        
-        # 验证数据完整性
-        return self._check_data_sequence(daily_data)
-    
-    def _check_data_sequence(self, data: List[DailyData]) -> bool:
-        if not data:
-            return False
-        
-        # 转换为pandas DataFrame进行时间序列分析
-        df = pd.DataFrame([{
-            'trade_date': item.trade_date,
-            'stock_code': item.stock_code
-        } for item in data])
-        
-        if df.empty:
-            return False
-            
-        # 检查时间间隔是否符合预期
-        df['trade_date'] = pd.to_datetime(df['trade_date'])
-        df = df.sort_values('trade_date')
-        date_diffs = df['trade_date'].diff().dropna()
-        
-        return all(diff <= timedelta(days=3) for diff in date_diffs)
\ No newline at end of file
+        report = await self.check_universe(
+            start_date.strftime('%Y%m%d'),
+            end_date.strftime('%Y%m%d'),
+            stock_codes=[stock_code],
+            source='db'
+        )
+        return report.stocks_checked > 0 and report.complete
+
+    async def check_universe(self,
+                             start_date: str,
+                             end_date: str,
+                             stock_codes: Optional[Sequence[str]] = None,
+                             source: str = 'store') -> IntegrityReport:
+        """检查股票池在 [start_date, end_date] 内的缺口
+
+        source='store' 从列式存储读取数据存在性（毫秒级）；
+        source='db' 从 daily_data 一次查询 (stock_code, trade_date)。
+        """
+        if self.calendar is None:
+            raise ValueError("A trading calendar is required for integrity checks")
+        calendar = np.array(await self.calendar.trade_dates(start_date, end_date), dtype=object)
+
+        async with session_scope(self.session_factory) as db:
+            query = select(Stock.ts_code, Stock.list_date).order_by(Stock.ts_code)
+            if stock_codes is not None:
+                query = query.where(Stock.ts_code.in_(list(stock_codes)))
+            stocks = (await db.execute(query)).all()
+            codes = [code for code, _ in stocks]
+            list_dates = [list_date or start_date for _, list_date in stocks]
+
+            if source == 'db':
+                present = await db.run_sync(self._presence_from_db, codes, calendar,
+                                            start_date, end_date)
+            elif source == 'store':
+                present = self._presence_from_store(codes, calendar)
+            else:
+                raise ValueError(f"Unknown integrity source '{source}'")
+
+        report = self._build_report(codes, list_dates, calendar, present, start_date, end_date)
+        logger.info(f"Integrity check finished: {report.summary()}")
+        return report
+
+    def _presence_from_db(self, db: Session, codes: List[str], calendar: np.ndarray,
+                          start_date: str, end_date: str) -> np.ndarray:
+        present = np.zeros((len(codes), len(calendar)), dtype=bool)
+        query = select(DailyData.stock_code, DailyData.trade_date).where(
+            DailyData.trade_date.between(start_date, end_date)
+        )
+        if len(codes) <= 500:
+            query = query.where(DailyData.stock_code.in_(codes))
+        df = pd.read_sql(query, db.connection())
+        rows = pd.Index(codes).get_indexer(df['stock_code'])
+        cols = pd.Index(calendar).get_indexer(df['trade_date'])
+        # 不在股票池中或非交易日的数据不计入
+        valid = (rows >= 0) & (cols >= 0)
+        present[rows[valid], cols[valid]] = True
+        return present
+
+    def _presence_from_store(self, codes: List[str], calendar: np.ndarray) -> np.ndarray:
+        present = np.zeros((len(codes), len(calendar)), dtype=bool)
+        store = self.columnar_store
+        if store is None or 'close' not in store:
+            raise ValueError("Columnar store is not available, use source='db'")
+        store.refresh()
+        rows = pd.Index(store.codes).get_indexer(codes)
+        cols = pd.Index(store.dates).get_indexer(calendar)
+        in_rows, in_cols = rows >= 0, cols >= 0
+        close = store['close']
+        present[np.ix_(in_rows, in_cols)] = ~np.isnan(close[np.ix_(rows[in_rows], cols[in_cols])])
+        return present
+
+    @staticmethod
+    def _build_report(codes: List[str], list_dates: List[str], calendar: np.ndarray,
+                      present: np.ndarray, start_date: str, end_date: str) -> IntegrityReport:
+        report = IntegrityReport(start_date=start_date, end_date=end_date,
+                                 stocks_checked=len(codes), trading_days=len(calendar))
+        if not codes or not len(calendar):
+            return report
+
+        # 每只股票从上市日（或检查起点）开始应有数据
+        first = np.searchsorted(calendar, np.asarray(list_dates, dtype=object), side='left')
+        expected = np.arange(len(calendar))[None, :] >= first[:, None]
+        missing = expected & ~present
+
+        # 行内连续缺失区间：差分后 +1 为区间起点，-1 为区间终点的下一位
+        padded = np.pad(missing.astype(np.int8), ((0, 0), (1, 1)))
+        edges = np.diff(padded, axis=1)
+        start_rows, start_cols = np.nonzero(edges == 1)
+        _, end_cols = np.nonzero(edges == -1)
+
+        expected_days = expected.sum(axis=1)
+        present_days = (present & expected).sum(axis=1)
+        for row, lo, hi in zip(start_rows, start_cols, end_cols):
+            code = codes[row]
+            gap_report = report.reports.get(code)
+            if gap_report is None:
+                gap_report = report.reports[code] = GapReport(
+                    stock_code=code,
+                    expected_days=int(expected_days[row]),
+                    present_days=int(present_days[row]),
+                )
+            gap_report.gaps.append((calendar[lo], calendar[hi - 1]))
+        return report
@@ -0,0 +1,166 @@
+# app/services/fetch_planner.py
+import logging
+import math
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from app.services.ingest_pipeline import FetchUnit
+
+logger = logging.getLogger(__name__)
+
+PER_DATE = 'per_date'
+PER_STOCK_BATCH = 'per_stock_batch'
+MIXED = 'mixed'
+
+
+@dataclass
+class FetchPlan:
+    """tushare 日线拉取计划"""
+    strategy: str
+    units: List[FetchUnit] = field(default_factory=list)
+    stocks: int = 0
+    trading_days: int = 0
+    date_calls: int = 0
+    batch_calls: int = 0
+
+    @property
+    def predicted_calls(self) -> int:
+        return len(self.units)
+
+    def summary(self) -> Dict:
+        """用于日志与试运行（dry run）的计划摘要"""
+        return {
+            'strategy': self.strategy,
+            'predicted_calls': self.predicted_calls,
+            'date_calls': self.date_calls,
+            'batch_calls': self.batch_calls,
+            'stocks': self.stocks,
+            'trading_days': self.trading_days,
+        }
+
+
+@dataclass
+class _Group:
+    start_date: str
+    codes: List[str]
+    dates: List[str]
+    batch_calls: int
+    codes_per_call: int
+
+
+class FetchPlanner:
+    """基于调用次数的拉取计划器
+
+    按日查询（daily(trade_date=X)）一次返回全市场当日数据，成本为缺口内交易日数；
+    按股票批次查询成本为 ceil(股票数 / 每次股票数) × ceil(交易日数 / 每次天数)，
+    且每次返回行数不超过单次查询上限。对每个缺口分组选择更便宜的方式，
+    多个分组共享同一交易日的按日查询。
+    """
+
+    def __init__(self,
+                 row_limit: int,
+                 max_codes_per_call: int,
+                 market_size: Optional[int] = None):
+        self.row_limit = row_limit
+        self.max_codes_per_call = max(1, max_codes_per_call)
+        # 全市场单日行数超过上限时，按日查询会被截断，不可用
+        self.market_size = market_size
+
+    @property
+    def per_date_allowed(self) -> bool:
+        return self.market_size is None or self.market_size <= self.row_limit
+
+    def _batch_cost(self, stocks: int, days: int) -> Tuple[int, int]:
+        """返回 (最少调用次数, 对应的每次股票数)"""
+        best = (math.inf, 1)
+        for per_call in range(1, min(stocks, self.max_codes_per_call, self.row_limit) + 1):
+            days_per_call = self.row_limit // per_call
+            calls = math.ceil(stocks / per_call) * math.ceil(days / days_per_call)
+            # 调用次数相同时选择更大的批次，减少时间切片
+            if calls <= best[0]:
+                best = (calls, per_call)
+        return best
+
+    @staticmethod
+    def _dates_in(trade_dates: Sequence[str], start_date: str, end_date: str) -> List[str]:
+        return [d for d in trade_dates if start_date <= d <= end_date]
+
+    def plan(self,
+             gap_groups: Dict[str, List[str]],
+             end_date: str,
+             trade_dates: Optional[Sequence[str]] = None) -> FetchPlan:
+        """根据缺口分组 {start_date: [codes]} 生成拉取计划
+
+        trade_dates 为交易日历；未提供时以工作日近似。
+        """
+        if not gap_groups:
+            return FetchPlan(strategy=PER_STOCK_BATCH)
+
+        if trade_dates is None:
+            first = min(gap_groups)
+            trade_dates = [d.strftime('%Y%m%d') for d in pd.bdate_range(first, end_date)]
+        trade_dates = sorted(trade_dates)
+
+        groups = []
+        for start_date, codes in sorted(gap_groups.items()):
+            dates = self._dates_in(trade_dates, start_date, end_date)
+            if not dates or not codes:
+                continue
+            calls, per_call = self._batch_cost(len(codes), len(dates))
+            groups.append(_Group(start_date, list(codes), dates, calls, per_call))
+
+        # 贪心：每轮把“改为按日查询后节省最多”的分组切换过去，直到没有收益
+        date_groups: List[_Group] = []
+        date_set = set()
+        remaining = list(groups)
+        while self.per_date_allowed and remaining:
+            best, best_gain = None, 0
+            for group in remaining:
+                gain = group.batch_calls - len(set(group.dates) - date_set)
+                if gain > best_gain:
+                    best, best_gain = group, gain
+            if best is None:
+                break
+            remaining.remove(best)
+            date_groups.append(best)
+            date_set.update(best.dates)
+
+        units = []
+        # 按日查询：每个交易日一次调用，保留该日处于缺口内的股票
+        group_dates = [(group, set(group.dates)) for group in date_groups]
+        for trade_date in sorted(date_set):
+            codes = tuple(code for group, dates in group_dates if trade_date in dates
+                          for code in group.codes)
+            units.append(FetchUnit(codes, trade_date, trade_date, trade_date=trade_date))
+        date_calls = len(units)
+
+        # 按股票批次查询：按交易日切片，保证每次返回行数不超过上限
+        for group in remaining:
+            per_call = group.codes_per_call
+            days_per_call = self.row_limit // per_call
+            for i in range(0, len(group.codes), per_call):
+                batch = tuple(group.codes[i:i + per_call])
+                for j in range(0, len(group.dates), days_per_call):
+                    window = group.dates[j:j + days_per_call]
+                    units.append(FetchUnit(batch, window[0], window[-1]))
+
+        if not remaining:
+            strategy = PER_DATE
+        elif not date_groups:
+            strategy = PER_STOCK_BATCH
+        else:
+            strategy = MIXED
+
+        all_dates = set(d for group in groups for d in group.dates)
+        plan = FetchPlan(
+            strategy=strategy,
+            units=units,
+            stocks=sum(len(group.codes) for group in groups),
+            trading_days=len(all_dates),
+            date_calls=date_calls,
+            batch_calls=len(units) - date_calls,
+        )
+        logger.info(f"Fetch plan: {plan.summary()}")
+        return plan
@@ -0,0 +1,246 @@
+# app/services/indicators.py
+import logging
+import os
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.services.columnar_store import ColumnarStore, get_columnar_store
+
+logger = logging.getLogger(__name__)
+
+MA_WINDOWS = (5, 10, 20, 60)
+EMA_FAST, EMA_SLOW, MACD_SIGNAL = 12, 26, 9
+RSI_PERIOD = 14
+ATR_PERIOD = 14
+BOLL_WINDOW, BOLL_WIDTH = 20, 2.0
+# 环形缓冲区保留每只股票最近的有效收盘价，长度取最大窗口
+BUFFER_SIZE = max(MA_WINDOWS + (BOLL_WINDOW,))
+
+INDICATOR_FIELDS = [
+    *[f'ma{w}' for w in MA_WINDOWS],
+    'ema12', 'ema26', 'macd', 'macd_signal', 'macd_hist',
+    'rsi14', 'boll_mid', 'boll_upper', 'boll_lower', 'atr14',
+]
+# 每次写回列式存储的日期块大小，控制全量重算时的内存占用
+DATE_BLOCK = 250
+STATE_FILE = 'indicator_state.npz'
+
+
+def _initial_arrays(n: int) -> Dict[str, np.ndarray]:
+    arrays = {
+        'count': np.zeros(n, dtype=np.int64),
+        'buffer': np.zeros((n, BUFFER_SIZE)),
+        'sumsq20': np.zeros(n),
+        'rsi_count': np.zeros(n, dtype=np.int64),
+        'atr_count': np.zeros(n, dtype=np.int64),
+    }
+    for w in MA_WINDOWS:
+        arrays[f'sum{w}'] = np.zeros(n)
+    for name in ('ema12', 'ema26', 'macd_signal', 'prev_close', 'avg_gain', 'avg_loss', 'atr'):
+        arrays[name] = np.full(n, np.nan)
+    return arrays
+
+
+@dataclass
+class IndicatorState:
+    """每只股票的滚动状态（窗口和、EMA、Wilder 平滑值等），行与列式存储的股票顺序一致"""
+    codes: List[str]
+    as_of: Optional[str] = None
+    arrays: Dict[str, np.ndarray] = field(default_factory=dict)
+
+    @classmethod
+    def empty(cls, codes: Sequence[str]) -> "IndicatorState":
+        return cls(codes=list(codes), arrays=_initial_arrays(len(codes)))
+
+    def extend(self, codes: Sequence[str]) -> None:
+        """追加新股票的初始状态（列式存储的股票只会追加）"""
+        extra = len(codes) - len(self.codes)
+        if extra <= 0:
+            return
+        fresh = _initial_arrays(extra)
+        self.arrays = {name: np.concatenate([array, fresh[name]]) for name, array in self.arrays.items()}
+        self.codes = list(codes)
+
+    def save(self, path: Path) -> None:
+        tmp = path.with_name(path.stem + '.tmp.npz')
+        np.savez(tmp, codes=np.array(self.codes, dtype=str),
+                 as_of=np.array(self.as_of or ''), **self.arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> Optional["IndicatorState"]:
+        if not path.exists():
+            return None
+        with np.load(path) as data:
+            arrays = {name: data[name] for name in data.files if name not in ('codes', 'as_of')}
+            return cls(codes=data['codes'].tolist(), as_of=str(data['as_of']) or None, arrays=arrays)
+
+
+def step(state: Dict[str, np.ndarray], close: np.ndarray, high: np.ndarray,
+         low: np.ndarray) -> Dict[str, np.ndarray]:
+    """推进一个交易日：输入全部股票当日的价格向量，返回各指标当日的值
+
+    停牌（收盘价为 NaN）的股票不更新状态，当日指标为 NaN。
+    EMA 以首个收盘价为初值；RSI、ATR 使用 Wilder 平滑（alpha = 1/周期）。
+    """
+    n = len(close)
+    out = {name: np.full(n, np.nan) for name in INDICATOR_FIELDS}
+    idx = np.nonzero(~np.isnan(close))[0]
+    if not len(idx):
+        return out
+    x = close[idx]
+    count = state['count'][idx]
+    buffer = state['buffer']
+
+    # 窗口和：加入新值，减去移出窗口的值（先读后写，同一槽位也安全）
+    for w in MA_WINDOWS:
+        leaving = np.where(count >= w, buffer[idx, (count - w) % BUFFER_SIZE], 0.0)
+        sums = state[f'sum{w}'][idx] + x - leaving
+        state[f'sum{w}'][idx] = sums
+        out[f'ma{w}'][idx] = np.where(count + 1 >= w, sums / w, np.nan)
+        if w == BOLL_WINDOW:
+            sq = state['sumsq20'][idx] + x * x - leaving * leaving
+            state['sumsq20'][idx] = sq
+            mean = sums / w
+            std = np.sqrt(np.maximum(sq / w - mean * mean, 0.0))
+            ready = count + 1 >= w
+            out['boll_mid'][idx] = np.where(ready, mean, np.nan)
+            out['boll_upper'][idx] = np.where(ready, mean + BOLL_WIDTH * std, np.nan)
+            out['boll_lower'][idx] = np.where(ready, mean - BOLL_WIDTH * std, np.nan)
+    buffer[idx, count % BUFFER_SIZE] = x
+    state['count'][idx] = count + 1
+
+    # EMA / MACD
+    for name, span in (('ema12', EMA_FAST), ('ema26', EMA_SLOW)):
+        prev = state[name][idx]
+        ema = np.where(np.isnan(prev), x, prev + 2.0 / (span + 1) * (x - prev))
+        state[name][idx] = ema
+        out[name][idx] = ema
+    dif = out['ema12'][idx] - out['ema26'][idx]
+    prev = state['macd_signal'][idx]
+    signal = np.where(np.isnan(prev), dif, prev + 2.0 / (MACD_SIGNAL + 1) * (dif - prev))
+    state['macd_signal'][idx] = signal
+    out['macd'][idx] = dif
+    out['macd_signal'][idx] = signal
+    out['macd_hist'][idx] = dif - signal
+
+    # RSI：从第二个收盘价开始累计涨跌
+    prev_close = state['prev_close'][idx]
+    has_prev = ~np.isnan(prev_close)
+    change = np.where(has_prev, x - prev_close, 0.0)
+    gain, loss = np.maximum(change, 0.0), np.maximum(-change, 0.0)
+    avg_gain, avg_loss = state['avg_gain'][idx], state['avg_loss'][idx]
+    avg_gain = np.where(has_prev, np.where(np.isnan(avg_gain), gain,
+                                           avg_gain + (gain - avg_gain) / RSI_PERIOD), avg_gain)
+    avg_loss = np.where(has_prev, np.where(np.isnan(avg_loss), loss,
+                                           avg_loss + (loss - avg_loss) / RSI_PERIOD), avg_loss)
+    state['avg_gain'][idx], state['avg_loss'][idx] = avg_gain, avg_loss
+    rsi_count = state['rsi_count'][idx] + has_prev
+    state['rsi_count'][idx] = rsi_count
+    total = avg_gain + avg_loss
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rsi = np.where(total > 0, 100.0 * avg_gain / total, 50.0)
+    out['rsi14'][idx] = np.where(rsi_count >= RSI_PERIOD, rsi, np.nan)
+
+    # ATR：真实波幅，首日为 high - low
+    h, l = high[idx], low[idx]
+    true_range = np.where(has_prev,
+                          np.fmax(h - l, np.fmax(np.abs(h - prev_close), np.abs(l - prev_close))),
+                          h - l)
+    atr = state['atr'][idx]
+    atr = np.where(np.isnan(atr), true_range, atr + (true_range - atr) / ATR_PERIOD)
+    state['atr'][idx] = atr
+    atr_count = state['atr_count'][idx] + 1
+    state['atr_count'][idx] = atr_count
+    out['atr14'][idx] = np.where(atr_count >= ATR_PERIOD, atr, np.nan)
+
+    state['prev_close'][idx] = x
+    return out
+
+
+class IndicatorEngine:
+    """在列式存储的 股票 × 日期 面板上计算技术指标
+
+    每个交易日对全部股票做一次向量运算，滚动状态持久化在 indicator_state.npz；
+    夜间入库后只需为新交易日各追加一列。历史数据被修改（回补、重建）时从头重算。
+    指标结果作为字段写回列式存储。
+    """
+
+    def __init__(self, store: Optional[ColumnarStore] = None):
+        self._store = store
+        self._lock = threading.Lock()
+
+    @property
+    def store(self) -> ColumnarStore:
+        if self._store is None:
+            self._store = get_columnar_store()
+        return self._store
+
+    @property
+    def state_path(self) -> Path:
+        return self.store.root / STATE_FILE
+
+    def update(self, changed_since: Optional[str] = None, full: bool = False) -> Dict:
+        """计算尚未计算的交易日
+
+        changed_since 为本次写入数据的最早交易日，不晚于已计算日期时说明历史被修改，需全量重算。
+        """
+        with self._lock:
+            store = self.store
+            store.refresh()
+            if 'close' not in store:
+                return {'dates': 0, 'stocks': 0, 'as_of': None}
+            codes, dates = store.codes, store.dates
+
+            state = None if full else IndicatorState.load(self.state_path)
+            if state is not None and (
+                    state.codes != codes[:len(state.codes)]
+                    or (state.as_of and changed_since and changed_since <= state.as_of)):
+                logger.info(f"Historical data changed since {changed_since}, recomputing indicators")
+                state = None
+            if state is None:
+                state = IndicatorState.empty(codes)
+            state.extend(codes)
+
+            start = int(np.searchsorted(dates, state.as_of, side='right')) if state.as_of else 0
+            for lo in range(start, len(dates), DATE_BLOCK):
+                hi = min(lo + DATE_BLOCK, len(dates))
+                close = np.array(store['close'][:, lo:hi])
+                high = np.array(store['high'][:, lo:hi])
+                low = np.array(store['low'][:, lo:hi])
+                blocks = {name: np.empty_like(close) for name in INDICATOR_FIELDS}
+                for j in range(hi - lo):
+                    values = step(state.arrays, close[:, j], high[:, j], low[:, j])
+                    for name in INDICATOR_FIELDS:
+                        blocks[name][:, j] = values[name]
+                store.write_block(blocks, codes, dates[lo:hi])
+                state.as_of = dates[hi - 1]
+            state.save(self.state_path)
+
+            summary = {'dates': len(dates) - start, 'stocks': len(codes), 'as_of': state.as_of}
+            logger.info(f"Indicators updated: {summary}")
+            return summary
+
+    def read(self, stock_code: str, names: Optional[Sequence[str]] = None,
+             start_date: Optional[str] = None, end_date: Optional[str] = None) -> Dict[str, object]:
+        """读取单只股票的指标序列，NaN 转为 None"""
+        names = list(names or INDICATOR_FIELDS)
+        unknown = [name for name in names if name not in INDICATOR_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown indicators: {unknown}; available: {INDICATOR_FIELDS}")
+        store = self.store
+        store.refresh()
+        if stock_code not in store.codes or any(name not in store for name in names):
+            return {'stock_code': stock_code, 'dates': [], 'indicators': {name: [] for name in names}}
+        indicators = {}
+        dates: List[str] = []
+        for name in names:
+            panel = store.panel(name, [stock_code], start_date, end_date)
+            dates = panel.dates
+            row = panel.values[0]
+            indicators[name] = [None if np.isnan(v) else float(v) for v in row]
+        return {'stock_code': stock_code, 'dates': dates, 'indicators': indicators}
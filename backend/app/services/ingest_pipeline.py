@@ -0,0 +1,298 @@
+# app/services/ingest_pipeline.py
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import random
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+import pandas as pd
+
+from app.core.exceptions import CircuitOpenError, CircuitTrialInProgressError
+from app.core.metrics import RETRY_ATTEMPTS
+from app.core.rate_limiter import TokenBucketRateLimiter
+from app.services.tushare_client import is_rate_limit_error
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class FetchUnit:
+    """一次 tushare 调用对应的工作单元
+
+    按股票批次查询时为一批股票 × 一个时间片；按日查询时 trade_date 有值，
+    一次调用返回全市场当日数据，codes 为需要保留的股票。
+    """
+    codes: tuple
+    start_date: str
+    end_date: str
+    trade_date: Optional[str] = None
+
+    @property
+    def per_date(self) -> bool:
+        return self.trade_date is not None
+
+    def describe(self) -> str:
+        if self.per_date:
+            return f"[market x{len(self.codes)}] {self.trade_date}"
+        head = ','.join(self.codes[:3])
+        more = f"...(+{len(self.codes) - 3})" if len(self.codes) > 3 else ''
+        return f"[{head}{more}] {self.start_date}-{self.end_date}"
+
+
+def fetch_daily(api, unit: FetchUnit) -> Optional[pd.DataFrame]:
+    """用 tushare 客户端拉取一个工作单元的日线数据"""
+    if unit.per_date:
+        # 按日查询返回全市场数据，只保留缺口内的股票
+        df = api.daily(trade_date=unit.trade_date)
+        if df is None or df.empty:
+            return df
+        return df[df['ts_code'].isin(unit.codes)]
+
+    # 使用逗号分隔的股票代码字符串
+    return api.daily(
+        ts_code=','.join(unit.codes),
+        start_date=unit.start_date,
+        end_date=unit.end_date
+    )
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """单元级重试：每个单元最多尝试 max_attempts 次，失败后按指数退避（带抖动）重新排队
+
+    限流错误不退避，由限流器降速控制节奏。
+    """
+    max_attempts: int = 4
+    base_delay: float = 2.0
+    max_delay: float = 60.0
+
+    def delay(self, attempt: int) -> float:
+        """第 attempt 次失败后的等待秒数"""
+        return min(self.max_delay, self.base_delay * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+
+
+class RetryQueue:
+    """重试耗尽或因熔断未执行的单元，之后的运行只重做这些单元（按加入顺序去重）
+
+    只在内存中，用于在下次增量更新之前尽早补拉；进程重启后丢失也不会留下缺口，
+    水位不越过失败的单元（见 WatermarkTracker），下次增量更新会重新计划这些区间。
+    """
+
+    def __init__(self):
+        self._units: Dict[FetchUnit, None] = {}
+
+    def __len__(self) -> int:
+        return len(self._units)
+
+    def extend(self, units: Iterable[FetchUnit]) -> None:
+        for unit in units:
+            self._units[unit] = None
+
+    def drain(self) -> List[FetchUnit]:
+        units, self._units = list(self._units), {}
+        return units
+
+
+@dataclass
+class PipelineResult:
+    """流水线运行结果"""
+    units_total: int = 0
+    units_done: int = 0
+    failed_units: List[FetchUnit] = field(default_factory=list)
+    api_calls: int = 0
+    rows_written: int = 0
+    retries: int = 0
+    rate_limited: int = 0
+    # 熔断器断开后剩余单元未执行，与失败单元一起留待重试
+    circuit_open: bool = False
+    elapsed: float = 0.0
+
+    @property
+    def success(self) -> bool:
+        return not self.failed_units
+
+
+FetchFunc = Callable[[FetchUnit], Optional[pd.DataFrame]]
+WriteFunc = Callable[[FetchUnit, pd.DataFrame], Awaitable[int]]
+
+_DONE = object()
+# 熔断器半开、试探调用进行中时，其他单元重新尝试前的等待秒数
+CIRCUIT_TRIAL_WAIT = 0.2
+
+
+class FetchWritePipeline:
+    """生产者/消费者流水线：线程池并发拉取，单一写入者落库
+
+    拉取在有界线程池中执行，由令牌桶限流；结果经有界队列交给唯一的写入协程，
+    使网络 I/O 与数据库写入互相重叠，同时队列满时对拉取端形成反压。
+
+    配置 retry 时失败按单元重试：拉取或写入失败的单元按退避时间进入重试堆，
+    其他单元照常进行；被限流时让限流器降速，成功后逐步恢复。
+    熔断器断开（CircuitOpenError）时停止发起调用，剩余单元全部记为失败；
+    半开状态下试探调用进行中被拒绝的单元不算失败，稍后重新入队，等待试探结果。
+    """
+
+    def __init__(self,
+                 fetch: FetchFunc,
+                 write: WriteFunc,
+                 limiter: TokenBucketRateLimiter,
+                 concurrency: int = 4,
+                 queue_size: int = 16,
+                 retry: Optional[RetryPolicy] = None):
+        self.fetch = fetch
+        self.write = write
+        self.limiter = limiter
+        self.concurrency = max(1, concurrency)
+        self.queue_size = max(1, queue_size)
+        self.retry = retry
+
+    async def run(self, units: Iterable[FetchUnit]) -> PipelineResult:
+        units = list(units)
+        result = PipelineResult(units_total=len(units))
+        if not units:
+            return result
+
+        began = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        # (单元, 第几次尝试)
+        pending = deque((unit, 1) for unit in units)
+        # (可重试的时间, 序号, 单元, 第几次尝试)
+        delayed: list = []
+        sequence = itertools.count()
+        results: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        changed = asyncio.Event()
+        # 已取出但尚未完成（拉取中、等待写入或写入中）的单元数
+        in_flight = 0
+
+        def finish() -> None:
+            nonlocal in_flight
+            in_flight -= 1
+            changed.set()
+
+        def fail(unit: FetchUnit, attempt: int, kind: str) -> None:
+            if self.retry is not None and attempt < self.retry.max_attempts and not result.circuit_open:
+                delay = 0.0 if kind == 'rate_limit' else self.retry.delay(attempt)
+                heapq.heappush(delayed, (loop.time() + delay, next(sequence), unit, attempt + 1))
+                result.retries += 1
+                RETRY_ATTEMPTS.inc(function='fetch_unit', error=kind)
+            else:
+                result.failed_units.append(unit)
+            finish()
+
+        def wait_for_trial(unit: FetchUnit, attempt: int) -> None:
+            # 不消耗重试次数；试探失败后再取出时熔断器已断开，按断开处理
+            heapq.heappush(delayed, (loop.time() + CIRCUIT_TRIAL_WAIT, next(sequence), unit, attempt))
+            finish()
+
+        def open_circuit(unit: FetchUnit) -> None:
+            result.circuit_open = True
+            result.failed_units.append(unit)
+            result.failed_units.extend(unit for unit, _ in pending)
+            result.failed_units.extend(item[2] for item in delayed)
+            pending.clear()
+            delayed.clear()
+            finish()
+
+        async def next_unit():
+            nonlocal in_flight
+            while True:
+                timeout = None
+                if pending:
+                    item = pending.popleft()
+                elif delayed and delayed[0][0] <= loop.time():
+                    _, _, unit, attempt = heapq.heappop(delayed)
+                    item = (unit, attempt)
+                elif delayed:
+                    item, timeout = None, delayed[0][0] - loop.time()
+                elif in_flight == 0:
+                    return None
+                else:
+                    item = None
+                if item is not None:
+                    in_flight += 1
+                    return item
+                # 等待退避到期，或其他单元失败后重新入堆
+                changed.clear()
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+        with ThreadPoolExecutor(max_workers=self.concurrency,
+                                thread_name_prefix='tushare-fetch') as executor:
+
+            async def producer():
+                while True:
+                    item = await next_unit()
+                    if item is None:
+                        return
+                    unit, attempt = item
+                    await self.limiter.acquire()
+                    try:
+                        # 复制上下文，使拉取线程中的计数归属到当前任务
+                        context = contextvars.copy_context()
+                        df = await loop.run_in_executor(executor, context.run, self.fetch, unit)
+                    except CircuitTrialInProgressError:
+                        wait_for_trial(unit, attempt)
+                        continue
+                    except CircuitOpenError as e:
+                        logger.error(f"Stopping fetches at batch {unit.describe()}: {str(e)}")
+                        open_circuit(unit)
+                        continue
+                    except Exception as e:
+                        result.api_calls += 1
+                        if is_rate_limit_error(e):
+                            result.rate_limited += 1
+                            self.limiter.slow_down()
+                            fail(unit, attempt, 'rate_limit')
+                        else:
+                            logger.error(f"Error fetching batch {unit.describe()} "
+                                         f"(attempt {attempt}): {str(e)}")
+                            fail(unit, attempt, 'data_fetch')
+                        continue
+                    result.api_calls += 1
+                    self.limiter.recover()
+                    await results.put((unit, attempt, df))
+
+            writing: List[asyncio.Future] = []
+
+            async def writer():
+                while True:
+                    item = await results.get()
+                    if item is _DONE:
+                        return
+                    unit, attempt, df = item
+                    writing[:] = [asyncio.ensure_future(self.write(unit, df))]
+                    try:
+                        # 运行被取消时不打断进行中的写事务，让它提交或回滚后再退出
+                        result.rows_written += await asyncio.shield(writing[0])
+                    except Exception as e:
+                        logger.error(f"Error writing batch {unit.describe()} (attempt {attempt}): {str(e)}")
+                        fail(unit, attempt, 'write')
+                        continue
+                    result.units_done += 1
+                    finish()
+
+            writer_task = asyncio.create_task(writer())
+            try:
+                await asyncio.gather(*(producer() for _ in range(self.concurrency)))
+                await results.put(_DONE)
+                await writer_task
+            finally:
+                if not writer_task.done():
+                    writer_task.cancel()
+                    # 等待进行中的写入结束，否则未结束的写事务会锁住调用方随后的写入（SQLite）
+                    await asyncio.gather(writer_task, *writing, return_exceptions=True)
+
+        result.elapsed = time.perf_counter() - began
+        logger.info(f"Pipeline finished: units={result.units_done}/{result.units_total}, "
+                    f"failed={len(result.failed_units)}, retries={result.retries}, "
+                    f"rate_limited={result.rate_limited}, api_calls={result.api_calls}, "
+                    f"rows={result.rows_written}, elapsed={result.elapsed:.1f}s")
+        return result
@@ -0,0 +1,391 @@
+# app/services/intraday.py
+import asyncio
+import logging
+import math
+from datetime import datetime, time
+from typing import Callable, Dict, List, Optional, Protocol, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import session_scope
+from app.core.metrics import DB_COMMIT_SECONDS
+from app.core.rate_limiter import TokenBucketRateLimiter
+from app.models import Stock
+from app.models.stock import IntradayBar
+from app.services.bulk_upsert import dialect_insert
+from app.services.job_history import track_api_call, track_rows
+
+logger = logging.getLogger(__name__)
+
+BAR_FIELDS = ('open', 'high', 'low', 'close', 'volume', 'amount')
+BAR_COLUMNS = ['ts_code', 'trade_time', *BAR_FIELDS]
+# 连续竞价时段
+SESSIONS = ((time(9, 30), time(11, 30)), (time(13, 0), time(15, 0)))
+_NAT = np.datetime64('NaT', 'm')
+
+
+def in_trading_session(now: datetime) -> bool:
+    return now.weekday() < 5 and any(start <= now.time() <= end for start, end in SESSIONS)
+
+
+class MinuteBarAggregator:
+    """把行情快照（最新价 + 当日累计成交量/额）聚合为分钟线
+
+    同一分钟内的多次快照更新同一根K线；成交量为累计量相对上一分钟末的增量。
+    股票首次出现时以当时的累计量为基准，换日时累计量从 0 开始。
+    """
+
+    def __init__(self):
+        self._state = pd.DataFrame(
+            columns=['minute', 'open', 'high', 'low', 'base_volume', 'base_amount',
+                     'last_volume', 'last_amount']
+        ).astype({'minute': 'datetime64[ns]'})
+
+    def update(self, ticks: pd.DataFrame) -> pd.DataFrame:
+        """ticks 列为 ts_code, time, price, volume, amount；返回受影响的分钟线"""
+        ticks = ticks[ticks['price'] > 0].drop_duplicates('ts_code', keep='last').set_index('ts_code')
+        if ticks.empty:
+            return pd.DataFrame(columns=BAR_COLUMNS)
+        minute = pd.to_datetime(ticks['time']).dt.floor('min')
+        prev = self._state.reindex(ticks.index)
+        # 丢弃比已有K线更早的快照
+        fresh = (prev['minute'].isna() | (minute >= prev['minute'])).to_numpy()
+        ticks, minute, prev = ticks[fresh], minute[fresh], prev[fresh]
+
+        price = ticks['price'].astype(float)
+        volume = ticks['volume'].astype(float)
+        amount = ticks['amount'].astype(float)
+        new_bar = (prev['minute'] != minute).to_numpy()
+        first_seen = prev['minute'].isna().to_numpy()
+        new_day = ~first_seen & (prev['minute'].dt.normalize() != minute.dt.normalize()).to_numpy()
+
+        def base(last: pd.Series, current: pd.Series, kept: pd.Series) -> np.ndarray:
+            start = np.where(first_seen, current, np.where(new_day, 0.0, last))
+            return np.where(new_bar, start, kept)
+
+        state = pd.DataFrame({
+            'minute': minute,
+            'open': np.where(new_bar, price, prev['open']),
+            'high': np.where(new_bar, price, np.fmax(prev['high'].astype(float), price)),
+            'low': np.where(new_bar, price, np.fmin(prev['low'].astype(float), price)),
+            'base_volume': base(prev['last_volume'], volume, prev['base_volume']),
+            'base_amount': base(prev['last_amount'], amount, prev['base_amount']),
+            'last_volume': volume,
+            'last_amount': amount,
+        }, index=ticks.index)
+        self._state = pd.concat([self._state.drop(index=state.index, errors='ignore'), state])
+
+        return pd.DataFrame({
+            'ts_code': state.index,
+            'trade_time': state['minute'].to_numpy(),
+            'open': state['open'].to_numpy(float),
+            'high': state['high'].to_numpy(float),
+            'low': state['low'].to_numpy(float),
+            'close': price.to_numpy(),
+            'volume': (volume - state['base_volume']).to_numpy(float),
+            'amount': (amount - state['base_amount']).to_numpy(float),
+        })
+
+
+class MinuteBarSource(Protocol):
+    """分钟线数据源：返回 BAR_COLUMNS 格式的最新K线，当前分钟可以是未完成的K线
+
+    trading_hours_only 为 True（未定义时的默认值）的数据源只在连续竞价时段内轮询。
+    """
+    trading_hours_only: bool
+
+    def fetch(self, codes: Sequence[str]) -> pd.DataFrame:
+        ...
+
+
+class TushareQuoteSource:
+    """按批轮询 tushare 实时行情（realtime_quote）并聚合为分钟线"""
+    trading_hours_only = True
+
+    def __init__(self, batch_size: Optional[int] = None,
+                 quote: Optional[Callable[..., pd.DataFrame]] = None):
+        self.batch_size = batch_size or settings.INTRADAY_QUOTE_BATCH
+        self._quote = quote
+        self.aggregator = MinuteBarAggregator()
+
+    def fetch(self, codes: Sequence[str]) -> pd.DataFrame:
+        if self._quote is None:
+            import tushare as ts
+            self._quote = ts.realtime_quote
+        frames = []
+        for i in range(0, len(codes), self.batch_size):
+            track_api_call()
+            df = self._quote(ts_code=','.join(codes[i:i + self.batch_size]))
+            if df is not None and not df.empty:
+                frames.append(df)
+        if not frames:
+            return pd.DataFrame(columns=BAR_COLUMNS)
+        quotes = pd.concat(frames, ignore_index=True)
+        ticks = pd.DataFrame({
+            'ts_code': quotes['TS_CODE'],
+            'time': pd.to_datetime(quotes['DATE'].astype(str) + ' ' + quotes['TIME'].astype(str)),
+            'price': pd.to_numeric(quotes['PRICE'], errors='coerce'),
+            'volume': pd.to_numeric(quotes['VOLUME'], errors='coerce'),
+            'amount': pd.to_numeric(quotes['AMOUNT'], errors='coerce'),
+        })
+        return self.aggregator.update(ticks)
+
+
+class FakeMinuteSource:
+    """本地 fake：对任意股票生成可复现的随机游走行情，时钟可注入；不受交易时段限制"""
+    trading_hours_only = False
+
+    def __init__(self, seed: int = 0, clock: Callable[[], datetime] = datetime.now):
+        self.clock = clock
+        self.rng = np.random.default_rng(seed)
+        self.aggregator = MinuteBarAggregator()
+        self._prices: Dict[str, float] = {}
+        self._volumes: Dict[str, Tuple[float, float]] = {}
+        self.calls = 0
+
+    def fetch(self, codes: Sequence[str]) -> pd.DataFrame:
+        self.calls += 1
+        now = self.clock()
+        for code in codes:
+            if code not in self._prices:
+                self._prices[code] = float(self.rng.uniform(5, 50))
+                self._volumes[code] = (0.0, 0.0)
+        prices = np.array([self._prices[code] for code in codes])
+        prices *= np.exp(self.rng.normal(0, 0.001, len(codes)))
+        traded = self.rng.integers(1, 100, len(codes)) * 100.0
+        ticks = []
+        for code, price, shares in zip(codes, prices, traded):
+            volume, amount = self._volumes[code]
+            self._prices[code] = price
+            self._volumes[code] = (volume + shares, amount + shares * price)
+            ticks.append((code, now, price, *self._volumes[code]))
+        return self.aggregator.update(pd.DataFrame(ticks, columns=['ts_code', 'time', 'price',
+                                                                   'volume', 'amount']))
+
+
+def create_minute_source() -> MinuteBarSource:
+    if settings.INTRADAY_SOURCE == "tushare":
+        return TushareQuoteSource()
+    if settings.INTRADAY_SOURCE == "fake":
+        return FakeMinuteSource()
+    raise ValueError(f"Unknown intraday source '{settings.INTRADAY_SOURCE}'")
+
+
+class MinuteRingBuffer:
+    """最近 capacity 分钟的分钟线，预分配为 字段 × 股票 × 分钟槽 的数组
+
+    所有股票共用时间轴：每个槽对应一分钟，新的一分钟覆盖最旧的槽。
+    dirty 标记尚未落库的槽，覆盖未落库的槽时计入 dropped_minutes。
+    """
+
+    def __init__(self, capacity: int, codes: Sequence[str] = ()):
+        self.capacity = capacity
+        self.codes: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self.times = np.full(capacity, _NAT, dtype='datetime64[m]')
+        self.dirty = np.zeros(capacity, dtype=bool)
+        self.values = np.full((len(BAR_FIELDS), 0, capacity), np.nan)
+        self.head = -1
+        self.dropped_minutes = 0
+        self._ensure_rows(codes)
+
+    def _ensure_rows(self, codes: Sequence[str]) -> np.ndarray:
+        new = [code for code in dict.fromkeys(codes) if code not in self._rows]
+        if new:
+            for code in new:
+                self._rows[code] = len(self.codes)
+                self.codes.append(code)
+            grown = np.full((len(BAR_FIELDS), len(new), self.capacity), np.nan)
+            self.values = np.concatenate([self.values, grown], axis=1)
+        return np.array([self._rows[code] for code in codes], dtype=np.int64)
+
+    @property
+    def latest(self) -> Optional[np.datetime64]:
+        return None if self.head < 0 else self.times[self.head]
+
+    def _slot_for(self, minute: np.datetime64) -> Optional[int]:
+        if self.head >= 0 and minute <= self.times[self.head]:
+            match = np.flatnonzero(self.times == minute)
+            # 已滚出缓冲或中间缺失的分钟不再写入
+            return int(match[0]) if len(match) else None
+        self.head = (self.head + 1) % self.capacity
+        if self.dirty[self.head]:
+            self.dropped_minutes += 1
+            logger.warning(f"Intraday buffer overwrote unflushed minute {self.times[self.head]}")
+        self.times[self.head] = minute
+        self.values[:, :, self.head] = np.nan
+        return self.head
+
+    def write(self, bars: pd.DataFrame) -> int:
+        """写入（或更新）分钟线，返回写入的K线数"""
+        if bars is None or bars.empty:
+            return 0
+        rows = self._ensure_rows(bars['ts_code'].tolist())
+        minutes = bars['trade_time'].to_numpy(dtype='datetime64[m]')
+        values = bars[list(BAR_FIELDS)].to_numpy(dtype=float)
+        written = 0
+        for minute in np.unique(minutes):
+            slot = self._slot_for(minute)
+            if slot is None:
+                continue
+            mask = minutes == minute
+            self.values[:, rows[mask], slot] = values[mask].T
+            self.dirty[slot] = True
+            written += int(mask.sum())
+        return written
+
+    def _recent_slots(self, minutes: int) -> np.ndarray:
+        if self.head < 0:
+            return np.array([], dtype=np.int64)
+        filled = int((~np.isnat(self.times)).sum())
+        count = min(minutes, filled)
+        return (self.head - np.arange(count)[::-1]) % self.capacity
+
+    def recent(self, codes: Sequence[str], minutes: int,
+               fields: Sequence[str] = BAR_FIELDS) -> Tuple[np.ndarray, List[str], np.ndarray]:
+        """最近 minutes 分钟：返回 (时间, 存在的股票, 数组[字段, 股票, 分钟])"""
+        slots = self._recent_slots(minutes)
+        known = [code for code in codes if code in self._rows]
+        rows = np.array([self._rows[code] for code in known], dtype=np.int64)
+        field_index = [BAR_FIELDS.index(name) for name in fields]
+        data = self.values[np.ix_(field_index, rows, slots)]
+        return self.times[slots], known, data
+
+    def take_dirty(self, include_latest: bool = False) -> Tuple[np.ndarray, pd.DataFrame]:
+        """取出未落库的分钟（默认不含仍在更新的最新一分钟）并清除标记"""
+        dirty = self.dirty.copy()
+        if not include_latest and self.head >= 0:
+            dirty[self.head] = False
+        slots = np.flatnonzero(dirty)
+        if not len(slots):
+            return slots, pd.DataFrame(columns=['stock_code', 'trade_time', *BAR_FIELDS])
+        block = self.values[:, :, slots]
+        rows, cols = np.nonzero(~np.isnan(block[BAR_FIELDS.index('close')]))
+        frame = pd.DataFrame({
+            'stock_code': np.array(self.codes, dtype=object)[rows],
+            'trade_time': self.times[slots][cols].astype('datetime64[s]').astype(object),
+            **{name: block[i, rows, cols] for i, name in enumerate(BAR_FIELDS)},
+        })
+        self.dirty[slots] = False
+        return slots, frame
+
+    def mark_dirty(self, slots: np.ndarray) -> None:
+        self.dirty[slots] = True
+
+
+class IntradayService:
+    """盘中分钟线：轮询数据源写入内存环形缓冲，定时把已完成的分钟批量写入 intraday_bars
+
+    "最近 N 分钟" 的查询直接读内存，不访问数据库。所有对上游实时行情的调用都经过 poll：
+    串行执行（聚合器状态不是线程安全的），并共用一个每分钟调用配额。
+    """
+
+    def __init__(self, source: Optional[MinuteBarSource] = None,
+                 session_factory: Optional[async_sessionmaker] = None,
+                 capacity: Optional[int] = None):
+        self.source = source or create_minute_source()
+        self.session_factory = session_factory
+        self.buffer = MinuteRingBuffer(capacity or settings.INTRADAY_BUFFER_MINUTES)
+        self._universe: Optional[List[str]] = None
+        self._universe_date: Optional[str] = None
+        # 每次轮询得到的最新K线推送给监听者（如行情推送）
+        self._listeners: List[Callable[[pd.DataFrame], None]] = []
+        self._poll_lock = asyncio.Lock()
+        self.limiter = TokenBucketRateLimiter(settings.INTRADAY_QUOTE_CALLS_PER_MINUTE, name='realtime_quote')
+
+    def add_listener(self, listener: Callable[[pd.DataFrame], None]) -> None:
+        self._listeners.append(listener)
+
+    async def universe(self) -> List[str]:
+        """轮询的股票池，每个自然日从 stock_basic 重新读取一次"""
+        today = datetime.now().strftime('%Y%m%d')
+        if self._universe is None or self._universe_date != today:
+            async with session_scope(self.session_factory) as db:
+                self._universe = list((await db.execute(
+                    select(Stock.ts_code).order_by(Stock.ts_code))).scalars().all())
+            self._universe_date = today
+        return self._universe
+
+    async def poll(self, codes: Optional[Sequence[str]] = None) -> int:
+        """拉取一次最新分钟线（默认全市场，可只拉取指定股票），返回写入缓冲的K线数"""
+        async with self._poll_lock:
+            codes = list(codes) if codes is not None else await self.universe()
+            if not codes:
+                return 0
+            # 按本次的调用次数预先取得配额
+            batch_size = getattr(self.source, 'batch_size', settings.INTRADAY_QUOTE_BATCH)
+            for _ in range(math.ceil(len(codes) / batch_size)):
+                await self.limiter.acquire()
+            bars = await asyncio.to_thread(self.source.fetch, codes)
+            written = self.buffer.write(bars)
+        for listener in self._listeners:
+            try:
+                listener(bars)
+            except Exception as e:
+                logger.error(f"Intraday listener failed: {str(e)}")
+        return written
+
+    async def poll_live(self, codes: Optional[Sequence[str]] = None) -> int:
+        """只在连续竞价时段内轮询；数据源 trading_hours_only=False 时不受限制"""
+        if not getattr(self.source, 'trading_hours_only', True) or in_trading_session(datetime.now()):
+            return await self.poll(codes)
+        return 0
+
+    async def flush(self, force: bool = False) -> int:
+        """批量写入已完成的分钟；force=True 时连同最新一分钟（收盘后使用）"""
+        slots, frame = self.buffer.take_dirty(include_latest=force)
+        if frame.empty:
+            return 0
+        try:
+            async with session_scope(self.session_factory) as db:
+                await db.run_sync(self._write, frame)
+                with DB_COMMIT_SECONDS.time(operation='intraday'):
+                    await db.commit()
+        except Exception:
+            # 写入失败时保留标记，下次重试
+            self.buffer.mark_dirty(slots)
+            raise
+        track_rows(len(frame))
+        logger.info(f"Flushed {len(frame)} intraday bars over {len(slots)} minutes")
+        return len(frame)
+
+    def _write(self, db: Session, frame: pd.DataFrame) -> None:
+        stmt = dialect_insert(db)(IntradayBar.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['stock_code', 'trade_time'],
+            set_={name: stmt.excluded[name] for name in BAR_FIELDS}
+        )
+        records = frame.to_dict('records')
+        for start in range(0, len(records), settings.UPSERT_CHUNK_SIZE):
+            db.execute(stmt, records[start:start + settings.UPSERT_CHUNK_SIZE])
+
+    def recent(self, codes: Sequence[str], minutes: int = 30,
+               fields: Optional[Sequence[str]] = None) -> Dict:
+        """从内存读取最近 minutes 分钟的分钟线，缺失值为 None"""
+        fields = list(fields or BAR_FIELDS)
+        unknown = [name for name in fields if name not in BAR_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown intraday fields: {unknown}")
+        times, known, data = self.buffer.recent(codes, minutes, fields)
+        data = np.where(np.isnan(data), None, np.round(data, 4))
+        return {
+            'times': [str(t) for t in times],
+            'bars': {code: {name: data[i, j].tolist() for i, name in enumerate(fields)}
+                     for j, code in enumerate(known)},
+        }
+
+
+_intraday_service: Optional[IntradayService] = None
+
+
+def get_intraday_service() -> IntradayService:
+    """进程内共享的分钟线服务（调度任务与接口读取同一缓冲）"""
+    global _intraday_service
+    if _intraday_service is None:
+        _intraday_service = IntradayService()
+    return _intraday_service
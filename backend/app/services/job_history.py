@@ -0,0 +1,92 @@
+# app/services/job_history.py
+import logging
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.core.database import session_scope
+from app.core.metrics import DB_COMMIT_SECONDS
+from app.models.stock import JobRun
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class JobCounters:
+    """一次任务执行中累计的写入行数与接口调用次数"""
+    rows: int = 0
+    api_calls: int = 0
+
+
+# 当前任务的计数器；asyncio 任务与 to_thread / 复制了上下文的线程共享同一对象
+_current_counters: ContextVar[Optional[JobCounters]] = ContextVar('job_counters', default=None)
+
+
+def track_rows(count: int) -> None:
+    counters = _current_counters.get()
+    if counters is not None:
+        counters.rows += count
+
+
+def track_api_call(count: int = 1) -> None:
+    counters = _current_counters.get()
+    if counters is not None:
+        counters.api_calls += count
+
+
+def start_counting() -> JobCounters:
+    """在当前上下文中开始计数（每个调度任务运行在独立的 asyncio 任务中）"""
+    counters = JobCounters()
+    _current_counters.set(counters)
+    return counters
+
+
+class JobHistoryService:
+    """job_runs 表的读写"""
+
+    def __init__(self, session_factory: Optional[async_sessionmaker] = None):
+        self.session_factory = session_factory
+
+    async def record(self, job_id: str, status: str, started_at: datetime,
+                     finished_at: Optional[datetime] = None,
+                     counters: Optional[JobCounters] = None,
+                     error: Optional[str] = None) -> None:
+        counters = counters or JobCounters()
+        duration = (finished_at - started_at).total_seconds() if finished_at else None
+        try:
+            async with session_scope(self.session_factory) as db:
+                db.add(JobRun(job_id=job_id, status=status, started_at=started_at,
+                              finished_at=finished_at, duration=duration,
+                              rows=counters.rows, api_calls=counters.api_calls,
+                              error=error[:2000] if error else None))
+                with DB_COMMIT_SECONDS.time(operation='job_runs'):
+                    await db.commit()
+        except Exception as e:
+            # 记录失败不影响任务本身
+            logger.error(f"Failed to record job run {job_id}: {str(e)}")
+
+    async def recent(self, job_id: Optional[str] = None, status: Optional[str] = None,
+                     limit: int = 50) -> List[Dict]:
+        """按开始时间倒序返回最近的执行记录"""
+        query = select(JobRun).order_by(JobRun.started_at.desc(), JobRun.id.desc()).limit(limit)
+        if job_id:
+            query = query.where(JobRun.job_id == job_id)
+        if status:
+            query = query.where(JobRun.status == status)
+        async with session_scope(self.session_factory) as db:
+            runs = (await db.execute(query)).scalars().all()
+        return [{
+            'id': run.id,
+            'job_id': run.job_id,
+            'status': run.status,
+            'started_at': run.started_at.isoformat(),
+            'finished_at': run.finished_at.isoformat() if run.finished_at else None,
+            'duration': run.duration,
+            'rows': run.rows,
+            'api_calls': run.api_calls,
+            'error': run.error,
+        } for run in runs]
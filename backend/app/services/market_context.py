@@ -0,0 +1,235 @@
+# app/services/market_context.py
+import asyncio
+import logging
+import math
+import warnings
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import exists, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import Session
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.database import session_scope
+from app.core.metrics import DB_COMMIT_SECONDS
+from app.models import Stock
+from app.models.stock import MarketContext
+from app.services.bulk_upsert import dialect_insert
+from app.services.columnar_store import ColumnarStore, get_columnar_store
+
+logger = logging.getLogger(__name__)
+
+RETURN_WINDOWS = (1, 5, 20, 60)
+VOLATILITY_WINDOW = 20
+VOLUME_WINDOW = 20
+# 量比超出该区间视为成交量异常
+VOLUME_SPIKE, VOLUME_DRY = 2.0, 0.5
+# 计算特征所需的历史交易日数
+LOOKBACK = max(RETURN_WINDOWS) + 1
+# 缓存中表示“该股票在该交易日没有摘要”的值
+_NO_SUMMARY = ''
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中文等宽字符约 1 token/字，其余约 4 字符/token"""
+    wide = sum(1 for ch in text if ord(ch) > 0x2E80)
+    return wide + math.ceil((len(text) - wide) / 4)
+
+
+def _pct(value: float) -> str:
+    return '-' if value is None or np.isnan(value) else f"{value:+.1%}"
+
+
+def compute_features(store: ColumnarStore, position: int,
+                     reference: Dict[str, Tuple[str, str]]) -> pd.DataFrame:
+    """以 position 对应交易日为截面，对全市场一次性计算摘要特征（只含当日有行情的股票）"""
+    lo = max(position + 1 - LOOKBACK, 0)
+    window = slice(lo, position + 1)
+    codes = store.codes
+    # 停牌日向前填充，收益按最近成交价计算
+    close = pd.DataFrame(np.asarray(store['close'][:, window]).T).ffill().to_numpy().T
+    raw_close = np.asarray(store['close'][:, position])
+    volume = np.asarray(store['volume'][:, window])
+    last = close[:, -1]
+
+    features = pd.DataFrame(index=pd.Index(codes, name='stock_code'))
+    features['name'] = [reference.get(code, ('', ''))[0] for code in codes]
+    features['industry'] = [reference.get(code, ('', ''))[1] or '' for code in codes]
+    features['close'] = last
+    with np.errstate(invalid='ignore', divide='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        for k in RETURN_WINDOWS:
+            base = close[:, -k - 1] if close.shape[1] > k else np.full(len(codes), np.nan)
+            features[f'ret_{k}d'] = last / base - 1.0
+        daily = close[:, 1:] / close[:, :-1] - 1.0
+        recent = daily[:, -VOLATILITY_WINDOW:]
+        features['volatility'] = np.where(
+            np.sum(~np.isnan(recent), axis=1) >= VOLATILITY_WINDOW // 2,
+            np.nanstd(recent, axis=1) * np.sqrt(252), np.nan)
+        features['volume_ratio'] = volume[:, -1] / np.nanmean(volume[:, -VOLUME_WINDOW - 1:-1], axis=1)
+        for w in (20, 60):
+            ma = np.nanmean(close[:, -w:], axis=1) if close.shape[1] >= w else np.full(len(codes), np.nan)
+            features[f'ma{w}_gap'] = last / ma - 1.0
+    features['rsi14'] = np.asarray(store['rsi14'][:, position]) if 'rsi14' in store else np.nan
+
+    features = features[~np.isnan(raw_close) & features.index.isin(list(reference))]
+    ranked = features[features['industry'] != '']
+    features['industry_rank'] = ranked.groupby('industry')['ret_20d'].rank(ascending=False, method='min')
+    features['industry_size'] = ranked.groupby('industry')['ret_20d'].transform('count')
+    return features
+
+
+def render_summary(code: str, row: pd.Series, trade_date: str, budget: int) -> Tuple[str, int]:
+    """按优先级拼接摘要各行，超出 token 预算的行不再加入"""
+    date = f"{trade_date[:4]}-{trade_date[4:6]}-{trade_date[6:]}"
+    lines = [f"{row['name'] or code}({code}) {row['industry'] or '未知行业'} | {date} 收盘 {row['close']:.2f}"]
+    lines.append("涨跌幅: " + " ".join(f"{k}日 {_pct(row[f'ret_{k}d'])}" for k in RETURN_WINDOWS))
+
+    volume_note = ''
+    if not np.isnan(row['volume_ratio']):
+        if row['volume_ratio'] >= VOLUME_SPIKE:
+            volume_note = '（放量）'
+        elif row['volume_ratio'] <= VOLUME_DRY:
+            volume_note = '（缩量）'
+    ratio = '-' if np.isnan(row['volume_ratio']) else f"{row['volume_ratio']:.2f}"
+    volatility = '-' if np.isnan(row['volatility']) else f"{row['volatility']:.1%}"
+    lines.append(f"20日年化波动率 {volatility}；量比 {ratio}{volume_note}")
+
+    if not np.isnan(row.get('industry_rank', np.nan)):
+        lines.append(f"行业内20日涨幅排名: {int(row['industry_rank'])}/{int(row['industry_size'])}")
+    lines.append(f"相对均线: MA20 {_pct(row['ma20_gap'])}，MA60 {_pct(row['ma60_gap'])}"
+                 + ('' if np.isnan(row['rsi14']) else f"；RSI14 {row['rsi14']:.0f}"))
+
+    text, tokens = '', 0
+    for line in lines:
+        candidate = f"{text}\n{line}" if text else line
+        cost = estimate_tokens(candidate)
+        if text and cost > budget:
+            break
+        text, tokens = candidate, cost
+    return text, tokens
+
+
+class MarketContextBuilder:
+    """AI 分析用的行情摘要
+
+    夜间入库后对最新交易日的全市场批量生成摘要（收益、波动率、量能异常、行业排名），
+    按 (股票, 交易日) 写入 market_context 表并缓存在内存中；分析请求只取一段短文本。
+    """
+
+    def __init__(self, store: Optional[ColumnarStore] = None,
+                 session_factory: Optional[async_sessionmaker] = None,
+                 token_budget: Optional[int] = None):
+        self._store = store
+        self.session_factory = session_factory
+        self.token_budget = token_budget or settings.AI_CONTEXT_TOKEN_BUDGET
+        self.cache = TTLCache(maxsize=settings.REFERENCE_CACHE_SIZE, ttl=settings.REFERENCE_CACHE_TTL)
+        self._date_locks: Dict[str, asyncio.Lock] = {}
+
+    @property
+    def store(self) -> ColumnarStore:
+        if self._store is None:
+            self._store = get_columnar_store()
+        return self._store
+
+    def _resolve_date(self, trade_date: Optional[str]) -> Optional[str]:
+        """不晚于 trade_date 的最近交易日（默认最新）"""
+        store = self.store
+        store.refresh()
+        dates = store.dates
+        position = len(dates) if trade_date is None else int(np.searchsorted(dates, trade_date, side='right'))
+        return dates[position - 1] if position > 0 else None
+
+    async def precompute(self, trade_date: Optional[str] = None) -> int:
+        """为交易日生成全市场摘要并保存，返回生成数量"""
+        trade_date = self._resolve_date(trade_date)
+        if trade_date is None or 'close' not in self.store:
+            return 0
+        async with session_scope(self.session_factory) as db:
+            reference = {code: (name, industry) for code, name, industry in (await db.execute(
+                select(Stock.ts_code, Stock.name, Stock.industry))).all()}
+        summaries = await asyncio.to_thread(self._build, trade_date, reference)
+        async with session_scope(self.session_factory) as db:
+            await db.run_sync(self._store_summaries, trade_date, summaries)
+            with DB_COMMIT_SECONDS.time(operation='market_context'):
+                await db.commit()
+        for code, (text, _) in summaries.items():
+            self.cache.set((code, trade_date), text)
+        logger.info(f"Precomputed market context for {len(summaries)} stocks on {trade_date}")
+        return len(summaries)
+
+    def _build(self, trade_date: str, reference: Dict[str, Tuple[str, str]]) -> Dict[str, Tuple[str, int]]:
+        position = self.store.dates.index(trade_date)
+        features = compute_features(self.store, position, reference)
+        return {code: render_summary(code, row, trade_date, self.token_budget)
+                for code, row in features.iterrows()}
+
+    def _store_summaries(self, db: Session, trade_date: str,
+                         summaries: Dict[str, Tuple[str, int]]) -> None:
+        if summaries:
+            stmt = dialect_insert(db)(MarketContext.__table__)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['stock_code', 'trade_date'],
+                set_={'summary': stmt.excluded.summary, 'tokens': stmt.excluded.tokens}
+            )
+            db.execute(stmt, [{'stock_code': code, 'trade_date': trade_date,
+                               'summary': text, 'tokens': tokens}
+                              for code, (text, tokens) in summaries.items()])
+        # 只保留最近若干个交易日
+        dates = self.store.dates
+        position = dates.index(trade_date)
+        if position >= settings.AI_CONTEXT_RETENTION_DAYS:
+            cutoff = dates[position - settings.AI_CONTEXT_RETENTION_DAYS]
+            db.execute(MarketContext.__table__.delete().where(MarketContext.trade_date < cutoff))
+
+    async def get(self, stock_code: str, trade_date: Optional[str] = None) -> Optional[str]:
+        """读取摘要：内存缓存 -> market_context 表 -> 现场生成该交易日的全市场摘要
+
+        只有该交易日在表中还没有任何摘要时才现场生成；没有摘要的 (股票, 交易日) 也会缓存，
+        不在 stock_basic 中或当日无行情的股票不会反复触发查询。
+        """
+        trade_date = self._resolve_date(trade_date)
+        if trade_date is None:
+            return None
+        key = (stock_code, trade_date)
+        summary = self.cache.get(key)
+        if summary is None:
+            summary = await self._load(stock_code, trade_date)
+            if summary is None:
+                # 同一交易日的并发未命中只生成一次
+                lock = self._date_locks.setdefault(trade_date, asyncio.Lock())
+                async with lock:
+                    summary = self.cache.get(key)
+                    if summary is None and not await self._date_exists(trade_date):
+                        await self.precompute(trade_date)
+                        summary = self.cache.get(key)
+                self._date_locks.pop(trade_date, None)
+            self.cache.set(key, summary or _NO_SUMMARY)
+        return summary or None
+
+    async def _load(self, stock_code: str, trade_date: str) -> Optional[str]:
+        async with session_scope(self.session_factory) as db:
+            return (await db.execute(
+                select(MarketContext.summary).where(MarketContext.stock_code == stock_code,
+                                                    MarketContext.trade_date == trade_date)
+            )).scalar_one_or_none()
+
+    async def _date_exists(self, trade_date: str) -> bool:
+        async with session_scope(self.session_factory) as db:
+            return bool((await db.execute(
+                select(exists().where(MarketContext.trade_date == trade_date))
+            )).scalar())
+
+
+_builder: Optional[MarketContextBuilder] = None
+
+
+def get_market_context_builder() -> MarketContextBuilder:
+    """进程内共享的摘要生成器实例"""
+    global _builder
+    if _builder is None:
+        _builder = MarketContextBuilder()
+    return _builder
@@ -0,0 +1,247 @@
+# app/services/quote_broker.py
+import asyncio
+import itertools
+import logging
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+import numpy as np
+import orjson
+import pandas as pd
+
+from app.core.config import settings
+from app.core.metrics import QUOTE_CONFLATED, QUOTE_DROPPED, QUOTE_MESSAGES, QUOTE_SUBSCRIBERS
+from app.services.intraday import get_intraday_service
+
+logger = logging.getLogger(__name__)
+
+# 推送的每条行情为数组：[代码, 时间(HH:MM), 开, 高, 低, 收, 成交量, 成交额]
+QUOTE_FIELDS = ['code', 'time', 'open', 'high', 'low', 'close', 'volume', 'amount']
+
+SendFunc = Callable[[str], Awaitable[None]]
+CloseFunc = Callable[[int, str], Awaitable[None]]
+
+
+class Subscriber:
+    """一个推送连接：待发送的行情按代码合并，发送协程每次取走全部"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, send: SendFunc, close: CloseFunc):
+        self.id = next(self._ids)
+        self.send = send
+        self.close = close
+        self.codes: Set[str] = set()
+        self.pending: Dict[str, bytes] = {}
+        self.ready = asyncio.Event()
+        # 正在发送上一批时到达并被合并的推送次数
+        self.lagged_ticks = 0
+        self.sending = False
+        self.messages_sent = 0
+        self.task: Optional[asyncio.Task] = None
+        self.drop_reason: Optional[str] = None
+        self.closed = False
+
+
+class QuoteBroker:
+    """行情推送中心：一个上游轮询，按订阅分发增量
+
+    每次上游更新只编码一次发生变化的行情，再按 代码 -> 订阅者 的索引分发；
+    每个订阅者一次收到一批（一个 tick 一条消息）。发送慢的订阅者不会阻塞其他人：
+    未发送的行情按代码合并为最新值，发送超时或连续合并过多 tick 的连接被断开。
+    上游轮询只在有订阅者时运行，且只拉取被订阅的股票。
+    """
+
+    def __init__(self, poll: Optional[Callable[[List[str]], Awaitable]] = None,
+                 poll_interval: Optional[float] = None,
+                 send_timeout: Optional[float] = None,
+                 max_conflated_ticks: Optional[int] = None,
+                 max_codes: Optional[int] = None):
+        self.poll = poll
+        self.poll_interval = poll_interval or settings.QUOTE_POLL_SECONDS
+        self.send_timeout = send_timeout or settings.QUOTE_SEND_TIMEOUT
+        self.max_conflated_ticks = max_conflated_ticks or settings.QUOTE_MAX_CONFLATED_TICKS
+        self.max_codes = max_codes or settings.QUOTE_MAX_CODES_PER_SUBSCRIBER
+        self.subscribers: Set[Subscriber] = set()
+        self._by_code: Dict[str, Set[Subscriber]] = defaultdict(set)
+        self._last: Dict[str, tuple] = {}
+        self._encoded: Dict[str, bytes] = {}
+        self.seq = 0
+        self._feed: Optional[asyncio.Task] = None
+
+    # 连接管理
+
+    def connect(self, send: SendFunc, close: CloseFunc) -> Subscriber:
+        subscriber = Subscriber(send, close)
+        self.subscribers.add(subscriber)
+        subscriber.task = asyncio.create_task(self._sender(subscriber))
+        QUOTE_SUBSCRIBERS.inc()
+        self._ensure_feed()
+        return subscriber
+
+    async def disconnect(self, subscriber: Subscriber) -> None:
+        self._discard(subscriber)
+        if subscriber.task is not None and subscriber.task is not asyncio.current_task():
+            subscriber.task.cancel()
+            await asyncio.gather(subscriber.task, return_exceptions=True)
+
+    def _discard(self, subscriber: Subscriber) -> None:
+        # wait_for 在被取消的同时内部协程恰好完成时会吞掉取消，发送协程靠该标志退出
+        subscriber.closed = True
+        subscriber.ready.set()
+        if subscriber not in self.subscribers:
+            return
+        self.subscribers.discard(subscriber)
+        for code in subscriber.codes:
+            holders = self._by_code.get(code)
+            if holders is not None:
+                holders.discard(subscriber)
+                if not holders:
+                    del self._by_code[code]
+        QUOTE_SUBSCRIBERS.dec()
+
+    def _drop(self, subscriber: Subscriber, reason: str) -> None:
+        """断开慢消费者；关闭连接在其发送协程中完成"""
+        logger.warning(f"Dropping quote subscriber {subscriber.id}: {reason}")
+        QUOTE_DROPPED.inc(reason=reason)
+        subscriber.drop_reason = reason
+        self._discard(subscriber)
+        if subscriber.task is not None and subscriber.task is not asyncio.current_task():
+            subscriber.task.cancel()
+
+    def subscribe(self, subscriber: Subscriber, codes: Iterable[str]) -> List[str]:
+        """增加订阅，已有行情的代码立即推送一次快照；返回新增的代码"""
+        added = [code for code in dict.fromkeys(codes) if code not in subscriber.codes]
+        if len(subscriber.codes) + len(added) > self.max_codes:
+            raise ValueError(f"At most {self.max_codes} codes per subscriber")
+        for code in added:
+            subscriber.codes.add(code)
+            self._by_code[code].add(subscriber)
+            if code in self._encoded:
+                subscriber.pending[code] = self._encoded[code]
+        if subscriber.pending:
+            self._notify(subscriber)
+        return added
+
+    def unsubscribe(self, subscriber: Subscriber, codes: Iterable[str]) -> None:
+        for code in codes:
+            if code in subscriber.codes:
+                subscriber.codes.discard(code)
+                subscriber.pending.pop(code, None)
+                holders = self._by_code.get(code)
+                if holders is not None:
+                    holders.discard(subscriber)
+                    if not holders:
+                        del self._by_code[code]
+
+    # 分发
+
+    def publish(self, bars: pd.DataFrame) -> int:
+        """接收一次上游更新（分钟线格式），返回收到推送的订阅者数"""
+        if bars is None or bars.empty:
+            return 0
+        self.seq += 1
+        times = pd.to_datetime(bars['trade_time']).dt.strftime('%H:%M').tolist()
+        values = np.round(bars[QUOTE_FIELDS[2:]].to_numpy(dtype=float), 4).tolist()
+        touched: Set[Subscriber] = set()
+        for code, minute, row in zip(bars['ts_code'].tolist(), times, values):
+            quote = (minute, *row)
+            if self._last.get(code) == quote:
+                continue
+            self._last[code] = quote
+            # 每条变化的行情只编码一次，各订阅者共享
+            encoded = self._encoded[code] = orjson.dumps([code, *quote])
+            holders = self._by_code.get(code)
+            if holders:
+                for subscriber in holders:
+                    subscriber.pending[code] = encoded
+                touched.update(holders)
+        for subscriber in touched:
+            self._notify(subscriber)
+        return len(touched)
+
+    def _notify(self, subscriber: Subscriber) -> None:
+        if subscriber.ready.is_set():
+            # 上一批尚未取走：本次已合并进待发送的数据
+            QUOTE_CONFLATED.inc()
+            if subscriber.sending:
+                subscriber.lagged_ticks += 1
+                if subscriber.lagged_ticks > self.max_conflated_ticks:
+                    self._drop(subscriber, 'lagging')
+            return
+        if subscriber.sending:
+            subscriber.lagged_ticks += 1
+        subscriber.ready.set()
+
+    async def _sender(self, subscriber: Subscriber) -> None:
+        try:
+            while True:
+                await subscriber.ready.wait()
+                if subscriber.closed:
+                    return
+                batch, subscriber.pending = subscriber.pending, {}
+                subscriber.ready.clear()
+                if not batch:
+                    continue
+                payload = b'{"type":"quotes","seq":%d,"data":[%s]}' % (self.seq, b','.join(batch.values()))
+                subscriber.sending = True
+                try:
+                    await asyncio.wait_for(subscriber.send(payload.decode()), self.send_timeout)
+                except asyncio.TimeoutError:
+                    self._drop(subscriber, 'send_timeout')
+                    return
+                finally:
+                    subscriber.sending = False
+                subscriber.lagged_ticks = 0
+                subscriber.messages_sent += 1
+                QUOTE_MESSAGES.inc()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            # 连接已断开
+            logger.info(f"Quote subscriber {subscriber.id} send failed: {str(e)}")
+            self._discard(subscriber)
+        finally:
+            if subscriber.drop_reason is not None:
+                try:
+                    # 1013: Try Again Later
+                    await asyncio.wait_for(subscriber.close(1013, subscriber.drop_reason), 1.0)
+                except Exception:
+                    pass
+
+    # 上游轮询
+
+    def _ensure_feed(self) -> None:
+        if self.poll is not None and (self._feed is None or self._feed.done()):
+            self._feed = asyncio.create_task(self._run_feed())
+
+    async def _run_feed(self) -> None:
+        loop = asyncio.get_running_loop()
+        logger.info("Quote feed started")
+        while self.subscribers:
+            started = loop.time()
+            try:
+                codes = sorted(self._by_code)
+                if codes:
+                    await self.poll(codes)
+            except Exception as e:
+                logger.error(f"Quote feed poll failed: {str(e)}")
+            await asyncio.sleep(max(0.0, self.poll_interval - (loop.time() - started)))
+        logger.info("Quote feed stopped: no subscribers")
+
+
+_broker: Optional[QuoteBroker] = None
+
+
+def get_quote_broker() -> QuoteBroker:
+    """进程内共享的推送中心，由分钟线服务的轮询驱动
+
+    上游调用都经过分钟线服务的 poll（串行、共用调用配额）：定时任务每分钟轮询全市场，
+    推送在两次之间只刷新被订阅的股票，两者的结果都经监听器分发。
+    """
+    global _broker
+    if _broker is None:
+        intraday = get_intraday_service()
+        _broker = QuoteBroker(poll=intraday.poll_live)
+        intraday.add_listener(_broker.publish)
+    return _broker
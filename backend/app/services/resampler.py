@@ -0,0 +1,122 @@
+# app/services/resampler.py
+import logging
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.core.metrics import DB_COMMIT_SECONDS
+from app.models.stock import DailyData, MonthlyData, WeeklyData
+from app.services.bulk_upsert import DAILY_COLUMN_MAP, DAILY_VALUE_COLUMNS, dialect_insert
+
+logger = logging.getLogger(__name__)
+
+# 频率代码 -> 周期线模型
+PERIOD_MODELS = {'W': WeeklyData, 'M': MonthlyData}
+BAR_COLUMNS = ['period_start', 'trade_date', *DAILY_VALUE_COLUMNS, 'bar_count']
+# 单次 IN 查询的股票数，避免超过 SQLite 参数上限
+CODE_CHUNK = 500
+
+
+def period_keys(trade_dates: pd.Series, freq: str) -> np.ndarray:
+    """交易日所属周期的起始自然日（周一或每月1日），YYYYMMDD"""
+    dates = pd.to_datetime(trade_dates, format='%Y%m%d')
+    if freq == 'W':
+        starts = dates - pd.to_timedelta(dates.dt.weekday, unit='D')
+        return starts.dt.strftime('%Y%m%d').to_numpy()
+    if freq == 'M':
+        return dates.dt.strftime('%Y%m01').to_numpy()
+    raise ValueError(f"Unknown frequency '{freq}'")
+
+
+def resample_frame(daily: pd.DataFrame, freq: str) -> pd.DataFrame:
+    """将日线长表（stock_code, trade_date, OHLCV）聚合为周期线"""
+    if daily.empty:
+        return pd.DataFrame(columns=['stock_code', 'period', *BAR_COLUMNS])
+    daily = daily.sort_values(['stock_code', 'trade_date'], kind='mergesort')
+    daily = daily.assign(period=period_keys(daily['trade_date'], freq))
+    bars = daily.groupby(['stock_code', 'period'], sort=False).agg(
+        period_start=('trade_date', 'first'),
+        trade_date=('trade_date', 'last'),
+        open=('open', 'first'),
+        high=('high', 'max'),
+        low=('low', 'min'),
+        close=('close', 'last'),
+        volume=('volume', 'sum'),
+        amount=('amount', 'sum'),
+        bar_count=('trade_date', 'size'),
+    )
+    return bars.reset_index()
+
+
+class Resampler:
+    """从 daily_data 维护周线与月线
+
+    入库后只重算新数据涉及的 (股票, 周期)；rebuild 用于全量重建历史。
+    """
+
+    def __init__(self, frequencies: Sequence[str] = ('W', 'M')):
+        self.frequencies = list(frequencies)
+
+    def _load_daily(self, db: Session, stock_codes: Sequence[str],
+                    start_date: Optional[str] = None) -> pd.DataFrame:
+        query = select(DailyData.stock_code, DailyData.trade_date,
+                       *[getattr(DailyData, name) for name in DAILY_VALUE_COLUMNS]) \
+            .where(DailyData.stock_code.in_(list(stock_codes)))
+        if start_date:
+            query = query.where(DailyData.trade_date >= start_date)
+        return pd.read_sql(query, db.connection())
+
+    def _upsert(self, db: Session, freq: str, bars: pd.DataFrame) -> int:
+        if bars.empty:
+            return 0
+        table = PERIOD_MODELS[freq].__table__
+        stmt = dialect_insert(db)(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['stock_code', 'period'],
+            set_={**{col: stmt.excluded[col] for col in BAR_COLUMNS}, 'updated_at': func.now()}
+        )
+        records = bars[['stock_code', 'period', *BAR_COLUMNS]].astype(object)
+        records = records.where(records.notna(), None).to_dict('records')
+        db.execute(stmt, records)
+        return len(records)
+
+    def update_touched(self, db: Session, df: pd.DataFrame) -> Dict[str, int]:
+        """按新入库的 tushare 日线重算受影响的周期（不提交，与日线写入同一事务）"""
+        counts = {freq: 0 for freq in self.frequencies}
+        if df is None or df.empty:
+            return counts
+
+        touched = df[['ts_code', 'trade_date']].rename(columns=DAILY_COLUMN_MAP)
+        touched = touched.assign(trade_date=touched['trade_date'].astype(str))
+        codes = touched['stock_code'].unique().tolist()
+        for freq in self.frequencies:
+            keys = touched.assign(period=period_keys(touched['trade_date'], freq))[
+                ['stock_code', 'period']].drop_duplicates()
+            # 受影响的周期从最早的周期起始日开始重新读取日线
+            since = keys['period'].min()
+            for i in range(0, len(codes), CODE_CHUNK):
+                chunk = codes[i:i + CODE_CHUNK]
+                bars = resample_frame(self._load_daily(db, chunk, since), freq)
+                bars = bars.merge(keys, on=['stock_code', 'period'], how='inner')
+                counts[freq] += self._upsert(db, freq, bars)
+        logger.debug(f"Resampled touched periods: {counts}")
+        return counts
+
+    def rebuild(self, db: Session, frequencies: Optional[Sequence[str]] = None) -> Dict[str, int]:
+        """按全部历史日线重建周期线"""
+        frequencies = list(frequencies or self.frequencies)
+        codes = [code for (code,) in db.execute(select(DailyData.stock_code).distinct())]
+        counts = {freq: 0 for freq in frequencies}
+        for freq in frequencies:
+            db.execute(PERIOD_MODELS[freq].__table__.delete())
+        for i in range(0, len(codes), CODE_CHUNK):
+            daily = self._load_daily(db, codes[i:i + CODE_CHUNK])
+            for freq in frequencies:
+                counts[freq] += self._upsert(db, freq, resample_frame(daily, freq))
+            with DB_COMMIT_SECONDS.time(operation='period_bars'):
+                db.commit()
+        logger.info(f"Rebuilt period bars for {len(codes)} stocks: {counts}")
+        return counts
@@ -0,0 +1,395 @@
+# app/services/screener.py
+import ast
+import asyncio
+import logging
+import operator
+import re
+import time
+import warnings
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.core.config import settings
+from app.core.database import session_scope
+from app.models import Stock
+from app.services.columnar_store import ColumnarStore, get_columnar_store
+
+logger = logging.getLogger(__name__)
+
+REFERENCE_FIELDS = ['symbol', 'name', 'area', 'industry', 'list_date']
+# 字符串字段，不能参与算术运算
+TEXT_FIELDS = frozenset(REFERENCE_FIELDS) | {'ts_code'}
+# tushare 字段名别名
+FIELD_ALIASES = {'vol': 'volume'}
+DEFAULT_OUTPUT_FIELDS = ['name', 'industry', 'close', 'pct_chg', 'volume', 'amount']
+# 窗口统计变量，如 avg_vol_20、max_high_60、min_close_5
+WINDOW_PATTERN = re.compile(r'^(avg|max|min)_([a-z0-9_]+?)_(\d+)$')
+MAX_EXPRESSION_LENGTH = 1000
+# 幂运算的指数必须是绝对值不超过该值的常量；数值常量（含折叠结果）的绝对值上限
+MAX_POWER_EXPONENT = 10
+MAX_CONSTANT = 1e15
+
+_BINARY_OPS = {
+    ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul,
+    ast.Div: operator.truediv, ast.Mod: operator.mod, ast.Pow: operator.pow,
+}
+_COMPARE_OPS = {
+    ast.Eq: operator.eq, ast.NotEq: operator.ne, ast.Lt: operator.lt,
+    ast.LtE: operator.le, ast.Gt: operator.gt, ast.GtE: operator.ge,
+}
+_FUNCTIONS: Dict[str, Callable] = {
+    'abs': np.abs,
+    'log': np.log,
+    'sqrt': np.sqrt,
+    'startswith': lambda values, prefix: np.array([str(v).startswith(prefix) for v in values]),
+    'contains': lambda values, sub: np.array([sub in str(v) for v in values]),
+}
+_ALLOWED_NODES = (
+    ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not, ast.USub, ast.UAdd,
+    ast.BinOp, ast.Compare, ast.In, ast.NotIn, ast.Name, ast.Load, ast.Constant,
+    ast.List, ast.Tuple, ast.Call, *_BINARY_OPS, *_COMPARE_OPS,
+)
+
+
+@lru_cache(maxsize=256)
+def parse_expression(expression: str) -> ast.Expression:
+    """解析并校验筛选表达式，只允许比较、算术、布尔运算与白名单函数"""
+    if len(expression) > MAX_EXPRESSION_LENGTH:
+        raise ValueError(f"Expression is longer than {MAX_EXPRESSION_LENGTH} characters")
+    try:
+        tree = ast.parse(expression.strip(), mode='eval')
+    except SyntaxError as e:
+        raise ValueError(f"Invalid expression: {e.msg}")
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES):
+            raise ValueError(f"Unsupported syntax in expression: {type(node).__name__}")
+        if isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.func.id not in _FUNCTIONS or node.keywords:
+                raise ValueError(f"Unsupported function; available: {sorted(_FUNCTIONS)}")
+        if isinstance(node, ast.Constant) and not isinstance(node.value, (int, float, str, bool)):
+            raise ValueError(f"Unsupported constant: {node.value!r}")
+    return _ConstantFolder().visit(tree)
+
+
+def _check_constant(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool) and abs(value) > MAX_CONSTANT:
+        raise ValueError(f"Numeric constants must be within ±{MAX_CONSTANT:g}")
+    return value
+
+
+class _ConstantFolder(ast.NodeTransformer):
+    """解析时折叠常量运算并限制规模，避免单个表达式在求值时耗尽 CPU 或内存
+
+    字符串、列表与字符串字段不参与算术；幂的指数必须是小常量；常量及折叠结果的绝对值有上限。
+    """
+
+    def visit_Constant(self, node: ast.Constant) -> ast.Constant:
+        _check_constant(node.value)
+        return node
+
+    def visit_UnaryOp(self, node: ast.UnaryOp) -> ast.AST:
+        self.generic_visit(node)
+        operand = node.operand
+        if isinstance(node.op, ast.Not) or not isinstance(operand, ast.Constant):
+            return node
+        if isinstance(operand.value, str):
+            raise ValueError("Arithmetic on string constants is not supported")
+        value = -operand.value if isinstance(node.op, ast.USub) else +operand.value
+        return ast.copy_location(ast.Constant(_check_constant(value)), node)
+
+    def visit_BinOp(self, node: ast.BinOp) -> ast.AST:
+        self.generic_visit(node)
+        left, right = node.left, node.right
+        for side in (left, right):
+            if isinstance(side, (ast.List, ast.Tuple)) or (
+                    isinstance(side, ast.Constant) and isinstance(side.value, str)) or (
+                    isinstance(side, ast.Name) and side.id in TEXT_FIELDS):
+                raise ValueError("Arithmetic on strings or lists is not supported")
+        if isinstance(node.op, ast.Pow) and not (
+                isinstance(right, ast.Constant) and abs(right.value) <= MAX_POWER_EXPONENT):
+            raise ValueError(f"Exponent must be a constant within ±{MAX_POWER_EXPONENT}")
+        if not (isinstance(left, ast.Constant) and isinstance(right, ast.Constant)):
+            return node
+        try:
+            value = _BINARY_OPS[type(node.op)](left.value, right.value)
+        except (ArithmeticError, ValueError) as e:
+            raise ValueError(f"Invalid constant arithmetic: {str(e)}")
+        return ast.copy_location(ast.Constant(_check_constant(value)), node)
+
+
+def _is_numeric(value) -> bool:
+    if isinstance(value, np.ndarray):
+        return value.dtype.kind in 'biuf'
+    return isinstance(value, (int, float, np.number))
+
+
+def evaluate_expression(tree: ast.Expression, resolve: Callable[[str], np.ndarray]):
+    """在按股票对齐的向量上求值，变量由 resolve 提供"""
+
+    def visit(node):
+        if isinstance(node, ast.Expression):
+            return visit(node.body)
+        if isinstance(node, ast.Constant):
+            return node.value
+        if isinstance(node, ast.Name):
+            if node.id in ('True', 'False'):
+                return node.id == 'True'
+            return resolve(node.id)
+        if isinstance(node, (ast.List, ast.Tuple)):
+            return [visit(item) for item in node.elts]
+        if isinstance(node, ast.BoolOp):
+            combine = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+            result = visit(node.values[0])
+            for value in node.values[1:]:
+                result = combine(result, visit(value))
+            return result
+        if isinstance(node, ast.UnaryOp):
+            operand = visit(node.operand)
+            if isinstance(node.op, ast.Not):
+                return np.logical_not(operand)
+            return -operand if isinstance(node.op, ast.USub) else operand
+        if isinstance(node, ast.BinOp):
+            left, right = visit(node.left), visit(node.right)
+            # 字符串数组的乘法会按股票数复制字符串，只允许数值运算
+            if not (_is_numeric(left) and _is_numeric(right)):
+                raise ValueError("Arithmetic is only supported on numeric fields")
+            return _BINARY_OPS[type(node.op)](left, right)
+        if isinstance(node, ast.Compare):
+            result, left = True, visit(node.left)
+            for op, comparator in zip(node.ops, node.comparators):
+                right = visit(comparator)
+                if isinstance(op, (ast.In, ast.NotIn)):
+                    if not isinstance(right, list):
+                        raise ValueError("'in' requires a list of constants")
+                    matched = np.isin(left, right)
+                    current = matched if isinstance(op, ast.In) else ~matched
+                else:
+                    current = _COMPARE_OPS[type(op)](left, right)
+                result = np.logical_and(result, current)
+                left = right
+            return result
+        if isinstance(node, ast.Call):
+            return _FUNCTIONS[node.func.id](*[visit(arg) for arg in node.args])
+        raise ValueError(f"Unsupported syntax in expression: {type(node).__name__}")
+
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        return visit(tree)
+
+
+@dataclass
+class MarketSnapshot:
+    """最近若干交易日的全市场行情与股票参考字段（内存常驻）"""
+    codes: np.ndarray
+    dates: List[str]
+    # 字段 -> 日期 × 股票 的连续数组，按日期取一行即为全市场截面
+    bars: Dict[str, np.ndarray]
+    reference: Dict[str, np.ndarray]
+    version: int
+
+    def cross_section(self, date: str) -> "CrossSection":
+        position = self.dates.index(date) if date in self.dates else -1
+        if position < 0:
+            raise ValueError(f"No market data for {date}")
+        return CrossSection(self, position)
+
+
+class CrossSection:
+    """某一交易日的截面变量解析器"""
+
+    def __init__(self, snapshot: MarketSnapshot, position: int):
+        self.snapshot = snapshot
+        self.position = position
+        self.date = snapshot.dates[position]
+        self._cache: Dict[str, np.ndarray] = {}
+
+    def __call__(self, name: str) -> np.ndarray:
+        if name not in self._cache:
+            self._cache[name] = self._resolve(name)
+        return self._cache[name]
+
+    def _bar_field(self, name: str) -> np.ndarray:
+        name = FIELD_ALIASES.get(name, name)
+        if name not in self.snapshot.bars:
+            raise ValueError(f"Unknown field '{name}'")
+        return self.snapshot.bars[name]
+
+    def _resolve(self, name: str) -> np.ndarray:
+        snapshot = self.snapshot
+        if name == 'ts_code':
+            return snapshot.codes
+        if name in snapshot.reference:
+            return snapshot.reference[name]
+        if name == 'prev_close':
+            if self.position == 0:
+                return np.full(len(snapshot.codes), np.nan)
+            return self._bar_field('close')[self.position - 1]
+        if name == 'pct_chg':
+            return (self('close') / self('prev_close') - 1.0) * 100.0
+        match = WINDOW_PATTERN.match(name)
+        if match and FIELD_ALIASES.get(match.group(2), match.group(2)) in snapshot.bars:
+            stat, field, window = match.group(1), match.group(2), int(match.group(3))
+            if window < 1 or window > self.position + 1:
+                raise ValueError(f"Window {window} exceeds the {self.position + 1} days "
+                                 f"available in the snapshot for {self.date}")
+            values = self._bar_field(field)[self.position + 1 - window:self.position + 1]
+            reducer = {'avg': np.nanmean, 'max': np.nanmax, 'min': np.nanmin}[stat]
+            # 整个窗口停牌时结果为 NaN，忽略 'Mean of empty slice' 告警
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)
+                return reducer(values, axis=0)
+        return self._bar_field(name)[self.position]
+
+
+class Screener:
+    """基于内存快照的截面选股
+
+    快照取列式存储最近 SCREENER_SNAPSHOT_DAYS 个交易日的 OHLCV 与指标字段，
+    按 日期 × 股票 复制到内存，并与 Stock 参考字段对齐；列式存储版本变化
+    （每次入库）或股票基础信息更新后重新加载。
+    """
+
+    def __init__(self, store: Optional[ColumnarStore] = None,
+                 session_factory: Optional[async_sessionmaker] = None,
+                 days: Optional[int] = None):
+        self._store = store
+        self.session_factory = session_factory
+        self.days = days or settings.SCREENER_SNAPSHOT_DAYS
+        self._snapshot: Optional[MarketSnapshot] = None
+        self._reference: Optional[Dict[str, Dict[str, str]]] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def store(self) -> ColumnarStore:
+        if self._store is None:
+            self._store = get_columnar_store()
+        return self._store
+
+    def invalidate_reference(self) -> None:
+        """股票基础信息变化后调用，下次查询时重新加载参考字段"""
+        self._reference = None
+        self._snapshot = None
+
+    async def refresh(self, force: bool = False) -> MarketSnapshot:
+        """列式存储有新数据时重新加载快照"""
+        store = self.store
+        store.refresh()
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == store.version and not force:
+            return snapshot
+        async with self._lock:
+            if (self._snapshot is not None and self._snapshot.version == store.version
+                    and not force):
+                return self._snapshot
+            if self._reference is None or force:
+                self._reference = await self._load_reference()
+            started = time.perf_counter()
+            self._snapshot = await asyncio.to_thread(self._load_bars, self._reference, None)
+            logger.info(f"Screener snapshot loaded: {len(self._snapshot.codes)} stocks x "
+                        f"{len(self._snapshot.dates)} days in {time.perf_counter() - started:.2f}s")
+            return self._snapshot
+
+    async def _load_reference(self) -> Dict[str, Dict[str, str]]:
+        async with session_scope(self.session_factory) as db:
+            rows = (await db.execute(
+                select(Stock.ts_code, *[getattr(Stock, name) for name in REFERENCE_FIELDS])
+            )).all()
+        return {row[0]: dict(zip(REFERENCE_FIELDS, row[1:])) for row in rows}
+
+    def _load_bars(self, reference: Dict[str, Dict[str, str]],
+                   end_date: Optional[str]) -> MarketSnapshot:
+        store = self.store
+        version = store.version
+        codes = store.codes
+        columns = store.date_slice(None, end_date)
+        columns = slice(max(columns.stop - self.days, 0), columns.stop)
+        dates = store.dates[columns]
+        bars = {}
+        for name in store.fields:
+            bars[name] = np.ascontiguousarray(store[name][:len(codes), columns].T)
+        # 缺失的参考字段记为空字符串，便于字符串比较
+        ref = {name: np.array([(reference.get(code) or {}).get(name) or '' for code in codes],
+                              dtype=object)
+               for name in REFERENCE_FIELDS}
+        return MarketSnapshot(codes=np.array(codes, dtype=object), dates=dates,
+                              bars=bars, reference=ref, version=version)
+
+    @staticmethod
+    def _evaluate(tree: ast.Expression, snapshot: MarketSnapshot, section: "CrossSection",
+                  fields: Optional[Sequence[str]], sort_by: Optional[str], descending: bool,
+                  limit: Optional[int]) -> tuple:
+        mask = np.broadcast_to(np.asarray(evaluate_expression(tree, section)), snapshot.codes.shape)
+        if mask.dtype != bool:
+            raise ValueError("Expression must evaluate to a boolean condition")
+        matched = np.nonzero(mask)[0]
+
+        if sort_by:
+            keys = np.asarray(section(sort_by))[matched]
+            if keys.dtype == object:
+                order = np.argsort(keys, kind='stable')
+            else:
+                # NaN 始终排在最后
+                order = np.argsort(-keys if descending else keys, kind='stable')
+            if descending and keys.dtype == object:
+                order = order[::-1]
+            matched = matched[order]
+        if limit is not None:
+            matched = matched[:limit]
+
+        fields = list(fields or DEFAULT_OUTPUT_FIELDS)
+        columns = {name: np.asarray(section(name))[matched] for name in fields}
+        items = []
+        for i, row in enumerate(matched):
+            item = {'ts_code': snapshot.codes[row]}
+            for name in fields:
+                value = columns[name][i]
+                if isinstance(value, (float, np.floating)):
+                    value = None if np.isnan(value) else float(value)
+                item[name] = value
+            items.append(item)
+        return int(mask.sum()), items
+
+    async def screen(self, expression: str,
+                     date: Optional[str] = None,
+                     fields: Optional[Sequence[str]] = None,
+                     sort_by: Optional[str] = None,
+                     descending: bool = True,
+                     limit: Optional[int] = 500) -> Dict:
+        """在 date（默认最新交易日）的全市场截面上筛选"""
+        tree = parse_expression(expression)
+        snapshot = await self.refresh()
+        if not snapshot.dates:
+            raise ValueError("No market data loaded")
+        started = time.perf_counter()
+        date = date or snapshot.dates[-1]
+        if date not in snapshot.dates:
+            if date not in self.store.dates:
+                raise ValueError(f"No market data for {date}")
+            # 快照之外的历史日期临时加载一个以该日结尾的窗口
+            snapshot = await asyncio.to_thread(self._load_bars, self._reference or {}, date)
+        section = snapshot.cross_section(date)
+        # 求值与排序是 CPU 密集的向量运算，放到线程中执行，不阻塞事件循环
+        total, items = await asyncio.to_thread(
+            self._evaluate, tree, snapshot, section, fields, sort_by, descending, limit)
+        return {
+            'date': date,
+            'expression': expression,
+            'total': total,
+            'items': items,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 2),
+        }
+
+
+_screener: Optional[Screener] = None
+
+
+def get_screener() -> Screener:
+    """进程内共享的选股器实例"""
+    global _screener
+    if _screener is None:
+        _screener = Screener()
+    return _screener
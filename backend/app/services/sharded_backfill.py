@@ -0,0 +1,325 @@
+# app/services/sharded_backfill.py
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from app.core.config import settings
+from app.core.rate_limiter import SharedRateLimiter
+from app.services.bulk_upsert import DAILY_COLUMN_MAP
+from app.services.ingest_pipeline import FetchUnit, FetchWritePipeline, RetryPolicy, fetch_daily
+from app.services.stock_service import StockService
+from app.services.tushare_client import MODE_OFF, CachingProApi, create_pro_api
+from app.services.watermark import WatermarkTracker
+
+logger = logging.getLogger(__name__)
+
+# 暂存文件的列与 tushare daily 一致，合并时直接交给日线写入流程
+STAGING_COLUMNS = list(DAILY_COLUMN_MAP)
+VALUE_COLUMNS = ['open', 'high', 'low', 'close', 'vol', 'amount']
+
+# 返回原始 pro_api 客户端的可序列化工厂（如 functools.partial），用于替换真实 tushare
+ApiFactory = Callable[[], object]
+
+
+def normalize_daily(df: Optional[pd.DataFrame], unit: FetchUnit) -> Tuple[pd.DataFrame, int]:
+    """统一列与类型并校验，返回 (有效行, 丢弃的行数)
+
+    丢弃不属于该单元（股票或日期超出范围）、收盘价缺失或非正、最高价低于最低价的行，
+    同一 (股票, 日期) 只保留最后一条。
+    """
+    if df is None or df.empty:
+        return pd.DataFrame(columns=STAGING_COLUMNS), 0
+    missing = [col for col in STAGING_COLUMNS if col not in df.columns]
+    if missing:
+        raise ValueError(f"Daily frame is missing columns: {missing}")
+
+    out = pd.DataFrame({
+        'ts_code': df['ts_code'].astype(str).to_numpy(),
+        'trade_date': df['trade_date'].astype(str).to_numpy(),
+        **{col: pd.to_numeric(df[col], errors='coerce').astype('float64').to_numpy()
+           for col in VALUE_COLUMNS},
+    })
+    valid = (
+        out['ts_code'].isin(unit.codes)
+        & out['trade_date'].str.fullmatch(r'\d{8}')
+        & (out['trade_date'] >= unit.start_date)
+        & (out['trade_date'] <= unit.end_date)
+        & (out['close'] > 0)
+        & ~(out['high'] < out['low'])
+    )
+    out = out[valid].drop_duplicates(subset=['ts_code', 'trade_date'], keep='last')
+    return out, int((~valid).sum())
+
+
+def split_units(units: Sequence[FetchUnit], shards: int) -> List[List[FetchUnit]]:
+    """把计划切成连续的若干段，同一批股票的相邻时间片落在同一分片"""
+    shards = max(1, min(shards, len(units)))
+    size, extra = divmod(len(units), shards)
+    parts, start = [], 0
+    for i in range(shards):
+        stop = start + size + (1 if i < extra else 0)
+        parts.append(list(units[start:stop]))
+        start = stop
+    return [part for part in parts if part]
+
+
+@dataclass
+class ShardSpec:
+    """一个工作进程的任务"""
+    index: int
+    units: List[FetchUnit]
+    staging_dir: str
+    flush_rows: int
+
+
+@dataclass
+class ShardResult:
+    """工作进程的运行结果"""
+    index: int
+    units_total: int = 0
+    units_done: int = 0
+    failed_units: List[FetchUnit] = field(default_factory=list)
+    api_calls: int = 0
+    rows_staged: int = 0
+    invalid_rows: int = 0
+    files: List[str] = field(default_factory=list)
+    elapsed: float = 0.0
+
+
+class ShardWorker:
+    """在工作进程中拉取一个分片：规范化、校验后按块排序写入 zstd 压缩的 Arrow 暂存文件"""
+
+    def __init__(self, spec: ShardSpec, api, limiter):
+        self.spec = spec
+        self.api = api
+        self.limiter = limiter
+        self.result = ShardResult(index=spec.index, units_total=len(spec.units))
+        self._buffer: List[pd.DataFrame] = []
+        self._buffered = 0
+
+    async def run(self) -> ShardResult:
+        pipeline = FetchWritePipeline(
+            fetch=lambda unit: fetch_daily(self.api, unit),
+            write=self._stage,
+            limiter=self.limiter,
+            concurrency=settings.FETCH_CONCURRENCY,
+            queue_size=settings.WRITE_QUEUE_SIZE,
+            retry=RetryPolicy(
+                max_attempts=settings.FETCH_UNIT_MAX_ATTEMPTS,
+                base_delay=settings.FETCH_RETRY_BASE_DELAY,
+                max_delay=settings.FETCH_RETRY_MAX_DELAY
+            )
+        )
+        outcome = await pipeline.run(self.spec.units)
+        await asyncio.to_thread(self._flush)
+        self.result.units_done = outcome.units_done
+        self.result.failed_units = outcome.failed_units
+        self.result.api_calls = outcome.api_calls
+        self.result.elapsed = outcome.elapsed
+        return self.result
+
+    async def _stage(self, unit: FetchUnit, df: Optional[pd.DataFrame]) -> int:
+        clean, invalid = normalize_daily(df, unit)
+        if invalid:
+            logger.warning(f"Dropped {invalid} invalid rows from batch {unit.describe()}")
+        self.result.invalid_rows += invalid
+        if not clean.empty:
+            self._buffer.append(clean)
+            self._buffered += len(clean)
+        if self._buffered >= self.spec.flush_rows:
+            await asyncio.to_thread(self._flush)
+        return len(clean)
+
+    def _flush(self) -> None:
+        if not self._buffer:
+            return
+        import pyarrow.feather as feather
+        frame = pd.concat(self._buffer, ignore_index=True)
+        self._buffer, self._buffered = [], 0
+        # 按主键排序，合并时顺序写入索引
+        frame = frame.sort_values(['ts_code', 'trade_date'], ignore_index=True)
+        path = Path(self.spec.staging_dir) / f"shard-{self.spec.index:03d}-{len(self.result.files):04d}.arrow"
+        tmp = path.with_name(path.name + '.tmp')
+        feather.write_feather(frame, tmp, compression='zstd')
+        os.replace(tmp, path)
+        self.result.files.append(str(path))
+        self.result.rows_staged += len(frame)
+
+
+# 工作进程内的共享状态，由 _init_worker 设置
+_worker_limiter: Optional[SharedRateLimiter] = None
+_worker_api_factory: Optional[ApiFactory] = None
+
+
+def _init_worker(limiter: SharedRateLimiter, api_factory: Optional[ApiFactory],
+                 log_level: int) -> None:
+    global _worker_limiter, _worker_api_factory
+    logging.basicConfig(level=log_level,
+                        format='%(asctime)s - %(processName)s - %(name)s - %(levelname)s - %(message)s')
+    _worker_limiter = limiter
+    _worker_api_factory = api_factory
+
+
+def _run_shard(spec: ShardSpec) -> ShardResult:
+    # 未指定工厂时使用真实 tushare（遵循 TUSHARE_CACHE_MODE，重跑时可命中响应缓存）
+    if _worker_api_factory is None:
+        api = create_pro_api()
+    else:
+        api = CachingProApi(_worker_api_factory(), mode=MODE_OFF)
+    return asyncio.run(ShardWorker(spec, api, _worker_limiter).run())
+
+
+class ShardedBackfill:
+    """多进程历史回补
+
+    主进程生成全市场拉取计划并切成若干分片；各工作进程（spawn）独立拉取、解析、规范化、
+    校验并写入暂存文件，所有进程共用一个跨进程限流器，总调用速率不超过配额。
+    全部分片完成后由主进程单一写入者逐个文件批量导入 daily_data（同时推进水位、
+    更新周期线与列式存储）。合并前先在暂存目录写入 manifest.json（暂存文件与失败的单元），
+    每合并一个文件即记录一次，合并中途出错时可据此知道哪些文件尚未导入；
+    全部成功且没有失败单元时删除暂存目录，否则保留以便排查。
+    """
+
+    def __init__(self, stock_service: Optional[StockService] = None,
+                 workers: Optional[int] = None,
+                 staging_dir: Optional[str] = None,
+                 api_factory: Optional[ApiFactory] = None,
+                 flush_rows: Optional[int] = None):
+        self.stock_service = stock_service or StockService()
+        self.workers = workers or settings.BACKFILL_WORKERS or os.cpu_count() or 1
+        self.staging_root = Path(staging_dir or settings.BACKFILL_STAGING_DIR)
+        self.api_factory = api_factory
+        self.flush_rows = flush_rows or settings.BACKFILL_FLUSH_ROWS
+
+    async def run(self, start_date: str, end_date: Optional[str] = None,
+                  codes: Optional[List[str]] = None, keep_staging: bool = False) -> Dict:
+        started = time.perf_counter()
+        end_date = end_date or datetime.now().strftime('%Y%m%d')
+        if codes is None:
+            codes = [stock['ts_code'] for stock in await self.stock_service.get_stock_list()]
+        if not codes:
+            raise ValueError("No stocks to backfill")
+        plan = await self.stock_service.plan_range(sorted(codes), start_date, end_date)
+
+        staging = self.staging_root / f"{start_date}-{end_date}-{datetime.now():%Y%m%d%H%M%S}"
+        staging.mkdir(parents=True, exist_ok=True)
+        specs = [ShardSpec(i, units, str(staging), self.flush_rows)
+                 for i, units in enumerate(split_units(plan.units, self.workers))]
+        logger.info(f"Sharded backfill {start_date}-{end_date}: {len(plan.units)} units "
+                    f"in {len(specs)} shards, staging in {staging}")
+
+        results = await self._fetch_shards(specs)
+        fetched = time.perf_counter()
+        files = [path for result in results for path in result.files]
+        failed = [unit for result in results for unit in result.failed_units]
+        manifest = {
+            'start_date': start_date,
+            'end_date': end_date,
+            'status': 'merging',
+            'files': files,
+            'merged_files': [],
+            'failed_units': [asdict(unit) for unit in failed],
+        }
+        self._write_manifest(staging, manifest)
+
+        def record(path: str) -> None:
+            manifest['merged_files'].append(path)
+            self._write_manifest(staging, manifest)
+
+        await self.stock_service._reserve_columnar_dates(plan.units)
+        tracker = WatermarkTracker(failed)
+        try:
+            rows_merged = await self.merge(files, tracker=tracker, on_merged=record)
+        except BaseException as e:
+            manifest.update(status='merge_failed', error=str(e)[:2000] or type(e).__name__)
+            self._write_manifest(staging, manifest)
+            logger.error(f"Sharded backfill merge failed after {len(manifest['merged_files'])}/"
+                         f"{len(files)} files, staging kept in {staging}: {str(e)}")
+            raise
+        merged = time.perf_counter()
+
+        await self.stock_service._refresh_derived(tracker.earliest_written)
+
+        summary = {
+            'start_date': start_date,
+            'end_date': end_date,
+            'stocks': len(codes),
+            'shards': len(specs),
+            'units_total': len(plan.units),
+            'units_done': sum(result.units_done for result in results),
+            'units_failed': len(failed),
+            'api_calls': sum(result.api_calls for result in results),
+            'rows_staged': sum(result.rows_staged for result in results),
+            'invalid_rows': sum(result.invalid_rows for result in results),
+            'rows_merged': rows_merged,
+            'fetch_seconds': round(fetched - started, 2),
+            'merge_seconds': round(merged - fetched, 2),
+            'staging_dir': str(staging),
+        }
+        if failed or keep_staging:
+            manifest.update(summary, status='merged')
+            self._write_manifest(staging, manifest)
+        else:
+            shutil.rmtree(staging, ignore_errors=True)
+            summary['staging_dir'] = None
+        logger.info(f"Sharded backfill finished: {summary}")
+        return summary
+
+    @staticmethod
+    def _write_manifest(staging: Path, manifest: Dict) -> None:
+        tmp = staging / 'manifest.json.tmp'
+        tmp.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding='utf-8')
+        os.replace(tmp, staging / 'manifest.json')
+
+    async def _fetch_shards(self, specs: List[ShardSpec]) -> List[ShardResult]:
+        if not specs:
+            return []
+        # spawn：工作进程不继承主进程的事件循环、线程与数据库连接
+        context = multiprocessing.get_context('spawn')
+        limiter = SharedRateLimiter(
+            settings.TUSHARE_CALLS_PER_MINUTE,
+            backoff=settings.RATE_LIMIT_BACKOFF,
+            min_fraction=settings.RATE_LIMIT_MIN_FRACTION,
+            context=context
+        )
+        loop = asyncio.get_running_loop()
+        with ProcessPoolExecutor(max_workers=len(specs), mp_context=context, initializer=_init_worker,
+                                 initargs=(limiter, self.api_factory, logging.getLogger().level)) as pool:
+            results = await asyncio.gather(*(loop.run_in_executor(pool, _run_shard, spec) for spec in specs))
+        for result in results:
+            logger.info(f"Shard {result.index}: {result.units_done}/{result.units_total} units, "
+                        f"{result.rows_staged} rows staged, {result.invalid_rows} invalid, "
+                        f"{len(result.failed_units)} failed, {result.elapsed:.1f}s")
+        return results
+
+    async def merge(self, paths: Sequence[str], failed: Sequence[FetchUnit] = (),
+                    on_merged: Optional[Callable[[str], None]] = None,
+                    tracker: Optional[WatermarkTracker] = None) -> int:
+        """单一写入者按文件批量导入暂存数据，返回写入行数；水位不越过失败的单元
+
+        每个文件提交后调用 on_merged(path)。tracker 默认按 failed 创建。
+        """
+        import pyarrow.feather as feather
+        if tracker is None:
+            tracker = WatermarkTracker(failed)
+        rows = 0
+        for path in paths:
+            df = await asyncio.to_thread(feather.read_feather, path)
+            if not df.empty:
+                stats = await self.stock_service._batch_update_daily_data(df, tracker=tracker)
+                rows += stats.rows
+                logger.info(f"Merged {path}: {stats.rows} rows")
+            if on_merged is not None:
+                on_merged(path)
+        return rows
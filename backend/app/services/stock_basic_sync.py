@@ -0,0 +1,86 @@
+# app/services/stock_basic_sync.py
+import logging
+import time
+from dataclasses import dataclass
+from typing import Dict
+
+import pandas as pd
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.models import Stock
+from app.services.bulk_upsert import dialect_insert
+
+logger = logging.getLogger(__name__)
+
+STOCK_BASIC_FIELDS = ['ts_code', 'symbol', 'name', 'area', 'industry', 'list_date']
+STOCK_VALUE_FIELDS = STOCK_BASIC_FIELDS[1:]
+
+
+@dataclass
+class SyncStats:
+    """一次股票基础信息同步的统计"""
+    fetched: int = 0
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def changed(self) -> int:
+        return self.inserted + self.updated
+
+    def summary(self) -> Dict:
+        return {
+            'fetched': self.fetched,
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'unchanged': self.unchanged,
+            'elapsed': round(self.elapsed, 3),
+        }
+
+
+def row_hashes(df: pd.DataFrame) -> pd.Series:
+    """按 ts_code 索引的行哈希，空值与空字符串视为相同"""
+    values = df[STOCK_VALUE_FIELDS].astype(object).where(df[STOCK_VALUE_FIELDS].notna(), '')
+    values = values.astype(str)
+    return pd.Series(pd.util.hash_pandas_object(values, index=False).to_numpy(),
+                     index=df['ts_code'].to_numpy())
+
+
+class StockBasicSync:
+    """全市场 stock_basic 同步：一次读取现有数据，按行哈希比较，只批量写入变化的行"""
+
+    def apply(self, db: Session, fetched: pd.DataFrame) -> SyncStats:
+        """写入变化（同步会话，经 run_sync 调用，不提交）"""
+        started = time.perf_counter()
+        stats = SyncStats()
+        if fetched is None or fetched.empty:
+            return stats
+        fetched = fetched[STOCK_BASIC_FIELDS].drop_duplicates('ts_code', keep='last')
+        stats.fetched = len(fetched)
+
+        existing = pd.read_sql(
+            select(*[getattr(Stock, name) for name in STOCK_BASIC_FIELDS]), db.connection()
+        )
+        new_hashes = row_hashes(fetched)
+        old_hashes = row_hashes(existing).reindex(new_hashes.index)
+        is_new = old_hashes.isna().to_numpy()
+        is_changed = ~is_new & (old_hashes.to_numpy() != new_hashes.to_numpy())
+        stats.inserted = int(is_new.sum())
+        stats.updated = int(is_changed.sum())
+        stats.unchanged = stats.fetched - stats.changed
+
+        changed = fetched[is_new | is_changed]
+        if not changed.empty:
+            stmt = dialect_insert(db)(Stock.__table__)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['ts_code'],
+                set_={**{name: stmt.excluded[name] for name in STOCK_VALUE_FIELDS},
+                      'updated_at': func.now()}
+            )
+            records = changed.astype(object).where(changed.notna(), None).to_dict('records')
+            db.execute(stmt, records)
+
+        stats.elapsed = time.perf_counter() - started
+        return stats
@@ -1,227 +1,396 @@
 # app/services/stock_service.py
+import asyncio
+import functools
 import logging
-from typing import List, Dict, Optional
+import time
+from typing import Callable, List, Dict, Optional
 from datetime import datetime, timedelta
-import asyncio
 import pandas as pd
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
 from sqlalchemy.orm import Session
 from app.core.error_handler import handle_data_errors
-from app.services.data_consistency import DataConsistencyService
-from app.core.database import get_db
+from app.services.data_consistency import DataConsistencyService, IntegrityReport
+from app.services.bulk_upsert import DailyDataUpserter, UpsertStats
+from app.services.ingest_pipeline import (FetchUnit, FetchWritePipeline, PipelineResult,
+                                          RetryPolicy, RetryQueue, WriteFunc, fetch_daily)
+from app.services.watermark import WatermarkService, WatermarkTracker
+from app.services.resampler import Resampler
+from app.services.fetch_planner import FetchPlan, FetchPlanner
+from app.services.columnar_store import get_columnar_store
+from app.services.indicators import IndicatorEngine
+from app.services.screener import get_screener
+from app.services.market_context import get_market_context_builder
+from app.services.trading_calendar import TradingCalendar
+from app.services.tushare_client import create_pro_api
+from app.services.stock_basic_sync import STOCK_BASIC_FIELDS, StockBasicSync
+from app.services.job_history import track_rows
+from app.core.rate_limiter import TokenBucketRateLimiter
+from app.core.cache import reference_cache
+from app.core.metrics import BATCH_ROWS, BATCH_WRITE_SECONDS, DB_COMMIT_SECONDS, INGEST_UNITS_DEFERRED
+from app.core.database import session_scope
 from app.models import Stock
 from app.models.stock import DailyData
 from app.core.config import settings
-import tushare as ts
 from app.core.exceptions import DataFetchError, DatabaseError
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
+# 与日线在同一事务中执行的进度记录，参数为同步会话与写入行数
+Checkpoint = Callable[[Session, int], None]
+
 class StockService:
-    def __init__(self):
-        self.data_consistency = DataConsistencyService()
-        self.db: Session = next(get_db())
-        self.ts_api = ts.pro_api(settings.TUSHARE_TOKEN)
+    def __init__(self, session_factory: Optional[async_sessionmaker] = None):
+        # 每次操作从连接池获取短生命周期的会话，不在实例上长期持有
+        self.session_factory = session_factory
+        # 带磁盘缓存的 tushare 客户端，TUSHARE_CACHE_MODE=replay 时可离线运行
+        self.ts_api = create_pro_api()
+        self.upserter = DailyDataUpserter()
+        self.stock_basic_sync = StockBasicSync()
+        self.watermarks = WatermarkService()
+        self.resampler = Resampler()
+        self.columnar_store = get_columnar_store()
+        self.indicators = IndicatorEngine(self.columnar_store)
+        self.calendar = TradingCalendar(self.ts_api, session_factory)
+        self.data_consistency = DataConsistencyService(
+            session_factory, self.calendar, self.columnar_store
+        )
+        # 按真实的每分钟调用配额限流，被上游限流时自适应降速
+        self.rate_limiter = TokenBucketRateLimiter(
+            settings.TUSHARE_CALLS_PER_MINUTE,
+            backoff=settings.RATE_LIMIT_BACKOFF,
+            min_fraction=settings.RATE_LIMIT_MIN_FRACTION
+        )
+        # 拉取单元级重试；重试耗尽或熔断时未执行的单元留在队列中，只重做这些单元
+        self.retry_policy = RetryPolicy(
+            max_attempts=settings.FETCH_UNIT_MAX_ATTEMPTS,
+            base_delay=settings.FETCH_RETRY_BASE_DELAY,
+            max_delay=settings.FETCH_RETRY_MAX_DELAY
+        )
+        self.retry_queue = RetryQueue()
         # Configuration parameters
         self.BATCH_SIZE = 50  
         self.QUERY_LIMIT = 500
         self.SINGLE_QUERY_LIMIT = 6000
         self.DEFAULT_BACKTRACK_DAYS = settings.DEFAULT_BACKTRACK_DAYS
 
-    def _split_time_ranges(self, start_date: str, end_date: str) -> List[tuple]:
-        """将时间范围分割为适合单次查询的片段"""
-        start = pd.to_datetime(start_date)
-        end = pd.to_datetime(end_date)
-        
-        # 计算每个分片的天数（考虑单次查询限制）
-        days_per_query = self.SINGLE_QUERY_LIMIT // self.BATCH_SIZE
-        
-        time_ranges = []
-        current = start
-        while current < end:
-            next_date = min(current + timedelta(days=days_per_query), end)
-            time_ranges.append((
-                current.strftime('%Y%m%d'),
-                next_date.strftime('%Y%m%d')
-            ))
-            current = next_date + timedelta(days=1)
-        
-        return time_ranges
-    
-    async def _process_stock_batch(self, stock_codes: List[str], 
-                             start_date: str, end_date: str) -> bool:
-        """处理一批股票的数据获取"""
+    def _fetch_daily(self, unit: FetchUnit) -> Optional[pd.DataFrame]:
+        """拉取一个工作单元的日线数据（在线程池中执行）"""
+        return fetch_daily(self.ts_api, unit)
+
+    async def _process_stock_batch(self, unit: FetchUnit,
+                                   df: Optional[pd.DataFrame],
+                                   checkpoint: Optional[Checkpoint] = None,
+                                   tracker: Optional[WatermarkTracker] = None) -> int:
+        """将一批股票的日线数据写入数据库，返回写入行数；checkpoint 与数据在同一事务中提交"""
+        if df is None or df.empty:
+            logger.warning(f"No data found for batch {unit.describe()}")
+            if checkpoint is not None or tracker is not None:
+                # 空单元也算完成，之前因它被压住的水位可以推进
+                def mark(db: Session) -> None:
+                    if tracker is not None:
+                        self.watermarks.advance(db, None, tracker, unit)
+                    if checkpoint is not None:
+                        checkpoint(db, 0)
+
+                async with session_scope(self.session_factory) as db:
+                    await db.run_sync(mark)
+                    with DB_COMMIT_SECONDS.time(operation='checkpoint'):
+                        await db.commit()
+                if tracker is not None:
+                    tracker.commit(None, unit)
+            return 0
+
+        # 批量插入或更新数据
+        started = time.perf_counter()
         try:
-            # 使用逗号分隔的股票代码字符串
-            codes = ','.join(stock_codes)
-            
-            # 获取数据
-            df = self.ts_api.daily(
-                ts_code=codes,
-                start_date=start_date,
-                end_date=end_date
-            )
-            
-            if df is None or df.empty:
-                logger.warning(f"No data found for batch {stock_codes}")
-                return True
-            
-            # 批量插入或更新数据
-            await self._batch_update_daily_data(df)
-            
-            return True
-        
+            stats = await self._batch_update_daily_data(df, checkpoint, tracker, unit)
+        except Exception:
+            BATCH_WRITE_SECONDS.observe(time.perf_counter() - started, status='error')
+            raise
+        BATCH_WRITE_SECONDS.observe(time.perf_counter() - started, status='ok')
+        BATCH_ROWS.inc(stats.rows)
+        track_rows(stats.rows)
+        return stats.rows
+
+    def _build_pipeline(self, write: Optional[WriteFunc] = None) -> FetchWritePipeline:
+        return FetchWritePipeline(
+            fetch=self._fetch_daily,
+            write=write or self._process_stock_batch,
+            limiter=self.rate_limiter,
+            concurrency=settings.FETCH_CONCURRENCY,
+            queue_size=settings.WRITE_QUEUE_SIZE,
+            retry=self.retry_policy
+        )
+
+    async def _run_units(self, units: List[FetchUnit],
+                         tracker: WatermarkTracker) -> PipelineResult:
+        """执行拉取单元，仍失败的单元进入重试队列；水位不越过失败单元
+
+        tracker 应由 WatermarkTracker(units) 创建，运行后其 earliest_written 为实际写入的最早交易日。
+        """
+        await self._reserve_columnar_dates(units)
+        write = functools.partial(self._process_stock_batch, tracker=tracker)
+        result = await self._build_pipeline(write).run(units)
+        if result.failed_units:
+            self.retry_queue.extend(result.failed_units)
+            reason = 'circuit_open' if result.circuit_open else 'retries_exhausted'
+            INGEST_UNITS_DEFERRED.inc(len(result.failed_units), reason=reason)
+            logger.warning(f"{len(result.failed_units)} batches queued for retry ({reason}), "
+                           f"queue size {len(self.retry_queue)}")
+        return result
+
+    async def _reserve_columnar_dates(self, units: List[FetchUnit]) -> None:
+        """单元涉及列式存储最新日期之前的区间时，按交易日历一次性预留这些日期，
+        避免乱序写入的每个历史批次都重排字段文件"""
+        dates = self.columnar_store.dates
+        start = min((unit.start_date for unit in units), default=None)
+        if start is None or (dates and start >= dates[-1]):
+            return
+        # 当日数据可能尚未发布，不预留今天及以后的日期
+        end = min(max(unit.end_date for unit in units),
+                  (datetime.now() - timedelta(days=1)).strftime('%Y%m%d'))
+        if start > end:
+            return
+        trade_dates = await self._trade_dates(start, end)
+        if not trade_dates:
+            return
+        try:
+            await asyncio.to_thread(self.columnar_store.reserve_dates, trade_dates)
         except Exception as e:
-            logger.error(f"Error processing batch {stock_codes}: {str(e)}")
-            return False
-        
+            logger.error(f"Failed to reserve columnar store dates: {str(e)}")
+
     @handle_data_errors(retries=3)
     async def update_stock_basics(self,backtrack_days: Optional[int] = None):
-        """更新股票基础数据"""
+        """同步全市场股票基础数据，只写入有变化的行"""
         try:
             logger.info("Starting to update stock basics...")
-            # 获取股票基本信息
-            df = self.ts_api.stock_basic(
-                # exchange='',
-                # list_status='L',
-                # fields='ts_code,symbol,name,area,industry,list_date'
-                ts_code='000001.SZ,000002.SZ,000003.SZ,000004.SZ,000005.SZ',
-                fields='ts_code,symbol,name,area,industry,list_date'
+            # 分钟级同步需要最新数据，不读取响应缓存
+            df = await asyncio.to_thread(
+                self.ts_api.stock_basic,
+                exchange='',
+                list_status='L',
+                fields=','.join(STOCK_BASIC_FIELDS),
+                use_cache=False
             )
-            
-            success_count = 0
-            error_count = 0
-            
-            # 更新数据库
-            for _, row in df.iterrows():
-                try:
-                    # 首先检查是否存在
-                    existing_stock = self.db.query(Stock).filter(
-                        Stock.ts_code == row['ts_code']
-                    ).first()
-                    
-                    if existing_stock:
-                        # 更新现有记录
-                        existing_stock.symbol = row['symbol']
-                        existing_stock.name = row['name']
-                        existing_stock.area = row['area']
-                        existing_stock.industry = row['industry']
-                        existing_stock.list_date = row['list_date']
-                        existing_stock.updated_at = datetime.now()
-                    else:
-                        # 创建新记录
-                        new_stock = Stock(
-                            ts_code=row['ts_code'],
-                            symbol=row['symbol'],
-                            name=row['name'],
-                            area=row['area'],
-                            industry=row['industry'],
-                            list_date=row['list_date']
-                        )
-                        self.db.add(new_stock)
-                    
-                    success_count += 1
-                except Exception as e:
-                    error_count += 1
-                    logger.error(f"Error processing stock {row['ts_code']}: {str(e)}")
-                    continue
-            
-            # 提交所有更改
-            self.db.commit()
-            
-            logger.info(f"Successfully updated stock basics. "
-                       f"Processed: {success_count + error_count}, "
-                       f"Success: {success_count}, "
-                       f"Errors: {error_count}")
-            return True
-            
+
+            async with session_scope(self.session_factory) as db:
+                stats = await db.run_sync(self.stock_basic_sync.apply, df)
+                if stats.changed:
+                    with DB_COMMIT_SECONDS.time(operation='stock_basic'):
+                        await db.commit()
+            track_rows(stats.changed)
+
+            if stats.changed:
+                # 参考数据已变更，使接口缓存与选股快照失效
+                reference_cache.invalidate()
+                get_screener().invalidate_reference()
+
+            logger.info(f"Successfully updated stock basics: {stats.summary()}")
+            return stats
+
         except Exception as e:
-            self.db.rollback()
             logger.error(f"Failed to update stock basics: {str(e)}")
             raise DataFetchError(f"Failed to update stock basics: {str(e)}")
 
-    @handle_data_errors(retries=3)
-    async def update_daily_data(self,backtrack_days:Optional[int]=None):
-        """更新日线数据"""
+    async def plan_daily_update(self, backtrack_days: Optional[int] = None,
+                                full_refresh: bool = False) -> FetchPlan:
+        """生成日线更新的拉取计划（不调用 daily 接口，可用于试运行）
+
+        默认按每只股票的水位增量拉取缺失区间；full_refresh=True 时
+        忽略水位，重新拉取最近 backtrack_days 天的全部数据。
+        """
+        async with session_scope(self.session_factory) as db:
+            stock_codes = list((await db.execute(select(Stock.ts_code))).scalars().all())
+
+        # 计算时间范围
+        end_date = datetime.now().strftime('%Y%m%d')
+        days = backtrack_days or self.DEFAULT_BACKTRACK_DAYS
+        start_date = (datetime.now() - timedelta(days=days)).strftime('%Y%m%d')
+
+        if full_refresh:
+            gap_groups = {start_date: stock_codes} if stock_codes else {}
+        else:
+            async with session_scope(self.session_factory) as db:
+                watermarks = await db.run_sync(self.watermarks.load, stock_codes)
+            gap_groups = self.watermarks.group_by_gap(watermarks, start_date, end_date)
+
+        if not gap_groups:
+            return self._planner(len(stock_codes)).plan({}, end_date)
+        trade_dates = await self._trade_dates(min(gap_groups), end_date)
+        return self._planner(len(stock_codes)).plan(gap_groups, end_date, trade_dates)
+
+    async def plan_range(self, codes: List[str], start_date: str, end_date: str) -> FetchPlan:
+        """为指定股票生成日期区间内的完整拉取计划（不看水位，用于历史回补）"""
+        if not codes:
+            return self._planner(0).plan({}, end_date)
+        trade_dates = await self._trade_dates(start_date, end_date)
+        return self._planner(len(codes)).plan({start_date: list(codes)}, end_date, trade_dates)
+
+    def _planner(self, universe_size: int) -> FetchPlanner:
+        return FetchPlanner(
+            row_limit=self.SINGLE_QUERY_LIMIT,
+            max_codes_per_call=settings.MAX_CODES_PER_QUERY,
+            market_size=max(universe_size, settings.MARKET_SIZE)
+        )
+
+    async def _trade_dates(self, start_date: str, end_date: str) -> Optional[List[str]]:
+        """读取交易日历；日历不可用时返回 None，由计划器按工作日估算"""
+        try:
+            return await self.calendar.trade_dates(start_date, end_date)
+        except Exception as e:
+            logger.warning(f"Trade calendar unavailable, falling back to weekdays: {str(e)}")
+            return None
+
+    async def plan_gap_refetch(self, report: IntegrityReport) -> FetchPlan:
+        """根据完整性检查的缺口报告生成定向补拉计划"""
+        units = []
+        for (start_date, end_date), codes in sorted(report.gap_groups().items()):
+            trade_dates = await self._trade_dates(start_date, end_date)
+            units.extend(self._planner(len(codes)).plan({start_date: codes}, end_date, trade_dates).units)
+        return FetchPlan(
+            strategy='gap_refetch',
+            units=units,
+            stocks=len(report.reports),
+            trading_days=report.trading_days,
+            date_calls=sum(1 for unit in units if unit.per_date),
+            batch_calls=sum(1 for unit in units if not unit.per_date),
+        )
+
+    async def refetch_gaps(self, report: IntegrityReport) -> bool:
+        """只补拉完整性检查发现的缺口"""
+        plan = await self.plan_gap_refetch(report)
+        logger.info(f"Refetching gaps: {plan.summary()}")
+        if not plan.units:
+            return True
+        tracker = WatermarkTracker(plan.units)
+        result = await self._run_units(plan.units, tracker)
+        await self._refresh_derived(tracker.earliest_written)
+        return result.success
+
+    async def retry_failed_units(self) -> Optional[bool]:
+        """只重做重试队列中的单元；队列为空时返回 None"""
+        units = self.retry_queue.drain()
+        if not units:
+            return None
+        logger.info(f"Retrying {len(units)} queued batches")
+        tracker = WatermarkTracker(units)
+        result = await self._run_units(units, tracker)
+        await self._refresh_derived(tracker.earliest_written)
+        return result.success
+
+    async def update_daily_data(self, backtrack_days: Optional[int] = None,
+                                full_refresh: bool = False):
+        """更新日线数据，拉取计划见 plan_daily_update；失败按拉取单元重试，不整体重跑"""
         try:
             logger.info("Starting to update daily data...")
-            # 获取所有股票代码
-            stocks = self.db.query(Stock).all()
-            if not stocks:
+            async with session_scope(self.session_factory) as db:
+                has_stocks = (await db.execute(select(Stock.ts_code).limit(1))).first()
+            if has_stocks is None:
                 logger.warning("No stocks found in database")
                 return False
 
-            # 计算时间范围
-            end_date = datetime.now().strftime('%Y%m%d')
-            days = backtrack_days or self.DEFAULT_BACKTRACK_DAYS
-            start_date = (datetime.now() - timedelta(days=days)).strftime('%Y%m%d')
-            # 获取时间分片
-            time_ranges = self._split_time_ranges(start_date, end_date)
-            # 分批处理股票
-            total_stocks = len(stocks)
-            for i in range(0, total_stocks, self.BATCH_SIZE):
-                batch_stocks = stocks[i:i + self.BATCH_SIZE]
-                stock_codes = [stock.ts_code for stock in batch_stocks]
-                
-                # 处理每个时间分片
-                for start, end in time_ranges:
-                    success = await self._process_stock_batch(stock_codes, start, end)
-                    if not success:
-                        logger.error(f"Failed to process batch {i//self.BATCH_SIZE + 1}")
-                        continue
-                    
-                    # 频率限制控制
-                    await asyncio.sleep(0.12)  # 确保不超过每分钟500次的限制
-                    
+            plan = await self.plan_daily_update(backtrack_days, full_refresh)
+            # 水位不越过失败的单元，计划已覆盖之前失败的区间，清空重试队列避免重复拉取
+            self.retry_queue.drain()
+            if not plan.units:
+                logger.info("Daily data is already up to date")
+                return True
+
+            tracker = WatermarkTracker(plan.units)
+            result = await self._run_units(plan.units, tracker)
+            await self._refresh_derived(tracker.earliest_written)
+            if not result.success:
+                logger.error(f"Failed to process {len(result.failed_units)} "
+                             f"of {result.units_total} batches")
+                return False
+
             logger.info("Successfully completed daily data update")
             return True
 
         except Exception as e:
-            self.db.rollback()
             logger.error(f"Failed to update daily data: {str(e)}")
             raise DataFetchError(f"Failed to update daily data: {str(e)}")
 
-    async def _batch_update_daily_data(self, df: pd.DataFrame):
-        """批量更新日线数据"""
+    async def _refresh_derived(self, changed_since: Optional[str]) -> None:
+        """入库后追加技术指标、刷新选股快照并生成 AI 行情摘要；失败不影响日线更新，下次更新时会补算
+
+        changed_since 为实际写入的最早交易日（见 WatermarkTracker.earliest_written），
+        为 None 表示没有写入数据。按计划单元的起始日计算会被停牌股票的陈旧水位拖回很久之前。
+        """
+        if changed_since is None:
+            return
+        try:
+            await asyncio.to_thread(self.indicators.update, changed_since)
+        except Exception as e:
+            logger.error(f"Failed to update indicators: {str(e)}")
         try:
-            for _, row in df.iterrows():
-                # 检查是否存在
-                existing_data = self.db.query(DailyData).filter(
-                    DailyData.stock_code == row['ts_code'],
-                    DailyData.trade_date == row['trade_date']
-                ).first()
-                
-                if existing_data:
-                    # 更新现有记录
-                    for column in ['open', 'high', 'low', 'close', 'vol', 'amount']:
-                        setattr(existing_data, column, row[column])
-                    existing_data.updated_at = datetime.now()
-                else:
-                    # 创建新记录
-                    new_data = DailyData(
-                        stock_code=row['ts_code'],
-                        trade_date=row['trade_date'],
-                        open=row['open'],
-                        high=row['high'],
-                        low=row['low'],
-                        close=row['close'],
-                        volume=row['vol'],
-                        amount=row['amount']
-                    )
-                    self.db.add(new_data)
-            
-            # 批量提交
-            self.db.commit()
-            
+            await get_screener().refresh()
         except Exception as e:
-            self.db.rollback()
-            raise e
+            logger.error(f"Failed to refresh screener snapshot: {str(e)}")
+        try:
+            await get_market_context_builder().precompute()
+        except Exception as e:
+            logger.error(f"Failed to precompute market context: {str(e)}")
+
+    def _write_daily(self, db: Session, df: pd.DataFrame,
+                     tracker: Optional[WatermarkTracker] = None,
+                     unit: Optional[FetchUnit] = None) -> UpsertStats:
+        """写入日线、推进水位并更新周期线（同步会话，经 run_sync 调用，不提交）"""
+        stats = self.upserter.upsert(db, df, commit=False)
+        self.watermarks.advance(db, df, tracker, unit)
+        # 只重算新数据涉及的周线、月线
+        self.resampler.update_touched(db, df)
+        return stats
+
+    async def _batch_update_daily_data(self, df: pd.DataFrame,
+                                       checkpoint: Optional[Checkpoint] = None,
+                                       tracker: Optional[WatermarkTracker] = None,
+                                       unit: Optional[FetchUnit] = None) -> UpsertStats:
+        """批量更新日线数据，并在同一事务中推进水位（及记录进度）
+
+        tracker 为本次运行的水位约束（见 WatermarkTracker），unit 为这批数据对应的拉取单元。
+        """
+        def write(db: Session) -> UpsertStats:
+            stats = self._write_daily(db, df, tracker, unit)
+            if checkpoint is not None:
+                checkpoint(db, stats.rows)
+            return stats
+
+        async with session_scope(self.session_factory) as db:
+            stats = await db.run_sync(write)
+            with DB_COMMIT_SECONDS.time(operation='daily_data'):
+                await db.commit()
+        if tracker is not None:
+            tracker.commit(df, unit)
+
+        # 数据库提交成功后同步列式存储；失败时可通过 ColumnarStore.rebuild 修复
+        try:
+            await asyncio.to_thread(self.columnar_store.write_frame, df)
+        except Exception as e:
+            logger.error(f"Failed to sync columnar store: {str(e)}")
+        return stats
+
     async def get_stock_list(self) -> List[Dict]:
         """获取股票列表"""
         try:
             logger.info("Fetching stock list...")
-            stocks = self.db.query(Stock).all()
+            async with session_scope(self.session_factory) as db:
+                stocks = (await db.execute(select(Stock))).scalars().all()
             return [stock.to_dict() for stock in stocks]
         except Exception as e:
             logger.error(f"Failed to get stock list: {str(e)}")
-            raise DatabaseError(f"Failed to get stock list: {str(e)}")
\ No newline at end of file
+            raise DatabaseError(f"Failed to get stock list: {str(e)}")
+
+    async def get_stock(self, stock_code: str) -> Optional[Dict]:
+        """获取单个股票信息"""
+        try:
+            async with session_scope(self.session_factory) as db:
+                stock = (await db.execute(
+                    select(Stock).where(Stock.ts_code == stock_code)
+                )).scalar_one_or_none()
+            return stock.to_dict() if stock is not None else None
+        except Exception as e:
+            logger.error(f"Failed to get stock {stock_code}: {str(e)}")
+            raise DatabaseError(f"Failed to get stock {stock_code}: {str(e)}")
\ No newline at end of file
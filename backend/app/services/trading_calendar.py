@@ -0,0 +1,106 @@
+# app/services/trading_calendar.py
+import asyncio
+import logging
+from datetime import timedelta
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import DB_COMMIT_SECONDS
+from app.core.database import session_scope
+from app.core.exceptions import DataFetchError
+from app.models.stock import TradeCalendar
+from app.services.bulk_upsert import dialect_insert
+
+logger = logging.getLogger(__name__)
+
+
+class TradingCalendar:
+    """交易日历：优先读取本地 trade_calendar 表，缺失区间才调用 tushare trade_cal"""
+
+    def __init__(self, ts_api, session_factory: Optional[async_sessionmaker] = None,
+                 exchange: Optional[str] = None):
+        self.ts_api = ts_api
+        self.session_factory = session_factory
+        self.exchange = exchange or settings.TRADE_CALENDAR_EXCHANGE
+        # 已覆盖区间内的全部开市日（升序）
+        self._open_dates = np.array([], dtype=object)
+        self._covered_start: Optional[str] = None
+        self._covered_end: Optional[str] = None
+        self._lock = asyncio.Lock()
+
+    def _covers(self, start_date: str, end_date: str) -> bool:
+        return (self._covered_start is not None
+                and self._covered_start <= start_date and end_date <= self._covered_end)
+
+    async def trade_dates(self, start_date: str, end_date: str) -> List[str]:
+        """返回 [start_date, end_date] 内的交易日（YYYYMMDD，升序）"""
+        async with self._lock:
+            if not self._covers(start_date, end_date):
+                await self._load()
+            if not self._covers(start_date, end_date):
+                await self._fetch_missing(start_date, end_date)
+                await self._load()
+        lo = np.searchsorted(self._open_dates, start_date, side='left')
+        hi = np.searchsorted(self._open_dates, end_date, side='right')
+        return self._open_dates[lo:hi].tolist()
+
+    async def _load(self) -> None:
+        async with session_scope(self.session_factory) as db:
+            rows = (await db.execute(
+                select(TradeCalendar.cal_date, TradeCalendar.is_open)
+                .where(TradeCalendar.exchange == self.exchange)
+                .order_by(TradeCalendar.cal_date)
+            )).all()
+        if not rows:
+            return
+        self._covered_start = rows[0][0]
+        self._covered_end = rows[-1][0]
+        self._open_dates = np.array([date for date, is_open in rows if is_open], dtype=object)
+
+    async def _fetch_missing(self, start_date: str, end_date: str) -> None:
+        ranges = []
+        if self._covered_start is None:
+            ranges.append((start_date, end_date))
+        else:
+            if start_date < self._covered_start:
+                day_before = (pd.to_datetime(self._covered_start) - timedelta(days=1)).strftime('%Y%m%d')
+                ranges.append((start_date, day_before))
+            if end_date > self._covered_end:
+                day_after = (pd.to_datetime(self._covered_end) + timedelta(days=1)).strftime('%Y%m%d')
+                ranges.append((day_after, end_date))
+
+        for start, end in ranges:
+            try:
+                df = await asyncio.to_thread(
+                    self.ts_api.trade_cal,
+                    exchange=self.exchange,
+                    start_date=start,
+                    end_date=end,
+                    fields='exchange,cal_date,is_open'
+                )
+            except Exception as e:
+                raise DataFetchError(f"Failed to fetch trade calendar {start}-{end}: {str(e)}")
+            if df is None or df.empty:
+                continue
+            async with session_scope(self.session_factory) as db:
+                await db.run_sync(self._store, df)
+                with DB_COMMIT_SECONDS.time(operation='trade_calendar'):
+                    await db.commit()
+            logger.info(f"Cached trade calendar {self.exchange} {start}-{end}: {len(df)} days")
+
+    def _store(self, db: Session, df: pd.DataFrame) -> None:
+        stmt = dialect_insert(db)(TradeCalendar.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['exchange', 'cal_date'],
+            set_={'is_open': stmt.excluded.is_open}
+        )
+        db.execute(stmt, [
+            {'exchange': self.exchange, 'cal_date': str(cal_date), 'is_open': int(is_open)}
+            for cal_date, is_open in zip(df['cal_date'], df['is_open'])
+        ])
@@ -0,0 +1,295 @@
+# app/services/tushare_client.py
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import pandas as pd
+
+from app.core.config import settings
+from app.core.circuit_breaker import CircuitBreaker
+from app.core.exceptions import DataFetchError, RateLimitError
+from app.core.metrics import TUSHARE_CALL_SECONDS, TUSHARE_CALLS, TUSHARE_RATE_LIMITED
+from app.services.job_history import track_api_call
+
+logger = logging.getLogger(__name__)
+
+MODE_OFF = 'off'
+MODE_READWRITE = 'readwrite'
+MODE_REPLAY = 'replay'
+CACHE_MODES = (MODE_OFF, MODE_READWRITE, MODE_REPLAY)
+# 决定数据新旧的参数，取其中最晚的日期
+DATE_PARAMS = ('trade_date', 'end_date', 'cal_date')
+NEVER_EXPIRES = float('inf')
+# tushare 以普通异常返回配额错误，如“抱歉，您每分钟最多访问该接口500次”
+RATE_LIMIT_MARKERS = ('最多访问', 'rate limit', 'too many requests')
+
+
+def normalize_params(params: Dict[str, Any]) -> Dict[str, str]:
+    """去掉空值、统一为字符串，fields 去除空白，保证等价请求得到同一缓存键"""
+    normalized = {}
+    for key, value in params.items():
+        if value is None or value == '':
+            continue
+        if key == 'fields':
+            value = ','.join(part.strip() for part in str(value).split(',') if part.strip())
+        normalized[key] = str(value)
+    return dict(sorted(normalized.items()))
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    if isinstance(error, RateLimitError):
+        return True
+    message = str(error).lower()
+    return any(marker in message for marker in RATE_LIMIT_MARKERS)
+
+
+def cache_key(api_name: str, params: Dict[str, str]) -> str:
+    payload = json.dumps([api_name, params], ensure_ascii=False, separators=(',', ':'))
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    stored: int = 0
+
+
+class CachingProApi:
+    """tushare pro_api 的磁盘缓存包装
+
+    响应按 接口名 + 规范化参数 存为 zstd 压缩的 Arrow IPC（Feather）文件。
+    过期时间取决于数据的日期：请求的最晚日期早于今天的历史数据永不过期，
+    包含今天或未来日期的请求很快过期，无日期参数的参考数据（如 stock_basic）按天过期；
+    空响应可能只是数据尚未发布，最多缓存 recent_ttl。prune 按过期时间、文件年龄与总大小清理。
+    replay 模式只读取已记录的响应，不访问网络，未命中时抛出 DataFetchError。
+    配置熔断器时，实际请求经熔断器放行；超出配额的错误统一抛出 RateLimitError，不计入熔断失败。
+    """
+
+    def __init__(self, api=None,
+                 cache_dir: Optional[str] = None,
+                 mode: Optional[str] = None,
+                 recent_ttl: Optional[float] = None,
+                 reference_ttl: Optional[float] = None,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.mode = mode or settings.TUSHARE_CACHE_MODE
+        if self.mode not in CACHE_MODES:
+            raise ValueError(f"Unknown tushare cache mode '{self.mode}'; available: {CACHE_MODES}")
+        if api is None and self.mode != MODE_REPLAY:
+            raise ValueError("A tushare api client is required unless running in replay mode")
+        self.api = api
+        self.root = Path(cache_dir or settings.TUSHARE_CACHE_DIR)
+        self.recent_ttl = settings.TUSHARE_CACHE_RECENT_TTL if recent_ttl is None else recent_ttl
+        self.reference_ttl = settings.TUSHARE_CACHE_REFERENCE_TTL if reference_ttl is None else reference_ttl
+        self.breaker = breaker
+        self.stats = CacheStats()
+        # 键 -> [锁, 使用者数]，无人使用时移除
+        self._locks: Dict[str, list] = {}
+        self._locks_guard = threading.Lock()
+
+    def __getattr__(self, api_name: str) -> Callable[..., pd.DataFrame]:
+        if api_name.startswith('_'):
+            raise AttributeError(api_name)
+
+        def call(**params) -> pd.DataFrame:
+            return self.query(api_name, **params)
+        return call
+
+    def ttl_for(self, params: Dict[str, str], empty: bool = False) -> float:
+        """根据请求覆盖的最晚日期决定缓存有效期（秒）；空响应不超过 recent_ttl"""
+        dates = [params[name] for name in DATE_PARAMS if name in params]
+        if not dates:
+            ttl = self.reference_ttl
+        else:
+            today = datetime.now().strftime('%Y%m%d')
+            ttl = NEVER_EXPIRES if max(dates) < today else self.recent_ttl
+        return min(ttl, self.recent_ttl) if empty else ttl
+
+    def _path(self, api_name: str, key: str) -> Path:
+        return self.root / api_name / f"{key}.arrow"
+
+    @contextmanager
+    def _locked(self, key: str) -> Iterator[None]:
+        """同一键的请求串行执行，避免重复调用接口"""
+        with self._locks_guard:
+            entry = self._locks.get(key)
+            if entry is None:
+                entry = self._locks[key] = [threading.Lock(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._locks_guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[key]
+
+    def query(self, api_name: str, use_cache: bool = True, **params) -> pd.DataFrame:
+        """调用接口；可用的缓存优先
+
+        use_cache=False 时跳过读取缓存直接请求（仍记录响应，供回放使用）；replay 模式下忽略。
+        """
+        # 原始参数用于请求，规范化参数只用于缓存键与过期判断
+        request_params = {k: v for k, v in params.items() if v is not None}
+        params = normalize_params(params)
+        if self.mode == MODE_OFF:
+            return self._fetch(api_name, request_params)
+
+        key = cache_key(api_name, params)
+        path = self._path(api_name, key)
+        with self._locked(key):
+            replay = self.mode == MODE_REPLAY
+            cached = self._read(path, ignore_expiry=replay) if use_cache or replay else None
+            if cached is not None:
+                self.stats.hits += 1
+                return cached
+            self.stats.misses += 1
+            if replay:
+                raise DataFetchError(f"No recorded response for {api_name} {params} (replay mode)")
+            df = self._fetch(api_name, request_params)
+            self._write(path, api_name, params, df)
+            return df
+
+    def _fetch(self, api_name: str, params: Dict[str, Any]) -> pd.DataFrame:
+        # pro_api 的具体接口即 query(api_name, ...) 的快捷方式
+        if self.breaker is not None:
+            self.breaker.before_call()
+        track_api_call()
+        started = time.perf_counter()
+        try:
+            df = self.api.query(api_name, **params)
+        except Exception as e:
+            if is_rate_limit_error(e):
+                # 被限流说明上游可用，不计为熔断失败
+                TUSHARE_CALLS.inc(api=api_name, status='rate_limited')
+                TUSHARE_RATE_LIMITED.inc(api=api_name)
+                if self.breaker is not None:
+                    self.breaker.record_success()
+                raise RateLimitError(str(e)) from e
+            TUSHARE_CALLS.inc(api=api_name, status='error')
+            if self.breaker is not None:
+                self.breaker.record_failure()
+            raise
+        finally:
+            TUSHARE_CALL_SECONDS.observe(time.perf_counter() - started, api=api_name)
+        TUSHARE_CALLS.inc(api=api_name, status='ok')
+        if self.breaker is not None:
+            self.breaker.record_success()
+        return df if df is not None else pd.DataFrame()
+
+    def _read(self, path: Path, ignore_expiry: bool = False) -> Optional[pd.DataFrame]:
+        if not path.exists():
+            return None
+        import pyarrow.feather as feather
+        try:
+            table = feather.read_table(path, memory_map=True)
+        except Exception as e:
+            logger.warning(f"Discarding unreadable tushare cache file {path}: {str(e)}")
+            return None
+        meta = table.schema.metadata or {}
+        expires_at = float(meta.get(b'expires_at', b'0'))
+        if not ignore_expiry and expires_at < time.time():
+            return None
+        return table.to_pandas()
+
+    def _write(self, path: Path, api_name: str, params: Dict[str, str], df: pd.DataFrame) -> None:
+        import pyarrow as pa
+        import pyarrow.feather as feather
+        fetched_at = time.time()
+        table = pa.Table.from_pandas(df.reset_index(drop=True), preserve_index=False)
+        table = table.replace_schema_metadata({
+            **(table.schema.metadata or {}),
+            'api_name': api_name,
+            'params': json.dumps(params, ensure_ascii=False),
+            'fetched_at': str(fetched_at),
+            'expires_at': str(fetched_at + self.ttl_for(params, empty=df.empty)),
+        })
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        feather.write_feather(table, tmp, compression='zstd')
+        os.replace(tmp, path)
+        self.stats.stored += 1
+
+    def prune(self, max_age_days: Optional[int] = None, max_mb: Optional[float] = None) -> Dict[str, int]:
+        """清理缓存：删除已过期、早于 max_age_days 天的文件，再按时间从旧到新删除至总大小
+        不超过 max_mb（0 为不限）；replay 模式依赖已记录的响应，不清理"""
+        if self.mode == MODE_REPLAY:
+            return {'removed': 0, 'remaining': 0, 'bytes': 0}
+        import pyarrow as pa
+        max_age_days = settings.TUSHARE_CACHE_MAX_AGE_DAYS if max_age_days is None else max_age_days
+        max_mb = settings.TUSHARE_CACHE_MAX_MB if max_mb is None else max_mb
+        now = time.time()
+        oldest = now - max_age_days * 86400 if max_age_days else float('-inf')
+        removed = 0
+        kept: List[tuple] = []
+        for path in self.root.rglob('*.arrow'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            try:
+                with pa.memory_map(str(path)) as source:
+                    meta = pa.ipc.open_file(source).schema.metadata or {}
+                expires_at = float(meta.get(b'expires_at', b'0'))
+            except Exception:
+                # 无法读取的文件按过期处理
+                expires_at = 0.0
+            if expires_at < now or stat.st_mtime < oldest:
+                path.unlink(missing_ok=True)
+                removed += 1
+            else:
+                kept.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in kept)
+        if max_mb and total > max_mb * 1024 * 1024:
+            kept.sort(key=lambda item: item[0])
+            evicted = 0
+            for _, size, path in kept:
+                if total <= max_mb * 1024 * 1024:
+                    break
+                path.unlink(missing_ok=True)
+                total -= size
+                evicted += 1
+            kept = kept[evicted:]
+            removed += evicted
+        logger.info(f"Pruned tushare cache: removed {removed} files, "
+                    f"{len(kept)} files ({total / 1024 / 1024:.1f} MB) remaining")
+        return {'removed': removed, 'remaining': len(kept), 'bytes': total}
+
+    def clear(self, api_name: Optional[str] = None) -> int:
+        """删除缓存文件，返回删除数量"""
+        root = self.root / api_name if api_name else self.root
+        removed = 0
+        for path in root.rglob('*.arrow'):
+            path.unlink(missing_ok=True)
+            removed += 1
+        return removed
+
+
+_breaker: Optional[CircuitBreaker] = None
+
+
+def get_tushare_breaker() -> CircuitBreaker:
+    """进程内所有 tushare 客户端共享的熔断器"""
+    global _breaker
+    if _breaker is None:
+        _breaker = CircuitBreaker('tushare')
+    return _breaker
+
+
+def create_pro_api(mode: Optional[str] = None) -> CachingProApi:
+    """按配置创建带缓存的 tushare 客户端；replay 模式不创建真实客户端"""
+    mode = mode or settings.TUSHARE_CACHE_MODE
+    api = None
+    if mode != MODE_REPLAY:
+        import tushare as ts
+        api = ts.pro_api(settings.TUSHARE_TOKEN)
+    return CachingProApi(api, mode=mode, breaker=get_tushare_breaker())
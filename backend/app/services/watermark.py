@@ -0,0 +1,179 @@
+# app/services/watermark.py
+import bisect
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+from sqlalchemy import case, func, select
+from sqlalchemy.orm import Session
+
+from app.core.metrics import DB_COMMIT_SECONDS
+from app.models.stock import DailyData, DailyWatermark
+from app.services.bulk_upsert import dialect_insert
+from app.services.ingest_pipeline import FetchUnit
+
+logger = logging.getLogger(__name__)
+
+# 单次 IN 查询的股票数，避免超过 SQLite 参数上限
+CODE_CHUNK = 500
+
+
+class WatermarkService:
+    """维护每只股票日线数据的水位（最新交易日）"""
+
+    def load(self, db: Session, stock_codes: Iterable[str]) -> Dict[str, Optional[str]]:
+        """读取水位；水位表中缺失的股票从 daily_data 的 max(trade_date) 补齐"""
+        stock_codes = list(stock_codes)
+        watermarks = {}
+        for i in range(0, len(stock_codes), CODE_CHUNK):
+            watermarks.update(db.execute(
+                select(DailyWatermark.stock_code, DailyWatermark.last_trade_date)
+                .where(DailyWatermark.stock_code.in_(stock_codes[i:i + CODE_CHUNK]))
+            ).all())
+
+        # 新股与无数据的股票一直没有水位，只扫描这些股票的日线，避免每次全表聚合
+        missing = [code for code in stock_codes if code not in watermarks]
+        if missing:
+            seeded = {}
+            for i in range(0, len(missing), CODE_CHUNK):
+                seeded.update(db.execute(
+                    select(DailyData.stock_code, func.max(DailyData.trade_date))
+                    .where(DailyData.stock_code.in_(missing[i:i + CODE_CHUNK]))
+                    .group_by(DailyData.stock_code)
+                ).all())
+            seeded = {code: date for code, date in seeded.items() if date}
+            if seeded:
+                self._upsert(db, seeded)
+                with DB_COMMIT_SECONDS.time(operation='watermark'):
+                    db.commit()
+                logger.info(f"Seeded {len(seeded)} watermarks from daily_data")
+                watermarks.update(seeded)
+
+        return {code: watermarks.get(code) for code in stock_codes}
+
+    def advance(self, db: Session, df: Optional[pd.DataFrame],
+                tracker: Optional["WatermarkTracker"] = None,
+                unit: Optional[FetchUnit] = None) -> None:
+        """根据新写入的日线推进水位（不提交，由调用方与数据写入同一事务提交）
+
+        传入 tracker 时水位只推进到该股票仍未完成的最早单元之前，不越过缺口。
+        """
+        if tracker is not None:
+            watermarks = tracker.resolve(df, unit)
+        else:
+            watermarks = latest_dates(df)
+        if watermarks:
+            self._upsert(db, watermarks)
+
+    def _upsert(self, db: Session, watermarks: Dict[str, str]) -> None:
+        table = DailyWatermark.__table__
+        stmt = dialect_insert(db)(table)
+        # 只向前推进，回补历史数据时不会把水位拉回去
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['stock_code'],
+            set_={
+                'last_trade_date': case(
+                    (stmt.excluded.last_trade_date > table.c.last_trade_date,
+                     stmt.excluded.last_trade_date),
+                    else_=table.c.last_trade_date
+                ),
+                'updated_at': func.now(),
+            }
+        )
+        db.execute(stmt, [
+            {'stock_code': code, 'last_trade_date': date}
+            for code, date in watermarks.items()
+        ])
+
+    @staticmethod
+    def group_by_gap(watermarks: Dict[str, Optional[str]],
+                     default_start: str,
+                     end_date: str) -> Dict[str, List[str]]:
+        """按缺口起始日分组：{start_date: [stock_code, ...]}，已是最新的股票不出现"""
+        groups = defaultdict(list)
+        for code, last_date in watermarks.items():
+            if last_date is None:
+                start = default_start
+            else:
+                start = (pd.to_datetime(last_date) + pd.Timedelta(days=1)).strftime('%Y%m%d')
+            if start <= end_date:
+                groups[start].append(code)
+        return dict(groups)
+
+
+def latest_dates(df: Optional[pd.DataFrame]) -> Dict[str, str]:
+    """每只股票在 df 中的最新交易日"""
+    if df is None or df.empty:
+        return {}
+    latest = df.groupby('ts_code')['trade_date'].max()
+    return {code: str(date) for code, date in latest.items()}
+
+
+@lru_cache(maxsize=4096)
+def _day_before(date: str) -> str:
+    return (datetime.strptime(date, '%Y%m%d') - timedelta(days=1)).strftime('%Y%m%d')
+
+
+class WatermarkTracker:
+    """一次运行内的水位约束
+
+    单元完成的顺序与计划顺序无关，某只股票较晚的时间片可能先于较早的写入；
+    若较早的单元最终失败，直接取 max(trade_date) 会让水位越过缺口，增量更新再也不会补拉。
+    这里记录每只股票尚未完成的单元起始日，水位最多推进到其中最早者的前一天；
+    较早的单元完成后再推进到已写入的最新日期。单一写入者调用，无需加锁。
+
+    earliest_written 为本次运行实际提交的最早交易日，供增量重算派生数据；空单元不计入。
+    """
+
+    def __init__(self, units: Iterable[FetchUnit] = ()):
+        self._pending: Dict[str, List[str]] = defaultdict(list)
+        self._written: Dict[str, str] = {}
+        self.earliest_written: Optional[str] = None
+        for unit in units:
+            for code in unit.codes:
+                self._pending[code].append(unit.start_date)
+        for starts in self._pending.values():
+            starts.sort()
+
+    def resolve(self, df: Optional[pd.DataFrame], unit: Optional[FetchUnit] = None) -> Dict[str, str]:
+        """写入 df 并完成 unit 后可以推进到的水位；不修改状态，提交成功后再调用 commit"""
+        latest = latest_dates(df)
+        codes = set(latest)
+        if unit is not None:
+            codes.update(unit.codes)
+        watermarks = {}
+        for code in codes:
+            written = max(filter(None, (self._written.get(code), latest.get(code))), default=None)
+            if written is None:
+                continue
+            starts = self._pending.get(code) or []
+            if unit is not None and code in unit.codes and starts:
+                # 排除当前单元自身（同一股票的多个单元可能有相同起始日，只排除一个）
+                index = bisect.bisect_left(starts, unit.start_date)
+                if index < len(starts) and starts[index] == unit.start_date:
+                    starts = starts[:index] + starts[index + 1:]
+            if starts:
+                written = min(written, _day_before(starts[0]))
+            watermarks[code] = written
+        return watermarks
+
+    def commit(self, df: Optional[pd.DataFrame], unit: Optional[FetchUnit] = None) -> None:
+        """记录已提交的数据与完成的单元"""
+        if df is not None and not df.empty:
+            earliest = str(df['trade_date'].min())
+            if self.earliest_written is None or earliest < self.earliest_written:
+                self.earliest_written = earliest
+        for code, date in latest_dates(df).items():
+            if date > self._written.get(code, ''):
+                self._written[code] = date
+        if unit is None:
+            return
+        for code in unit.codes:
+            starts = self._pending.get(code)
+            if starts:
+                index = bisect.bisect_left(starts, unit.start_date)
+                if index < len(starts) and starts[index] == unit.start_date:
+                    del starts[index]
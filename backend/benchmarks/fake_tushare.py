@@ -0,0 +1,115 @@
+# benchmarks/fake_tushare.py
+import threading
+import time
+from collections import Counter, deque
+from typing import Callable, Optional
+
+import pandas as pd
+
+from benchmarks.synthetic import SyntheticMarket
+
+
+class RateLimitExceeded(Exception):
+    """超过每分钟调用配额（tushare 以普通异常返回该错误）"""
+
+
+class FakeProApi:
+    """tushare pro_api 的本地替身
+
+    支持 daily / stock_basic / trade_cal，与真实接口一样：单次最多返回 row_limit 行
+    （超出部分静默截断，最早的交易日被丢弃），超过每分钟配额时抛出异常。
+    可设置每次调用的模拟网络延迟。调用次数、返回行数与截断次数可用于评估拉取计划。
+    """
+
+    def __init__(self, market: SyntheticMarket, row_limit: int = 6000,
+                 calls_per_minute: Optional[int] = None, latency: float = 0.0):
+        self.market = market
+        self.row_limit = row_limit
+        self.calls_per_minute = calls_per_minute
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self.rows_returned = 0
+        self.truncated = 0
+        self.rejected = 0
+        self._window = deque()
+        self._lock = threading.Lock()
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    def reset_counters(self) -> None:
+        with self._lock:
+            self.calls.clear()
+            self.rows_returned = self.truncated = self.rejected = 0
+
+    def __getattr__(self, api_name: str) -> Callable[..., pd.DataFrame]:
+        if api_name.startswith('_'):
+            raise AttributeError(api_name)
+
+        def call(**params) -> pd.DataFrame:
+            return self.query(api_name, **params)
+        return call
+
+    def _admit(self, api_name: str) -> None:
+        with self._lock:
+            now = time.monotonic()
+            if self.calls_per_minute:
+                while self._window and now - self._window[0] >= 60:
+                    self._window.popleft()
+                if len(self._window) >= self.calls_per_minute:
+                    self.rejected += 1
+                    raise RateLimitExceeded(
+                        f"抱歉，您每分钟最多访问该接口{self.calls_per_minute}次")
+                self._window.append(now)
+            self.calls[api_name] += 1
+
+    def query(self, api_name: str, fields: str = '', **params) -> pd.DataFrame:
+        handler = getattr(self, f"_{api_name}", None)
+        if handler is None:
+            raise ValueError(f"Fake pro_api does not implement '{api_name}'")
+        self._admit(api_name)
+        if self.latency:
+            time.sleep(self.latency)
+        df = handler(**params)
+        if fields:
+            df = df[[name for name in fields.split(',') if name in df.columns]]
+        if len(df) > self.row_limit:
+            df = df.iloc[:self.row_limit].reset_index(drop=True)
+            with self._lock:
+                self.truncated += 1
+        with self._lock:
+            self.rows_returned += len(df)
+        return df
+
+    def _daily(self, ts_code: Optional[str] = None, trade_date: Optional[str] = None,
+               start_date: Optional[str] = None, end_date: Optional[str] = None) -> pd.DataFrame:
+        market = self.market
+        rows = market.rows_for(ts_code.split(',') if ts_code else None)
+        if trade_date:
+            start_date = end_date = trade_date
+        return market.daily(rows, market.date_range(start_date, end_date))
+
+    def _stock_basic(self, exchange: str = '', list_status: str = 'L', **_) -> pd.DataFrame:
+        basics = self.market.basics
+        if exchange:
+            suffix = {'SSE': '.SH', 'SZSE': '.SZ'}.get(exchange, exchange)
+            basics = basics[basics['ts_code'].str.endswith(suffix)]
+        return basics.reset_index(drop=True)
+
+    def _trade_cal(self, exchange: str = 'SSE', start_date: Optional[str] = None,
+                   end_date: Optional[str] = None, **_) -> pd.DataFrame:
+        days = pd.date_range(start_date or self.market.dates[0], end_date or self.market.dates[-1])
+        return pd.DataFrame({
+            'exchange': exchange,
+            'cal_date': days.strftime('%Y%m%d'),
+            'is_open': (days.dayofweek < 5).astype(int),
+        })
+
+
+def synthetic_pro_api(n_stocks: int, years: float, seed: int = 0, **kwargs) -> FakeProApi:
+    """按参数重建同一份合成行情的 fake 客户端
+
+    与 functools.partial 组合后可序列化，多进程回补的每个工作进程各自创建一份。
+    """
+    return FakeProApi(SyntheticMarket(n_stocks, years, seed=seed), **kwargs)
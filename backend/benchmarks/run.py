@@ -0,0 +1,275 @@
+# benchmarks/run.py
+"""性能基准
+
+在临时目录中用合成行情与本地 fake pro_api 跑完整链路，结果写为 JSON：
+
+    python -m benchmarks.run --stocks 500 --years 2 --output results/base.json
+    python -m benchmarks.run --stocks 500 --years 2 --baseline results/base.json
+
+指定 --baseline 时与历史结果比较，超出容差的指标视为回退，进程以非零状态退出。
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_tushare import FakeProApi
+from benchmarks.synthetic import SyntheticMarket
+
+logger = logging.getLogger(__name__)
+
+# 指标名后缀 -> 数值越大越好(True) / 越小越好(False)；其余指标只记录不比较
+DIRECTIONS = {
+    'rows_per_second': True,
+    'seconds': False,
+    '_ms': False,
+    'api_calls': False,
+    'truncated_responses': False,
+    'peak_rss_mb': False,
+}
+
+
+def configure_environment(workdir: Path, calls_per_minute: int) -> None:
+    """在导入 app 之前把数据库、列式存储与缓存指向临时目录"""
+    db_path = workdir / 'bench.db'
+    os.environ.update({
+        'SQLALCHEMY_DATABASE_URL': f"sqlite:///{db_path}",
+        'SQLALCHEMY_ASYNC_DATABASE_URL': f"sqlite+aiosqlite:///{db_path}",
+        'COLUMNAR_STORE_DIR': str(workdir / 'columnar'),
+        'TUSHARE_CACHE_DIR': str(workdir / 'tushare_cache'),
+        # 不创建真实 tushare 客户端
+        'TUSHARE_CACHE_MODE': 'replay',
+        'TUSHARE_CALLS_PER_MINUTE': str(calls_per_minute),
+        'AI_BACKEND': 'stub',
+    })
+    os.environ.setdefault('TUSHARE_TOKEN', 'benchmark')
+    os.environ.setdefault('ZHIPU_API_KEY', 'benchmark')
+
+
+def peak_rss_mb() -> float:
+    # Linux 下 ru_maxrss 单位为 KiB，macOS 为字节
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    values = np.array(samples) * 1000
+    return {
+        'p50_ms': round(float(np.percentile(values, 50)), 3),
+        'p95_ms': round(float(np.percentile(values, 95)), 3),
+        'p99_ms': round(float(np.percentile(values, 99)), 3),
+        'max_ms': round(float(values.max()), 3),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return 'unknown'
+
+
+class BenchmarkRun:
+    """按阶段执行基准并收集指标"""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.metrics: Dict[str, float] = {}
+        self.phases: Dict[str, float] = {}
+
+    def record(self, phase: str, **values) -> None:
+        for name, value in values.items():
+            self.metrics[f"{phase}.{name}"] = round(value, 6) if isinstance(value, float) else value
+        self.phases[phase] = round(peak_rss_mb(), 1)
+        logger.info(f"{phase}: {values}")
+
+    async def run(self) -> Dict:
+        from sqlalchemy import func, select
+        from app.core.database import init_db, session_scope
+        from app.models.stock import DailyData
+        from app.services.stock_service import StockService
+        from app.services.tushare_client import MODE_OFF, CachingProApi
+
+        args = self.args
+        started = time.perf_counter()
+        market = SyntheticMarket(args.stocks, args.years, seed=args.seed)
+        fake = FakeProApi(market, row_limit=args.row_limit,
+                          calls_per_minute=args.calls_per_minute, latency=args.latency)
+        self.record('generate', seconds=time.perf_counter() - started, dates=len(market.dates))
+
+        init_db()
+        service = StockService()
+        service.ts_api = CachingProApi(fake, mode=MODE_OFF)
+        service.calendar.ts_api = service.ts_api
+
+        started = time.perf_counter()
+        await service.update_stock_basics()
+        self.record('stock_basics', seconds=time.perf_counter() - started,
+                    api_calls=fake.total_calls)
+
+        # 全量回补：最后一个交易日留给增量更新
+        market.visible = len(market.dates) - 1
+        fake.reset_counters()
+        backtrack_days = math.ceil(args.years * 365) + 7
+        started = time.perf_counter()
+        await service.update_daily_data(backtrack_days=backtrack_days)
+        elapsed = time.perf_counter() - started
+        async with session_scope(service.session_factory) as db:
+            rows = (await db.execute(select(func.count()).select_from(DailyData))).scalar_one()
+        self.record('backfill', seconds=elapsed, rows=rows, expected_rows=market.n_rows,
+                    rows_per_second=rows / elapsed, api_calls=fake.total_calls,
+                    truncated_responses=fake.truncated, rate_limited=fake.rejected)
+
+        market.visible = len(market.dates)
+        fake.reset_counters()
+        started = time.perf_counter()
+        await service.update_daily_data()
+        self.record('incremental', seconds=time.perf_counter() - started,
+                    api_calls=fake.total_calls, truncated_responses=fake.truncated)
+
+        for source in ('store', 'db'):
+            started = time.perf_counter()
+            report = await service.data_consistency.check_universe(
+                market.dates[0], market.dates[-1], source=source)
+            self.record(f'integrity_{source}', seconds=time.perf_counter() - started,
+                        missing_days=report.summary().get('missing_days', 0))
+
+        await self.measure_endpoints(market)
+        self.metrics['memory.peak_rss_mb'] = round(peak_rss_mb(), 1)
+        return {
+            'meta': {
+                'timestamp': datetime.now().isoformat(timespec='seconds'),
+                'git_commit': git_commit(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'config': vars(args) | {'output': None, 'baseline': None},
+            },
+            'metrics': self.metrics,
+            'peak_rss_mb_by_phase': self.phases,
+        }
+
+    async def measure_endpoints(self, market: SyntheticMarket) -> None:
+        import httpx
+        from fastapi import FastAPI
+        from app.api.v1.endpoints import stocks
+
+        app = FastAPI()
+        app.include_router(stocks.router)
+        rng = np.random.default_rng(self.args.seed)
+        codes = market.codes
+        start_date = market.dates[max(len(market.dates) - 250, 0)]
+
+        def pick(n: int = 1) -> List[str]:
+            return list(rng.choice(codes, size=n, replace=False))
+
+        scenarios = {
+            'daily_single': lambda: ('GET', f"/stocks/{pick()[0]}/daily",
+                                     {'params': {'start_date': start_date}}),
+            'daily_multi': lambda: ('GET', '/stocks/daily',
+                                    {'params': {'codes': ','.join(pick(min(20, len(codes)))),
+                                                'start_date': start_date}}),
+            'indicators': lambda: ('GET', f"/stocks/{pick()[0]}/indicators",
+                                   {'params': {'names': 'ma20,rsi14', 'start_date': start_date}}),
+            'screen': lambda: ('POST', '/stocks/screen',
+                               {'json': {'expression': 'close > ma20 and vol > 1.5 * avg_vol_20',
+                                         'limit': 100}}),
+            'stock_list': lambda: ('GET', '/stocks/', {}),
+        }
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+            for name, build in scenarios.items():
+                samples = []
+                for _ in range(self.args.requests):
+                    method, url, kwargs = build()
+                    started = time.perf_counter()
+                    response = await client.request(method, url, **kwargs)
+                    samples.append(time.perf_counter() - started)
+                    if response.status_code >= 400:
+                        raise RuntimeError(f"{name} failed: {response.status_code} {response.text[:200]}")
+                self.record(f'endpoint_{name}', **percentiles(samples))
+
+
+def compare(current: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """返回超出容差的回退指标说明"""
+    regressions = []
+    for name, value in current['metrics'].items():
+        old = baseline.get('metrics', {}).get(name)
+        direction = next((higher for suffix, higher in DIRECTIONS.items() if name.endswith(suffix)), None)
+        if direction is None or not old or not isinstance(value, (int, float)):
+            continue
+        change = (value - old) / old
+        if (direction and change < -tolerance) or (not direction and change > tolerance):
+            regressions.append(f"{name}: {old} -> {value} ({change:+.1%})")
+    return regressions
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark ingest, integrity checks and endpoints "
+                                                 "on synthetic market data")
+    parser.add_argument('--stocks', type=int, default=500, help="股票数，最多 5000")
+    parser.add_argument('--years', type=float, default=1.0, help="历史年数，最多 10")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--row-limit', type=int, default=6000, help="fake 接口单次返回行数上限")
+    parser.add_argument('--calls-per-minute', type=int, default=6000,
+                        help="fake 接口与限流器的每分钟调用配额（真实积分档为 500）")
+    parser.add_argument('--latency', type=float, default=0.0, help="每次接口调用的模拟延迟（秒）")
+    parser.add_argument('--requests', type=int, default=200, help="每个接口场景的请求数")
+    parser.add_argument('--workdir', help="保留数据库与列式存储的目录，默认使用临时目录")
+    parser.add_argument('--output', help="结果 JSON 路径，默认输出到 stdout")
+    parser.add_argument('--baseline', help="用于比较的历史结果 JSON")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="允许的相对回退比例")
+    args = parser.parse_args(argv)
+    if not 0 < args.stocks <= 5000 or not 0 < args.years <= 10:
+        parser.error("--stocks must be in (0, 5000] and --years in (0, 10]")
+    return args
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    logger.setLevel(logging.INFO)
+
+    with tempfile.TemporaryDirectory(prefix='quant-bench-') as tmp:
+        workdir = Path(args.workdir or tmp)
+        workdir.mkdir(parents=True, exist_ok=True)
+        configure_environment(workdir, args.calls_per_minute)
+        results = asyncio.run(BenchmarkRun(args).run())
+
+    payload = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(payload, encoding='utf-8')
+        logger.info(f"Results written to {args.output}")
+    else:
+        print(payload)
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding='utf-8'))
+        regressions = compare(results, baseline, args.tolerance)
+        for line in regressions:
+            logger.error(f"Regression: {line}")
+        if regressions:
+            return 1
+        logger.info("No regressions against baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
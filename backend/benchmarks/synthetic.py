@@ -0,0 +1,133 @@
+# benchmarks/synthetic.py
+from datetime import datetime, timedelta
+from typing import List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+INDUSTRIES = ['银行', '证券', '保险', '全国地产', '白酒', '医药', '半导体', '软件服务',
+              '通信设备', '汽车整车', '电气设备', '化工原料', '钢铁', '煤炭开采', '电力',
+              '建筑工程', '家用电器', '食品', '航空', '港口']
+AREAS = ['深圳', '上海', '北京', '浙江', '江苏', '广东', '山东', '四川']
+DAILY_COLUMNS = ['ts_code', 'trade_date', 'open', 'high', 'low', 'close', 'pre_close',
+                 'change', 'pct_chg', 'vol', 'amount']
+
+
+def synthetic_codes(n_stocks: int) -> List[str]:
+    """前一半为深市代码，后一半为沪市代码"""
+    sz = (n_stocks + 1) // 2
+    return [f"{i + 1:06d}.SZ" for i in range(sz)] + \
+           [f"{600000 + i:06d}.SH" for i in range(n_stocks - sz)]
+
+
+def synthetic_dates(years: float, end_date: Optional[str] = None) -> List[str]:
+    """截至 end_date（默认昨天）的工作日序列；不模拟节假日"""
+    end = pd.Timestamp(end_date) if end_date else pd.Timestamp(datetime.now().date() - timedelta(days=1))
+    start = end - pd.Timedelta(days=int(round(years * 365)))
+    return pd.bdate_range(start, end).strftime('%Y%m%d').tolist()
+
+
+class SyntheticMarket:
+    """可复现的全市场日线数据
+
+    价格为对数正态随机游走，每只股票有独立的波动率与成交量水平；
+    部分股票在区间内上市，另有少量随机停牌。数据以 股票 × 交易日 的 float32
+    矩阵保存（5000 只 × 10 年约 300MB），查询时再组装为 tushare 格式的 DataFrame。
+    visible 为当前可见的交易日数，用于模拟逐日收盘后的增量更新。
+    """
+
+    def __init__(self, n_stocks: int = 500, years: float = 1.0, seed: int = 0,
+                 end_date: Optional[str] = None, listing_rate: float = 0.2,
+                 suspension_rate: float = 0.005):
+        rng = np.random.default_rng(seed)
+        self.codes = synthetic_codes(n_stocks)
+        self.dates = synthetic_dates(years, end_date)
+        self.visible = len(self.dates)
+        self._code_index = {code: i for i, code in enumerate(self.codes)}
+        n, d = n_stocks, len(self.dates)
+
+        sigma = rng.uniform(0.01, 0.035, size=(n, 1)).astype(np.float32)
+        returns = rng.standard_normal((n, d), dtype=np.float32) * sigma + np.float32(0.0002)
+        log_close = np.cumsum(returns, axis=1)
+        log_close += np.log(rng.uniform(3, 80, size=(n, 1))).astype(np.float32)
+        close = np.exp(log_close)
+        pre_close = close * np.exp(-returns)
+        del log_close, returns
+
+        gap = rng.standard_normal((n, d), dtype=np.float32) * (sigma / 3)
+        self.open = pre_close * (1 + gap)
+        wick = np.abs(rng.standard_normal((n, d), dtype=np.float32)) * (sigma / 2)
+        self.high = np.maximum(self.open, close) * (1 + wick)
+        rng.standard_normal((n, d), dtype=np.float32, out=wick)
+        np.abs(wick, out=wick)
+        self.low = np.minimum(self.open, close) * (1 - wick * (sigma / 2))
+        del wick, gap
+        base_volume = rng.uniform(2e4, 5e5, size=(n, 1)).astype(np.float32)
+        self.vol = base_volume * rng.lognormal(0, 0.4, size=(n, d)).astype(np.float32)
+        # vol 单位为手，amount 单位为千元
+        self.amount = self.vol * close / 10
+        self.close, self.pre_close = close, pre_close
+
+        # 区间内上市的股票在上市前无数据；随机停牌日无数据
+        listed_at = np.zeros(n, dtype=np.int64)
+        late = rng.random(n) < listing_rate
+        listed_at[late] = rng.integers(1, d, size=int(late.sum()))
+        self.traded = np.arange(d)[None, :] >= listed_at[:, None]
+        self.traded &= rng.random((n, d)) >= suspension_rate
+        first_dates = pd.to_datetime(self.dates[0]) - pd.to_timedelta(
+            rng.integers(30, 8000, size=n), unit='D')
+        list_dates = np.where(late, np.array(self.dates, dtype=object)[listed_at],
+                              first_dates.strftime('%Y%m%d').to_numpy(dtype=object))
+
+        self.basics = pd.DataFrame({
+            'ts_code': self.codes,
+            'symbol': [code[:6] for code in self.codes],
+            'name': [f"合成{i:04d}" for i in range(n)],
+            'area': rng.choice(AREAS, size=n),
+            'industry': rng.choice(INDUSTRIES, size=n),
+            'list_date': list_dates,
+        })
+
+    @property
+    def n_rows(self) -> int:
+        """当前可见的日线总行数"""
+        return int(self.traded[:, :self.visible].sum())
+
+    def date_range(self, start_date: Optional[str] = None, end_date: Optional[str] = None) -> slice:
+        """可见交易日中 [start_date, end_date] 对应的列区间"""
+        lo = 0 if start_date is None else int(np.searchsorted(self.dates, start_date))
+        hi = self.visible if end_date is None else int(np.searchsorted(self.dates, end_date, side='right'))
+        return slice(lo, min(hi, self.visible))
+
+    def rows_for(self, codes: Optional[Sequence[str]] = None) -> np.ndarray:
+        if codes is None:
+            return np.arange(len(self.codes))
+        return np.array([self._code_index[c] for c in codes if c in self._code_index], dtype=np.int64)
+
+    def daily(self, rows: np.ndarray, columns: slice) -> pd.DataFrame:
+        """组装日线数据，按交易日倒序（与 tushare 一致）"""
+        dates = np.arange(len(self.dates))[columns][::-1]
+        if len(rows) == 0 or len(dates) == 0:
+            return pd.DataFrame(columns=DAILY_COLUMNS)
+        mask = self.traded[np.ix_(rows, dates)].T
+        date_idx, row_idx = np.nonzero(mask)
+        r, c = rows[row_idx], dates[date_idx]
+        close = self.close[r, c].astype(np.float64)
+        pre_close = self.pre_close[r, c].astype(np.float64)
+        return pd.DataFrame({
+            'ts_code': np.array(self.codes, dtype=object)[r],
+            'trade_date': np.array(self.dates, dtype=object)[c],
+            'open': self.open[r, c].astype(np.float64).round(2),
+            'high': self.high[r, c].astype(np.float64).round(2),
+            'low': self.low[r, c].astype(np.float64).round(2),
+            'close': close.round(2),
+            'pre_close': pre_close.round(2),
+            'change': (close - pre_close).round(2),
+            'pct_chg': ((close / pre_close - 1) * 100).round(4),
+            'vol': self.vol[r, c].astype(np.float64).round(2),
+            'amount': self.amount[r, c].astype(np.float64).round(3),
+        })
+
+    def daily_frame(self) -> pd.DataFrame:
+        """全部可见日线（小规模数据与测试使用）"""
+        return self.daily(self.rows_for(), self.date_range())
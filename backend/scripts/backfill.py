@@ -0,0 +1,42 @@
+# scripts/backfill.py
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.database import init_db
+from app.services.sharded_backfill import ShardedBackfill
+
+def main():
+    # 如: python scripts/backfill.py --start-date 20150101 --workers 8
+    parser = argparse.ArgumentParser(description="Backfill daily data with sharded worker processes "
+                                                 "that share one tushare rate limit")
+    parser.add_argument("--start-date", required=True, help="起始日期 YYYYMMDD")
+    parser.add_argument("--end-date", help="结束日期 YYYYMMDD，默认今天")
+    parser.add_argument("--codes", help="逗号分隔的股票代码，默认全部股票")
+    parser.add_argument("--workers", type=int, help="工作进程数，默认 BACKFILL_WORKERS 或 CPU 核数")
+    parser.add_argument("--staging-dir", help="暂存文件目录，默认 BACKFILL_STAGING_DIR")
+    parser.add_argument("--keep-staging", action="store_true", help="合并后保留暂存文件")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(processName)s - %(name)s - %(levelname)s - %(message)s')
+    init_db()
+    backfill = ShardedBackfill(workers=args.workers, staging_dir=args.staging_dir)
+    codes = [code.strip() for code in args.codes.split(',') if code.strip()] if args.codes else None
+    try:
+        summary = asyncio.run(backfill.run(args.start_date, args.end_date, codes, args.keep_staging))
+    except Exception as e:
+        print(f"Error running backfill: {str(e)}")
+        sys.exit(1)
+
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    if summary['units_failed']:
+        print(f"{summary['units_failed']} units failed, see {summary['staging_dir']}/manifest.json")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+# scripts/backtest_ma_grid.py
+import argparse
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from app.services.backtester import Backtester, ma_crossover
+
+def main():
+    parser = argparse.ArgumentParser(description="Run an MA-crossover parameter sweep over the columnar store")
+    parser.add_argument("--fast", default="2:50", help="快线窗口范围 start:stop，如 2:50")
+    parser.add_argument("--slow", default="20:250:10", help="慢线窗口范围 start:stop[:step]")
+    parser.add_argument("--start-date")
+    parser.add_argument("--end-date")
+    parser.add_argument("--cost-bps", type=float, default=5.0)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--output", help="保存统计 (.csv) 与净值曲线 (同名 .npz)")
+    args = parser.parse_args()
+
+    grid = {'fast': range(*map(int, args.fast.split(':'))),
+            'slow': range(*map(int, args.slow.split(':')))}
+    backtester = Backtester(cost_bps=args.cost_bps)
+    try:
+        results = backtester.run(ma_crossover, grid, start_date=args.start_date,
+                                 end_date=args.end_date, workers=args.workers)
+    except Exception as e:
+        print(f"Error running backtest: {str(e)}")
+        sys.exit(1)
+
+    summary = Backtester.summary_frame(results).sort_values('sharpe', ascending=False)
+    print(summary.head(20).to_string(index=False))
+    if args.output:
+        summary.to_csv(args.output, index=False)
+        np.savez(os.path.splitext(args.output)[0] + '.npz',
+                 equity=np.stack([result.equity for result in results]))
+        print(f"Results saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
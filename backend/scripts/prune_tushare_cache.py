@@ -0,0 +1,26 @@
+# scripts/prune_tushare_cache.py
+import argparse
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.tushare_client import MODE_READWRITE, CachingProApi
+
+def main():
+    parser = argparse.ArgumentParser(description="清理 tushare 响应磁盘缓存")
+    parser.add_argument('--max-age-days', type=int, default=None,
+                        help="删除早于该天数的缓存文件（默认 TUSHARE_CACHE_MAX_AGE_DAYS）")
+    parser.add_argument('--max-mb', type=float, default=None,
+                        help="缓存总大小上限（默认 TUSHARE_CACHE_MAX_MB）")
+    args = parser.parse_args()
+    try:
+        # 清理只操作缓存文件，不需要真实的 tushare 客户端
+        cache = CachingProApi(api=object(), mode=MODE_READWRITE)
+        stats = cache.prune(args.max_age_days, args.max_mb)
+        print(f"Tushare cache pruned: {stats}")
+    except Exception as e:
+        print(f"Error pruning tushare cache: {str(e)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
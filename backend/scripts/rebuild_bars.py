@@ -0,0 +1,25 @@
+# scripts/rebuild_bars.py
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.database import SessionLocal, init_db
+from app.services.resampler import Resampler, PERIOD_MODELS
+
+def main():
+    # 可指定频率，如: python scripts/rebuild_bars.py W
+    frequencies = sys.argv[1:] or list(PERIOD_MODELS)
+    init_db()
+    db = SessionLocal()
+    try:
+        print(f"Rebuilding period bars {frequencies} from daily_data...")
+        counts = Resampler().rebuild(db, frequencies)
+        print(f"Period bars rebuilt successfully: {counts}")
+    except Exception as e:
+        print(f"Error rebuilding period bars: {str(e)}")
+        sys.exit(1)
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+# scripts/rebuild_columnar_store.py
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.database import SessionLocal
+from app.services.columnar_store import get_columnar_store
+from app.services.indicators import IndicatorEngine
+
+def main():
+    db = SessionLocal()
+    try:
+        print("Rebuilding columnar store from daily_data...")
+        rows = get_columnar_store().rebuild(db)
+        print(f"Columnar store rebuilt successfully: {rows} rows")
+        summary = IndicatorEngine(get_columnar_store()).update(full=True)
+        print(f"Indicators recomputed: {summary}")
+    except Exception as e:
+        print(f"Error rebuilding columnar store: {str(e)}")
+        sys.exit(1)
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
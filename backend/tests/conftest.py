@@ -2,6 +2,7 @@ import os
 import sys
 import pytest
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
 
@@ -11,11 +12,12 @@ sys.path.insert(0, project_root)
 
 
 from app.models.base import Base
-from app.core.database import get_db
+from app.core.database import get_db, configure_sqlite
 
 
 # 测试数据库配置
 TEST_DATABASE_URL = "sqlite:///./test.db"
+TEST_ASYNC_DATABASE_URL = "sqlite+aiosqlite:///./test.db"
 
 @pytest.fixture(scope="function")
 def test_db():
@@ -35,4 +37,14 @@ def test_db():
     finally:
         db.close()
         # 清理测试数据库
-        Base.metadata.drop_all(bind=engine)
\ No newline at end of file
+        Base.metadata.drop_all(bind=engine)
+
+@pytest.fixture(scope="function")
+async def test_session_factory(test_db):
+    # 与 test_db 共用同一测试库，表的创建与清理由 test_db 负责
+    engine = create_async_engine(TEST_ASYNC_DATABASE_URL)
+    configure_sqlite(engine.sync_engine)
+    try:
+        yield async_sessionmaker(engine, expire_on_commit=False)
+    finally:
+        await engine.dispose()
@@ -0,0 +1,93 @@
+# tests/test_ai_service.py
+import asyncio
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from app.api.v1.endpoints import ai
+from app.services.ai_service import AIService, StubBackend
+
+
+class TrackingBackend(StubBackend):
+    """记录同时进行的模型流数"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.active = 0
+        self.peak = 0
+        self.produced = 0
+
+    async def stream(self, messages):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            async for chunk in super().stream(messages):
+                self.produced += 1
+                yield chunk
+        finally:
+            self.active -= 1
+
+
+async def _collect(service, data):
+    return ''.join([chunk async for chunk in service.analyze(data)])
+
+
+async def test_concurrent_sessions_are_bounded_and_cached():
+    backend = TrackingBackend(chunk_size=4, delay=0.01)
+    service = AIService(backend, max_concurrent_streams=2)
+
+    texts = await asyncio.gather(*[_collect(service, f'股票{i}') for i in range(5)])
+    assert texts[3] == '【本地分析】请分析以下股票数据：股票3'
+    assert backend.calls == 5 and backend.peak == 2
+
+    # 相同输入直接回放缓存
+    assert await _collect(service, '股票3') == texts[3]
+    assert backend.calls == 5
+
+
+class SlowSocket:
+    """发送很慢的 websocket"""
+
+    def __init__(self):
+        self.sent = []
+
+    async def send_text(self, text):
+        await asyncio.sleep(0.05)
+        self.sent.append(text)
+
+    async def send_json(self, data):
+        self.sent.append(data)
+
+
+async def test_slow_consumer_applies_backpressure():
+    backend = TrackingBackend(chunk_size=1)
+    service = AIService(backend, queue_size=2)
+    socket = SlowSocket()
+    session = asyncio.create_task(service.analyze_market_stream('x' * 100, socket))
+    await asyncio.sleep(0.12)
+    # 生产者最多领先 队列容量 + 正在发送 + 正在放入 的片段
+    assert backend.produced <= len(socket.sent) + 4
+    session.cancel()
+    await asyncio.gather(session, return_exceptions=True)
+    assert backend.active == 0
+
+
+class FixedContext:
+    async def get(self, stock_code, date=None):
+        return f"{stock_code} 行情摘要"
+
+
+def test_websocket_streams_from_stub(monkeypatch):
+    monkeypatch.setattr(ai, 'ai_service', AIService(StubBackend(chunk_size=8)))
+    monkeypatch.setattr(ai, 'market_context', FixedContext())
+    app = FastAPI()
+    app.include_router(ai.router)
+    chunks = []
+    with TestClient(app).websocket_connect('/ws/analyze') as ws:
+        try:
+            while True:
+                chunks.append(ws.receive_text())
+        except WebSocketDisconnect:
+            pass
+    assert len(chunks) > 1 and ''.join(chunks).startswith('【本地分析】')
@@ -0,0 +1,32 @@
+# tests/test_backtester.py
+import numpy as np
+import pandas as pd
+
+from app.services.backtester import Backtester, ma_crossover
+from app.services.columnar_store import ColumnarStore
+from tests.test_indicators import _frame
+
+
+def test_ma_crossover_sweep_pool_matches_in_process(tmp_path):
+    dates = pd.bdate_range('2024-01-01', periods=60).strftime('%Y%m%d').tolist()
+    store = ColumnarStore(str(tmp_path))
+    store.write_frame(_frame(['000001.SZ', '000002.SZ', '000003.SZ'], dates))
+    backtester = Backtester(store, cost_bps=5)
+    grid = {'fast': [3, 5], 'slow': [10, 20]}
+
+    local = backtester.run(ma_crossover, grid, workers=1)
+    pooled = backtester.run(ma_crossover, grid, workers=2)
+    assert [r.params for r in pooled] == [{'fast': 3, 'slow': 10}, {'fast': 3, 'slow': 20},
+                                          {'fast': 5, 'slow': 10}, {'fast': 5, 'slow': 20}]
+    for a, b in zip(local, pooled):
+        np.testing.assert_allclose(a.equity, b.equity)
+        assert a.stats == b.stats
+
+    # 单只股票、无成本时等于按前一日信号持有的收益
+    close = pd.Series(store['close'][0])
+    single = Backtester(store).run(ma_crossover, [{'fast': 3, 'slow': 10}],
+                                   codes=['000001.SZ'])[0]
+    held = (close.rolling(3).mean() > close.rolling(10).mean()).shift(1, fill_value=False)
+    expected = (1 + close.pct_change().fillna(0) * held).cumprod()
+    np.testing.assert_allclose(single.equity, expected)
+    assert set(Backtester.summary_frame(local).columns) >= {'fast', 'slow', 'sharpe', 'max_drawdown'}
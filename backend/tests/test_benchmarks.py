@@ -0,0 +1,43 @@
+# tests/test_benchmarks.py
+import pytest
+
+from benchmarks.fake_tushare import FakeProApi, RateLimitExceeded
+from benchmarks.run import compare
+from benchmarks.synthetic import SyntheticMarket
+
+
+def test_synthetic_market_is_reproducible_and_consistent():
+    market = SyntheticMarket(n_stocks=20, years=0.5, seed=1)
+    frame = market.daily_frame()
+    assert frame.equals(SyntheticMarket(n_stocks=20, years=0.5, seed=1).daily_frame())
+    assert len(frame) == market.n_rows
+    assert (frame['high'] >= frame[['open', 'close']].max(axis=1)).all()
+    assert (frame['low'] <= frame[['open', 'close']].min(axis=1)).all()
+    # 区间内上市的股票不早于上市日出现
+    first = frame.groupby('ts_code')['trade_date'].min()
+    list_dates = market.basics.set_index('ts_code')['list_date']
+    assert (first >= list_dates.reindex(first.index)).all()
+
+
+def test_fake_pro_api_caps_rows_and_rate():
+    market = SyntheticMarket(n_stocks=50, years=1, seed=0)
+    api = FakeProApi(market, row_limit=1000, calls_per_minute=3)
+    df = api.daily(ts_code=','.join(market.codes), start_date=market.dates[0],
+                   end_date=market.dates[-1])
+    # 超出行数上限时丢弃最早的交易日
+    assert len(df) == 1000 and api.truncated == 1
+    assert df['trade_date'].iloc[0] == market.dates[-1]
+    assert len(api.daily(trade_date=market.dates[-1])) <= 50
+    assert list(api.stock_basic(fields='ts_code,name').columns) == ['ts_code', 'name']
+    with pytest.raises(RateLimitExceeded):
+        api.trade_cal(exchange='SSE', start_date=market.dates[0], end_date=market.dates[-1])
+    assert api.total_calls == 3 and api.rejected == 1
+
+
+def test_compare_flags_regressions_by_direction():
+    baseline = {'metrics': {'backfill.rows_per_second': 1000, 'backfill.api_calls': 10,
+                            'endpoint_screen.p95_ms': 2.0, 'backfill.rows': 500}}
+    current = {'metrics': {'backfill.rows_per_second': 700, 'backfill.api_calls': 10,
+                           'endpoint_screen.p95_ms': 1.0, 'backfill.rows': 100}}
+    regressions = compare(current, baseline, tolerance=0.2)
+    assert len(regressions) == 1 and regressions[0].startswith('backfill.rows_per_second')
@@ -0,0 +1,55 @@
+# tests/test_bulk_upsert.py
+import numpy as np
+import pandas as pd
+
+from app.models.stock import DailyData
+from app.services.bulk_upsert import DailyDataUpserter
+
+
+def make_daily_frame(codes, dates, close=10.0):
+    """构造 tushare daily 格式的测试数据"""
+    rows = []
+    for code in codes:
+        for date in dates:
+            rows.append({
+                'ts_code': code,
+                'trade_date': date,
+                'open': close,
+                'high': close + 1,
+                'low': close - 1,
+                'close': close,
+                'vol': 1000.0,
+                'amount': 10000.0,
+            })
+    return pd.DataFrame(rows)
+
+
+def test_upsert_inserts_then_updates(test_db):
+    upserter = DailyDataUpserter(chunk_size=3)
+    df = make_daily_frame(['000001.SZ', '000002.SZ'], ['20240102', '20240103'])
+
+    stats = upserter.upsert(test_db, df)
+    assert stats.inserted == 4
+    assert stats.updated == 0
+    assert len(stats.chunks) == 2
+    assert test_db.query(DailyData).count() == 4
+
+    # 一条已存在，一条新增
+    df2 = make_daily_frame(['000001.SZ'], ['20240103', '20240104'], close=12.0)
+    stats = upserter.upsert(test_db, df2)
+    assert stats.inserted == 1
+    assert stats.updated == 1
+    row = test_db.query(DailyData).filter_by(stock_code='000001.SZ', trade_date='20240103').one()
+    assert row.close == 12.0
+    assert test_db.query(DailyData).count() == 5
+
+
+def test_upsert_handles_nan_and_empty(test_db):
+    upserter = DailyDataUpserter()
+    assert upserter.upsert(test_db, pd.DataFrame()).rows == 0
+
+    df = make_daily_frame(['000001.SZ'], ['20240102'])
+    df.loc[0, 'amount'] = np.nan
+    upserter.upsert(test_db, df)
+    row = test_db.query(DailyData).one()
+    assert row.amount is None
@@ -0,0 +1,51 @@
+# tests/test_columnar_store.py
+import numpy as np
+
+from app.services.columnar_store import ColumnarStore
+from tests.test_bulk_upsert import make_daily_frame
+
+
+def test_write_append_and_backfill(tmp_path):
+    store = ColumnarStore(str(tmp_path))
+    store.write_frame(make_daily_frame(['000001.SZ', '000002.SZ'], ['20240103', '20240104'], close=10.0))
+    # 末尾追加新交易日与新股票
+    store.write_frame(make_daily_frame(['000003.SZ'], ['20240105'], close=11.0))
+    # 插入更早的交易日，触发重新布局
+    store.write_frame(make_daily_frame(['000001.SZ'], ['20240102'], close=9.0))
+
+    assert store.dates == ['20240102', '20240103', '20240104', '20240105']
+    close = store['close']
+    assert close.shape == (3, 4)
+    np.testing.assert_array_equal(close[0], [9.0, 10.0, 10.0, np.nan])
+    np.testing.assert_array_equal(close[2], [np.nan, np.nan, np.nan, 11.0])
+
+    # 其他实例（如其他进程）重新打开后看到相同数据
+    reopened = ColumnarStore(str(tmp_path))
+    panel = reopened.panel('close', codes=['000002.SZ'], start='20240103', end='20240104')
+    assert panel.dates == ['20240103', '20240104']
+    np.testing.assert_array_equal(panel.values, [[10.0, 10.0]])
+
+
+def test_reserved_dates_avoid_relayout_per_write(tmp_path, monkeypatch):
+    store = ColumnarStore(str(tmp_path))
+    store.write_frame(make_daily_frame(['000001.SZ'], ['20240110'], close=10.0))
+    dates = ['20240102', '20240103', '20240104', '20240105', '20240108', '20240109', '20240110', '20240111']
+    # 晚于最新日期的交易日不预留
+    assert store.reserve_dates(dates) == 6
+    assert store.dates == dates[:-1]
+
+    relayouts = []
+    monkeypatch.setattr(store, '_relayout', lambda *args: relayouts.append(args))
+    for date in reversed(dates[:-2]):
+        store.write_frame(make_daily_frame(['000001.SZ'], [date], close=float(date[-1])))
+    store.write_frame(make_daily_frame(['000001.SZ'], ['20240111'], close=11.0))
+    assert not relayouts
+    np.testing.assert_array_equal(store['close'][0], [2, 3, 4, 5, 8, 9, 10, 11])
+
+
+def test_full_panel_is_a_view(tmp_path):
+    store = ColumnarStore(str(tmp_path))
+    store.write_frame(make_daily_frame(['000001.SZ'], ['20240102', '20240103']))
+    panel = store.panel('close', start='20240103')
+    assert np.shares_memory(panel.values, store['close'])
+    assert panel.values.shape == (1, 1)
@@ -0,0 +1,54 @@
+# tests/test_data_consistency.py
+from datetime import datetime
+
+import pandas as pd
+
+from app.models.stock import Stock
+from app.services.bulk_upsert import DailyDataUpserter
+from app.services.columnar_store import ColumnarStore
+from app.services.data_consistency import DataConsistencyService
+from tests.test_bulk_upsert import make_daily_frame
+
+# 20240101 为节假日
+CALENDAR = ['20240102', '20240103', '20240104', '20240105', '20240108', '20240109']
+
+
+class FakeCalendar:
+    async def trade_dates(self, start_date, end_date):
+        return [d for d in CALENDAR if start_date <= d <= end_date]
+
+
+async def test_universe_check_reports_gaps_against_calendar(test_db, test_session_factory, tmp_path):
+    test_db.add_all([
+        Stock(ts_code='000001.SZ', list_date='19910403'),
+        Stock(ts_code='000002.SZ', list_date='19910129'),
+        # 新股，上市前不算缺口
+        Stock(ts_code='301000.SZ', list_date='20240105'),
+    ])
+    test_db.commit()
+
+    frames = pd.concat([
+        make_daily_frame(['000001.SZ'], CALENDAR),
+        make_daily_frame(['000002.SZ'], ['20240102', '20240105', '20240108']),
+        make_daily_frame(['301000.SZ'], ['20240105', '20240108']),
+    ])
+    DailyDataUpserter().upsert(test_db, frames)
+    store = ColumnarStore(str(tmp_path))
+    store.write_frame(frames)
+
+    service = DataConsistencyService(test_session_factory, FakeCalendar(), store)
+    for source in ('store', 'db'):
+        report = await service.check_universe('20240101', '20240109', source=source)
+        assert report.stocks_checked == 3
+        assert report.trading_days == 6
+        assert set(report.reports) == {'000002.SZ', '301000.SZ'}
+        assert report.reports['000002.SZ'].gaps == [('20240103', '20240104'), ('20240109', '20240109')]
+        assert report.reports['000002.SZ'].missing_days == 3
+        assert report.reports['301000.SZ'].gaps == [('20240109', '20240109')]
+        assert report.gap_groups() == {
+            ('20240103', '20240104'): ['000002.SZ'],
+            ('20240109', '20240109'): ['000002.SZ', '301000.SZ'],
+        }
+
+    assert await service.verify_data_integrity('000001.SZ', datetime(2024, 1, 1), datetime(2024, 1, 9))
+    assert not await service.verify_data_integrity('000002.SZ', datetime(2024, 1, 1), datetime(2024, 1, 9))
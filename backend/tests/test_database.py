@@ -0,0 +1,36 @@
+# tests/test_database.py
+import asyncio
+
+from sqlalchemy import text
+
+from app.models.stock import Stock, DailyData
+from app.services.columnar_store import ColumnarStore
+from app.services.stock_service import StockService
+from tests.test_bulk_upsert import make_daily_frame
+
+
+async def test_async_engine_applies_sqlite_pragmas(test_session_factory):
+    async with test_session_factory() as db:
+        assert (await db.execute(text("PRAGMA journal_mode"))).scalar() == 'wal'
+        assert (await db.execute(text("PRAGMA synchronous"))).scalar() == 1  # NORMAL
+
+
+async def test_stock_service_uses_short_lived_sessions(test_db, test_session_factory, tmp_path):
+    test_db.add_all([Stock(ts_code='000001.SZ', name='平安银行'), Stock(ts_code='000002.SZ', name='万科A')])
+    test_db.commit()
+
+    service = StockService(session_factory=test_session_factory)
+    service.columnar_store = ColumnarStore(str(tmp_path))
+
+    # 写入与读取并发进行，互不阻塞
+    stats, stocks = await asyncio.gather(
+        service._batch_update_daily_data(make_daily_frame(['000001.SZ'], ['20240102', '20240103'])),
+        service.get_stock_list(),
+    )
+    assert stats.inserted == 2
+    assert {s['ts_code'] for s in stocks} == {'000001.SZ', '000002.SZ'}
+    assert test_db.query(DailyData).count() == 2
+
+    # 水位已推进：000001.SZ 只需拉取 20240104 之后的数据
+    plan = await service.plan_daily_update()
+    assert all(u.start_date >= '20240104' for u in plan.units if '000001.SZ' in u.codes)
@@ -0,0 +1,55 @@
+# tests/test_fetch_planner.py
+from app.services.fetch_planner import FetchPlanner, MIXED, PER_DATE, PER_STOCK_BATCH
+
+TRADE_DATES = [f'202401{d:02d}' for d in range(2, 32)]
+
+
+def codes(n, offset=0):
+    return [f'{i + offset:06d}.SZ' for i in range(n)]
+
+
+def assert_row_cap(plan, row_limit, trade_dates):
+    for unit in plan.units:
+        if not unit.per_date:
+            days = [d for d in trade_dates if unit.start_date <= d <= unit.end_date]
+            assert len(unit.codes) * len(days) <= row_limit
+
+
+def test_wide_short_update_uses_per_date():
+    planner = FetchPlanner(row_limit=6000, max_codes_per_call=200, market_size=5000)
+    plan = planner.plan({'20240129': codes(5000)}, '20240131', TRADE_DATES)
+    assert plan.strategy == PER_DATE
+    assert plan.predicted_calls == 3
+    assert [u.trade_date for u in plan.units] == ['20240129', '20240130', '20240131']
+    assert len(plan.units[0].codes) == 5000
+
+
+def test_narrow_long_update_uses_stock_batches():
+    planner = FetchPlanner(row_limit=100, max_codes_per_call=200, market_size=5000)
+    plan = planner.plan({'20240102': codes(5)}, '20240131', TRADE_DATES)
+    assert plan.strategy == PER_STOCK_BATCH
+    # 5 只股票 × 30 个交易日 = 150 行，需要 2 次调用
+    assert plan.predicted_calls == 2
+    assert_row_cap(plan, 100, TRADE_DATES)
+
+
+def test_mixed_plan_shares_dates_and_batches_laggards():
+    planner = FetchPlanner(row_limit=6000, max_codes_per_call=200, market_size=5000)
+    plan = planner.plan({
+        '20240131': codes(4000),
+        '20240130': codes(900, offset=4000),
+        '20240102': codes(3, offset=4900),
+    }, '20240131', TRADE_DATES)
+    assert plan.strategy == MIXED
+    assert plan.date_calls == 2
+    assert plan.batch_calls == 1
+    jan31 = next(u for u in plan.units if u.trade_date == '20240131')
+    assert len(jan31.codes) == 4900
+    assert_row_cap(plan, 6000, TRADE_DATES)
+
+
+def test_per_date_disabled_when_market_exceeds_row_limit():
+    planner = FetchPlanner(row_limit=6000, max_codes_per_call=200, market_size=7000)
+    plan = planner.plan({'20240131': codes(5000)}, '20240131', TRADE_DATES)
+    assert plan.strategy == PER_STOCK_BATCH
+    assert plan.predicted_calls == 25
@@ -0,0 +1,47 @@
+# tests/test_indicators.py
+import numpy as np
+import pandas as pd
+
+from app.services.columnar_store import ColumnarStore
+from app.services.indicators import IndicatorEngine
+
+
+def _frame(codes, dates, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for code in codes:
+        close = 10 + np.cumsum(rng.normal(0, 0.2, len(dates)))
+        for date, c in zip(dates, close):
+            rows.append({'ts_code': code, 'trade_date': date, 'open': c, 'high': c + 0.5,
+                         'low': c - 0.5, 'close': c, 'vol': 1000.0, 'amount': 10000.0})
+    return pd.DataFrame(rows)
+
+
+def test_incremental_update_matches_pandas(tmp_path):
+    dates = pd.bdate_range('2024-01-01', periods=80).strftime('%Y%m%d').tolist()
+    codes = ['000001.SZ', '000002.SZ']
+    store = ColumnarStore(str(tmp_path))
+    store.write_frame(_frame(codes, dates[:70]))
+    engine = IndicatorEngine(store)
+    assert engine.update()['dates'] == 70
+
+    # 新交易日只追加计算，结果与一次性全量计算一致
+    store.write_frame(_frame(codes, dates)[lambda df: df['trade_date'] > dates[69]])
+    assert engine.update(changed_since=dates[70])['dates'] == 10
+
+    close = pd.Series(store['close'][0])
+    result = engine.read('000001.SZ', ['ma20', 'ema12', 'rsi14', 'boll_upper'])
+    assert result['dates'] == dates
+    ma20 = np.array(result['indicators']['ma20'], dtype=float)
+    np.testing.assert_allclose(ma20, close.rolling(20).mean(), equal_nan=True)
+    np.testing.assert_allclose(result['indicators']['ema12'],
+                               close.ewm(span=12, adjust=False).mean())
+    upper = close.rolling(20).mean() + 2 * close.rolling(20).std(ddof=0)
+    np.testing.assert_allclose(np.array(result['indicators']['boll_upper'], dtype=float),
+                               upper, equal_nan=True)
+    assert all(0 <= v <= 100 for v in result['indicators']['rsi14'][14:])
+
+    # 修改已计算的历史后全量重算
+    incremental = np.array(store['macd'])
+    assert engine.update(changed_since=dates[10])['dates'] == 80
+    np.testing.assert_allclose(store['macd'], incremental)
@@ -0,0 +1,156 @@
+# tests/test_ingest_pipeline.py
+import asyncio
+import threading
+import time
+
+import pandas as pd
+
+from app.core.circuit_breaker import CircuitBreaker
+from app.core.rate_limiter import TokenBucketRateLimiter
+from app.services.ingest_pipeline import FetchUnit, FetchWritePipeline, RetryPolicy, RetryQueue
+from app.services.tushare_client import CachingProApi
+
+
+async def test_token_bucket_paces_calls():
+    limiter = TokenBucketRateLimiter(calls_per_minute=600)  # 每 0.1s 一次
+    began = time.monotonic()
+    for _ in range(5):
+        await limiter.acquire()
+    # 第一个令牌立即可用，其后每个间隔 0.1s
+    assert time.monotonic() - began >= 0.35
+
+
+async def test_pipeline_overlaps_fetch_and_single_writer():
+    units = [FetchUnit(('000001.SZ',), f'2024010{i}', f'2024010{i}') for i in range(1, 9)]
+    fetch_threads = set()
+    writing = []
+    written = []
+
+    def fetch(unit):
+        fetch_threads.add(threading.get_ident())
+        time.sleep(0.05)
+        if unit.start_date == '20240103':
+            raise RuntimeError("upstream error")
+        return pd.DataFrame({'ts_code': list(unit.codes), 'trade_date': [unit.start_date]})
+
+    async def write(unit, df):
+        # 写入者必须是唯一的
+        assert not writing
+        writing.append(unit)
+        await asyncio.sleep(0.01)
+        writing.pop()
+        written.append(unit)
+        return len(df)
+
+    pipeline = FetchWritePipeline(fetch, write, TokenBucketRateLimiter(60000, burst=8),
+                                  concurrency=4, queue_size=2)
+    result = await pipeline.run(units)
+
+    assert result.api_calls == 8
+    assert result.units_done == 7
+    assert result.rows_written == 7
+    assert [u.start_date for u in result.failed_units] == ['20240103']
+    assert len(fetch_threads) > 1
+    # 8 次 0.05s 的拉取在 4 个线程中并发完成
+    assert result.elapsed < 0.3
+
+
+async def test_pipeline_retries_units_and_slows_limiter_on_rate_limit():
+    units = [FetchUnit(('000001.SZ',), f'2024010{i}', f'2024010{i}') for i in range(1, 9)]
+    attempts = {}
+
+    def fetch(unit):
+        attempts[unit.start_date] = attempts.get(unit.start_date, 0) + 1
+        if attempts[unit.start_date] == 1 and unit.start_date == '20240102':
+            raise RuntimeError("抱歉，您每分钟最多访问该接口500次")
+        if attempts[unit.start_date] <= 2 and unit.start_date == '20240105':
+            raise RuntimeError("connection reset")
+        return pd.DataFrame({'ts_code': list(unit.codes), 'trade_date': [unit.start_date]})
+
+    async def write(unit, df):
+        return len(df)
+
+    limiter = TokenBucketRateLimiter(60000, burst=8)
+    pipeline = FetchWritePipeline(fetch, write, limiter, concurrency=4,
+                                  retry=RetryPolicy(max_attempts=3, base_delay=0.01))
+    result = await pipeline.run(units)
+
+    # 只有失败的单元被重做
+    assert result.success and result.units_done == 8
+    assert result.api_calls == 11 and result.retries == 3 and result.rate_limited == 1
+    assert attempts['20240105'] == 3 and attempts['20240101'] == 1
+    # 被限流后降速，之后随成功调用逐步恢复但尚未回到配额
+    assert limiter.min_rate <= limiter.rate < limiter.max_rate
+
+
+async def test_circuit_breaker_stops_calls_and_queues_remaining_units():
+    now = [0.0]
+    breaker = CircuitBreaker('test', failure_threshold=2, reset_timeout=30, clock=lambda: now[0])
+
+    class DownApi:
+        calls = 0
+        up = False
+
+        def query(self, api_name, **params):
+            DownApi.calls += 1
+            if not DownApi.up:
+                raise ConnectionError("upstream unavailable")
+            return pd.DataFrame({'ts_code': [params['ts_code']], 'trade_date': [params['start_date']]})
+
+    api = CachingProApi(DownApi(), mode='off', breaker=breaker)
+    units = [FetchUnit((f'00000{i}.SZ',), '20240102', '20240102') for i in range(6)]
+
+    def fetch(unit):
+        return api.daily(ts_code=unit.codes[0], start_date=unit.start_date, end_date=unit.end_date)
+
+    async def write(unit, df):
+        return len(df)
+
+    pipeline = FetchWritePipeline(fetch, write, TokenBucketRateLimiter(60000), concurrency=1,
+                                  retry=RetryPolicy(max_attempts=5, base_delay=0.001))
+    result = await pipeline.run(units)
+
+    # 两次失败后熔断，不再请求上游；所有单元留待重试
+    assert DownApi.calls == 2 and breaker.state == 'open'
+    assert result.circuit_open and set(result.failed_units) == set(units)
+    queue = RetryQueue()
+    queue.extend(result.failed_units + units[:2])
+    assert len(queue) == 6
+
+    # 冷却结束后半开，试探调用成功即闭合
+    now[0] = 31
+    DownApi.up = True
+    assert breaker.state == 'half_open'
+    result = await pipeline.run(queue.drain())
+    assert result.success and result.units_done == 6 and breaker.state == 'closed'
+
+
+async def test_half_open_circuit_waits_for_trial_instead_of_aborting():
+    now = [31.0]
+    breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=30, clock=lambda: now[0])
+    breaker.record_failure()
+    now[0] = 62.0
+    calls = []
+
+    class SlowApi:
+        def query(self, api_name, **params):
+            calls.append(params['ts_code'])
+            time.sleep(0.05)
+            return pd.DataFrame({'ts_code': [params['ts_code']], 'trade_date': [params['start_date']]})
+
+    api = CachingProApi(SlowApi(), mode='off', breaker=breaker)
+    units = [FetchUnit((f'00000{i}.SZ',), '20240102', '20240102') for i in range(6)]
+
+    def fetch(unit):
+        return api.daily(ts_code=unit.codes[0], start_date=unit.start_date, end_date=unit.end_date)
+
+    async def write(unit, df):
+        return len(df)
+
+    pipeline = FetchWritePipeline(fetch, write, TokenBucketRateLimiter(60000, burst=8), concurrency=4,
+                                  retry=RetryPolicy(max_attempts=2, base_delay=0.001))
+    result = await pipeline.run(units)
+
+    # 试探期间被拒绝的单元等待试探成功后继续，不中止本次运行，也不计入接口调用
+    assert result.success and not result.circuit_open and result.units_done == 6
+    assert result.api_calls == len(calls) == 6 and breaker.state == 'closed'
@@ -0,0 +1,102 @@
+# tests/test_intraday.py
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import select
+
+from app.core.rate_limiter import TokenBucketRateLimiter
+from app.models import Stock
+from app.models.stock import IntradayBar
+from app.services.intraday import (FakeMinuteSource, IntradayService, MinuteBarAggregator,
+                                   MinuteRingBuffer)
+
+
+def test_aggregator_builds_minute_bars_from_cumulative_quotes():
+    aggregator = MinuteBarAggregator()
+    t0 = datetime(2024, 1, 2, 10, 0, 5)
+
+    def tick(seconds, price, volume):
+        return pd.DataFrame([('000001.SZ', t0 + timedelta(seconds=seconds), price, volume, volume * price)],
+                            columns=['ts_code', 'time', 'price', 'volume', 'amount'])
+
+    aggregator.update(tick(0, 10.0, 1000))
+    aggregator.update(tick(20, 10.5, 1500))
+    bar = aggregator.update(tick(40, 9.8, 1800)).iloc[0]
+    assert (bar['open'], bar['high'], bar['low'], bar['close']) == (10.0, 10.5, 9.8, 9.8)
+    # 首次出现时以当时的累计量为基准
+    assert bar['volume'] == 800
+    bar = aggregator.update(tick(65, 9.9, 2000)).iloc[0]
+    assert bar['trade_time'] == pd.Timestamp('2024-01-02 10:01') and bar['volume'] == 200
+    # 过期快照被忽略
+    assert aggregator.update(tick(30, 11.0, 1700)).empty
+
+
+async def test_poll_read_and_flush(test_db, test_session_factory):
+    codes = [f"{i:06d}.SZ" for i in range(1, 6)]
+    test_db.add_all([Stock(ts_code=code) for code in codes])
+    test_db.commit()
+    now = [datetime(2024, 1, 2, 10, 0, 10)]
+    service = IntradayService(FakeMinuteSource(clock=lambda: now[0]), test_session_factory, capacity=4)
+
+    for minute in range(3):
+        for second in (10, 40):
+            now[0] = datetime(2024, 1, 2, 10, minute, second)
+            assert await service.poll() == 5
+    result = service.recent(codes[:2] + ['999999.SZ'], minutes=30, fields=['close', 'volume'])
+    assert result['times'] == ['2024-01-02T10:00', '2024-01-02T10:01', '2024-01-02T10:02']
+    assert set(result['bars']) == set(codes[:2])
+    assert len(result['bars']['000001.SZ']['close']) == 3
+
+    # 默认只落库已完成的分钟
+    assert await service.flush() == 10
+    assert await service.flush() == 0
+    assert await service.flush(force=True) == 5
+    async with test_session_factory() as db:
+        rows = (await db.execute(select(IntradayBar))).scalars().all()
+    assert len(rows) == 15
+    stored = {(r.stock_code, r.trade_time): r.close for r in rows}
+    assert stored[('000001.SZ', datetime(2024, 1, 2, 10, 2))] == \
+        pytest.approx(result['bars']['000001.SZ']['close'][-1], abs=1e-4)
+
+    # 只刷新指定股票
+    assert await service.poll(codes[:2]) == 2
+
+
+def test_ring_buffer_wraps_and_counts_unflushed_overwrites():
+    buffer = MinuteRingBuffer(capacity=3, codes=['A'])
+    start = pd.Timestamp('2024-01-02 10:00')
+    for minute in range(5):
+        buffer.write(pd.DataFrame({'ts_code': ['A'], 'trade_time': [start + pd.Timedelta(minutes=minute)],
+                                   'open': [1.0], 'high': [1.0], 'low': [1.0], 'close': [float(minute)],
+                                   'volume': [1.0], 'amount': [1.0]}))
+    times, codes, data = buffer.recent(['A'], minutes=10, fields=['close'])
+    assert [str(t) for t in times] == ['2024-01-02T10:02', '2024-01-02T10:03', '2024-01-02T10:04']
+    np.testing.assert_array_equal(data[0, 0], [2.0, 3.0, 4.0])
+    assert buffer.dropped_minutes == 2
+
+
+async def test_concurrent_polls_are_serialized():
+    class Source:
+        batch_size = 2
+        active = peak = calls = 0
+
+        def fetch(self, codes):
+            Source.calls += 1
+            Source.active += 1
+            Source.peak = max(Source.peak, Source.active)
+            time.sleep(0.02)
+            Source.active -= 1
+            return pd.DataFrame(columns=['ts_code', 'trade_time', 'open', 'high', 'low', 'close',
+                                         'volume', 'amount'])
+
+    service = IntradayService(Source(), capacity=4)
+    service.limiter = TokenBucketRateLimiter(600)
+    started = time.monotonic()
+    await asyncio.gather(*(service.poll(['A', 'B', 'C']) for _ in range(3)))
+    # 聚合器状态不是线程安全的：同一时刻只有一次拉取；每次 2 个批次，按每分钟 600 次限流
+    assert Source.calls == 3 and Source.peak == 1
+    assert time.monotonic() - started >= 0.45
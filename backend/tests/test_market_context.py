@@ -0,0 +1,66 @@
+# tests/test_market_context.py
+import pandas as pd
+from sqlalchemy import select
+
+from app.models import Stock
+from app.models.stock import MarketContext
+from app.services.columnar_store import ColumnarStore
+from app.services.market_context import MarketContextBuilder, estimate_tokens
+from tests.test_indicators import _frame
+
+
+async def test_precompute_and_get(tmp_path, test_db, test_session_factory):
+    dates = pd.bdate_range('2024-01-01', periods=70).strftime('%Y%m%d').tolist()
+    codes = ['000001.SZ', '000002.SZ', '600000.SH']
+    frame = _frame(codes, dates)
+    # 最后一日放量
+    frame.loc[frame['trade_date'] == dates[-1], 'vol'] = 5000.0
+    store = ColumnarStore(str(tmp_path))
+    store.write_frame(frame)
+    test_db.add_all([Stock(ts_code='000001.SZ', name='平安银行', industry='银行'),
+                     Stock(ts_code='600000.SH', name='浦发银行', industry='银行')])
+    test_db.commit()
+
+    builder = MarketContextBuilder(store, test_session_factory, token_budget=120)
+    # 不在 stock_basic 中的股票不生成摘要
+    assert await builder.precompute() == 2
+    async with test_session_factory() as db:
+        rows = (await db.execute(select(MarketContext))).scalars().all()
+    assert {row.stock_code for row in rows} == {'000001.SZ', '600000.SH'}
+    assert all(row.trade_date == dates[-1] and row.tokens <= 120 for row in rows)
+
+    summary = await builder.get('000001.SZ')
+    assert summary.startswith('平安银行(000001.SZ) 银行')
+    assert '放量' in summary and '排名' in summary
+    assert estimate_tokens(summary) <= 120
+
+    # 内存缓存失效后从表中读取；历史交易日现场生成
+    builder.cache.invalidate()
+    assert await builder.get('000001.SZ', dates[-1]) == summary
+    assert await builder.get('600000.SH', dates[40]) is not None
+    assert await builder.get('000002.SZ') is None
+
+    # 表中已有该交易日的摘要时不再现场生成，没有摘要的股票也会缓存
+    calls = []
+    precompute = builder.precompute
+
+    async def counting(trade_date=None):
+        calls.append(trade_date)
+        return await precompute(trade_date)
+    builder.precompute = counting
+    builder.cache.invalidate()
+    for _ in range(3):
+        assert await builder.get('000002.SZ', dates[-1]) is None
+        assert await builder.get('000002.SZ', dates[30]) is None
+    assert calls == [dates[30]]
+
+
+def test_budget_trims_low_priority_lines(tmp_path):
+    dates = pd.bdate_range('2024-01-01', periods=30).strftime('%Y%m%d').tolist()
+    store = ColumnarStore(str(tmp_path))
+    store.write_frame(_frame(['000001.SZ'], dates))
+    builder = MarketContextBuilder(store, token_budget=20)
+    summaries = builder._build(dates[-1], {'000001.SZ': ('平安银行', '银行')})
+    text, tokens = summaries['000001.SZ']
+    # 预算不足时至少保留首行
+    assert text.count('\n') == 0 and text.startswith('平安银行')
@@ -0,0 +1,54 @@
+# tests/test_metrics.py
+import httpx
+from fastapi import FastAPI
+
+from app.api.v1.endpoints import metrics
+from app.core.metrics import HTTP_REQUEST_SECONDS, MetricsMiddleware, MetricsRegistry
+from app.core.rate_limiter import TokenBucketRateLimiter
+from app.core.metrics import RATE_LIMITER_WAIT_SECONDS
+
+
+def test_histogram_and_counter_exposition():
+    registry = MetricsRegistry()
+    calls = registry.counter('calls_total', 'Calls', ['api'])
+    latency = registry.histogram('call_seconds', 'Latency', ['api'], buckets=(0.1, 1.0))
+    calls.inc(api='daily')
+    calls.inc(2, api='daily')
+    for value in (0.05, 0.5, 5.0):
+        latency.observe(value, api='daily')
+
+    text = registry.render()
+    assert 'calls_total{api="daily"} 3' in text
+    assert 'call_seconds_bucket{api="daily",le="0.1"} 1' in text
+    assert 'call_seconds_bucket{api="daily",le="1.0"} 2' in text
+    assert 'call_seconds_bucket{api="daily",le="+Inf"} 3' in text
+    assert 'call_seconds_sum{api="daily"} 5.55' in text
+    assert 'call_seconds_count{api="daily"} 3' in text
+
+
+async def test_rate_limiter_wait_is_recorded():
+    before = RATE_LIMITER_WAIT_SECONDS.count()
+    limiter = TokenBucketRateLimiter(6000)
+    await limiter.acquire()
+    await limiter.acquire()
+    assert RATE_LIMITER_WAIT_SECONDS.count() == before + 2
+
+
+async def test_http_latency_labelled_by_route_template():
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+    app.include_router(metrics.router)
+
+    @app.get('/stocks/{stock_code}')
+    async def stock(stock_code: str):
+        return {'code': stock_code}
+
+    before = HTTP_REQUEST_SECONDS.count(method='GET', route='/stocks/{stock_code}', status=200)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://test') as client:
+        for code in ('000001.SZ', '600000.SH'):
+            assert (await client.get(f'/stocks/{code}')).status_code == 200
+        response = await client.get('/metrics')
+    assert response.headers['content-type'].startswith('text/plain; version=0.0.4')
+    assert HTTP_REQUEST_SECONDS.count(method='GET', route='/stocks/{stock_code}', status=200) == before + 2
+    assert 'http_request_duration_seconds_count{method="GET",route="/stocks/{stock_code}",status="200"}' \
+        in response.text
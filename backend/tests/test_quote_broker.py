@@ -0,0 +1,114 @@
+# tests/test_quote_broker.py
+import asyncio
+import json
+
+import pandas as pd
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.v1.endpoints import quotes
+from app.services.quote_broker import QuoteBroker
+
+
+def _bars(prices, minute='2024-01-02 10:00'):
+    return pd.DataFrame({
+        'ts_code': list(prices), 'trade_time': pd.Timestamp(minute),
+        'open': 10.0, 'high': 11.0, 'low': 9.0, 'close': list(prices.values()),
+        'volume': 100.0, 'amount': 1000.0,
+    })
+
+
+class Client:
+    def __init__(self, delay=0.0, block=False):
+        self.messages, self.closed = [], None
+        self.delay, self.block = delay, block
+
+    async def send(self, text):
+        if self.block:
+            await asyncio.Event().wait()
+        await asyncio.sleep(self.delay)
+        self.messages.append(json.loads(text))
+
+    async def close(self, code, reason):
+        self.closed = (code, reason)
+
+    def closes(self):
+        return [row[5] for message in self.messages for row in message['data']]
+
+
+async def test_subscribers_receive_only_changed_codes():
+    broker = QuoteBroker()
+    a, b = Client(), Client()
+    sub_a, sub_b = broker.connect(a.send, a.close), broker.connect(b.send, b.close)
+    broker.subscribe(sub_a, ['000001.SZ', '000002.SZ'])
+    broker.subscribe(sub_b, ['600000.SH'])
+
+    assert broker.publish(_bars({'000001.SZ': 10.0, '000002.SZ': 20.0, '600000.SH': 30.0})) == 2
+    await asyncio.sleep(0.01)
+    assert [row[0] for row in a.messages[0]['data']] == ['000001.SZ', '000002.SZ']
+    assert b.messages[0]['data'] == [['600000.SH', '10:00', 10.0, 11.0, 9.0, 30.0, 100.0, 1000.0]]
+
+    # 未变化的行情不推送
+    assert broker.publish(_bars({'000001.SZ': 10.0, '000002.SZ': 20.5, '600000.SH': 30.0})) == 1
+    await asyncio.sleep(0.01)
+    assert a.messages[1]['data'][0][0] == '000002.SZ' and len(b.messages) == 1
+
+    # 新订阅立即收到已有行情的快照
+    broker.subscribe(sub_b, ['000001.SZ'])
+    await asyncio.sleep(0.01)
+    assert b.messages[-1]['data'][0][:1] == ['000001.SZ']
+    await broker.disconnect(sub_a)
+    await broker.disconnect(sub_b)
+    assert not broker.subscribers
+
+
+async def test_slow_consumers_are_conflated_or_dropped():
+    broker = QuoteBroker(send_timeout=0.05, max_conflated_ticks=50)
+    fast, slow, stuck = Client(), Client(delay=0.03), Client(block=True)
+    subs = [broker.connect(c.send, c.close) for c in (fast, slow, stuck)]
+    for sub in subs:
+        broker.subscribe(sub, ['000001.SZ'])
+
+    for i in range(10):
+        broker.publish(_bars({'000001.SZ': 10.0 + i}))
+        await asyncio.sleep(0.005)
+    await asyncio.sleep(0.15)
+    # 快的订阅者不受影响；慢的订阅者只收到合并后的最新值
+    assert len(fast.messages) == 10
+    assert 1 < len(slow.messages) < 10 and slow.closes()[-1] == 19.0
+    assert stuck.closed == (1013, 'send_timeout') and subs[2] not in broker.subscribers
+
+    # 发送中持续积压的订阅者被断开
+    broker.max_conflated_ticks = 2
+    for i in range(5):
+        broker.publish(_bars({'000001.SZ': 30.0 + i}))
+        await asyncio.sleep(0.002)
+    await asyncio.sleep(0.01)
+    assert slow.closed == (1013, 'lagging') and broker.subscribers == {subs[0]}
+    await broker.disconnect(subs[0])
+
+
+def test_websocket_subscription(monkeypatch):
+    prices = iter(range(100))
+    polled = []
+
+    async def poll(codes):
+        polled.append(codes)
+        broker.publish(_bars({'000001.SZ': 10.0 + next(prices), '000002.SZ': 5.0}))
+
+    broker = QuoteBroker(poll=poll, poll_interval=0.01)
+    monkeypatch.setattr(quotes, 'broker', broker)
+    app = FastAPI()
+    app.include_router(quotes.router)
+    with TestClient(app).websocket_connect('/ws/quotes') as ws:
+        assert ws.receive_json()['type'] == 'hello'
+        ws.send_text(json.dumps({'action': 'subscribe', 'codes': ['000001.SZ']}))
+        for _ in range(3):
+            message = ws.receive_json()
+            assert message['type'] == 'quotes'
+            assert [row[0] for row in message['data']] == ['000001.SZ']
+        ws.send_text(json.dumps({'action': 'watch'}))
+        while (message := ws.receive_json())['type'] != 'error':
+            pass
+    # 上游只拉取被订阅的股票
+    assert polled and all(codes == ['000001.SZ'] for codes in polled)
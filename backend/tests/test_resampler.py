@@ -0,0 +1,33 @@
+# tests/test_resampler.py
+from app.models.stock import MonthlyData, WeeklyData
+from app.services.bulk_upsert import DailyDataUpserter
+from app.services.resampler import Resampler
+from tests.test_bulk_upsert import make_daily_frame
+
+
+def _bars(db, model):
+    return {(r.stock_code, r.period): (r.trade_date, r.open, r.high, r.close, r.volume, r.bar_count)
+            for r in db.query(model).all()}
+
+
+def test_resampler_rebuild_and_incremental_update(test_db):
+    # 20240102-20240105 为同一周，20240108 为下一周
+    DailyDataUpserter().upsert(test_db, make_daily_frame(['000001.SZ'], ['20240102', '20240103']))
+    DailyDataUpserter().upsert(test_db, make_daily_frame(['000001.SZ'], ['20240104'], close=12.0))
+
+    resampler = Resampler()
+    assert resampler.rebuild(test_db) == {'W': 1, 'M': 1}
+    assert _bars(test_db, WeeklyData) == {
+        ('000001.SZ', '20240101'): ('20240104', 10.0, 13.0, 12.0, 3000.0, 3)}
+
+    # 新数据只重算所在周期，周期内的历史日线一并参与聚合
+    new = make_daily_frame(['000001.SZ'], ['20240105', '20240108'], close=11.0)
+    DailyDataUpserter().upsert(test_db, new, commit=False)
+    assert resampler.update_touched(test_db, new) == {'W': 2, 'M': 1}
+    test_db.commit()
+
+    assert _bars(test_db, WeeklyData) == {
+        ('000001.SZ', '20240101'): ('20240105', 10.0, 13.0, 11.0, 4000.0, 4),
+        ('000001.SZ', '20240108'): ('20240108', 11.0, 12.0, 11.0, 1000.0, 1)}
+    assert _bars(test_db, MonthlyData) == {
+        ('000001.SZ', '20240101'): ('20240108', 10.0, 13.0, 11.0, 5000.0, 5)}
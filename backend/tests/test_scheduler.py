@@ -0,0 +1,55 @@
+# tests/test_scheduler.py
+import asyncio
+
+from app.core.scheduler import StockDataScheduler
+from app.services.job_history import JobHistoryService, track_api_call, track_rows
+
+
+class FakeStockService:
+    def __init__(self):
+        self.calls = 0
+
+    async def update_stock_basics(self):
+        self.calls += 1
+        await asyncio.to_thread(track_api_call)
+        track_rows(3)
+
+    async def update_daily_data(self):
+        raise RuntimeError("quota exceeded")
+
+
+async def test_jobs_reuse_service_and_record_history(test_session_factory):
+    service = FakeStockService()
+    history = JobHistoryService(test_session_factory)
+    scheduler = StockDataScheduler(stock_service=service, job_history=history)
+
+    await scheduler._run_job('update_stock_basics', scheduler._update_stock_basics)
+    await scheduler._run_job('update_stock_basics', scheduler._update_stock_basics)
+    await scheduler._run_job('update_daily_data', scheduler._update_daily_data)
+    assert scheduler.stock_service is service and service.calls == 2
+
+    runs = await history.recent()
+    assert [(r['job_id'], r['status'], r['rows'], r['api_calls']) for r in runs] == [
+        ('update_daily_data', 'failed', 0, 0),
+        ('update_stock_basics', 'success', 3, 1),
+        ('update_stock_basics', 'success', 3, 1)]
+    assert runs[0]['error'] == 'quota exceeded'
+
+
+async def test_overlapping_runs_are_skipped(test_session_factory):
+    history = JobHistoryService(test_session_factory)
+    scheduler = StockDataScheduler(stock_service=FakeStockService(), job_history=history)
+
+    async def slow():
+        await asyncio.sleep(0.5)
+
+    scheduler.scheduler.add_job(scheduler._run_job, 'interval', seconds=0.1,
+                                args=['slow', slow], id='slow')
+    scheduler.start()
+    await asyncio.sleep(0.75)
+    scheduler.scheduler.shutdown(wait=False)
+    await asyncio.sleep(0.05)
+
+    statuses = [r['status'] for r in await history.recent(job_id='slow')]
+    assert statuses.count('success') == 1
+    assert statuses.count('skipped') >= 2
@@ -0,0 +1,114 @@
+# tests/test_sharded_backfill.py
+import json
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import pandas as pd
+import pytest
+
+from benchmarks.fake_tushare import FakeProApi, synthetic_pro_api
+from benchmarks.synthetic import SyntheticMarket
+
+from app.core.config import settings
+from app.core.rate_limiter import SharedRateLimiter
+from app.models.stock import DailyData, DailyWatermark, Stock
+from app.services.columnar_store import ColumnarStore
+from app.services.ingest_pipeline import FetchUnit
+from app.services.sharded_backfill import ShardedBackfill, normalize_daily
+from app.services.stock_service import StockService
+from app.services.tushare_client import CachingProApi
+
+_limiter = None
+
+
+def _init(limiter):
+    global _limiter
+    _limiter = limiter
+
+
+def _reserve_times(n):
+    times = []
+    for _ in range(n):
+        time.sleep(_limiter.reserve())
+        times.append(time.monotonic())
+    return times
+
+
+def test_shared_rate_limiter_spaces_calls_across_processes():
+    context = multiprocessing.get_context('spawn')
+    limiter = SharedRateLimiter(calls_per_minute=1200, context=context)  # 每 0.05s 一次
+    with ProcessPoolExecutor(max_workers=2, mp_context=context, initializer=_init,
+                             initargs=(limiter,)) as pool:
+        times = sorted(t for part in pool.map(_reserve_times, [8, 8]) for t in part)
+    gaps = [b - a for a, b in zip(times, times[1:])]
+    # 两个进程的 16 次调用按同一时间表错开
+    assert min(gaps) > 0.04
+
+
+def test_normalize_drops_rows_outside_unit_and_invalid_prices():
+    unit = FetchUnit(('000001.SZ', '000002.SZ'), '20240102', '20240103')
+    df = pd.DataFrame({
+        'ts_code': ['000001.SZ', '000001.SZ', '000002.SZ', '000003.SZ', '000002.SZ', '000002.SZ'],
+        'trade_date': ['20240102', '20240103', '20240104', '20240102', '20240102', '20240103'],
+        'open': [10, 10.2, 5, 3, 5, 5.1],
+        'high': [10.5, 10.4, 5.2, 3.1, 4.0, 5.3],
+        'low': [9.9, 10.0, 4.9, 2.9, 4.8, 5.0],
+        'close': [10.2, 10.3, 5.1, 3.0, 4.9, None],
+        'vol': [100, 120, 80, 60, 70, 90],
+        'amount': [1000, 1200, 800, 600, 700, 900],
+    })
+    clean, invalid = normalize_daily(df, unit)
+    # 日期超出范围、股票不属于本单元、最高价低于最低价、收盘价缺失
+    assert invalid == 4
+    assert clean[['ts_code', 'trade_date']].values.tolist() == [['000001.SZ', '20240102'],
+                                                                ['000001.SZ', '20240103']]
+    assert clean['close'].dtype == 'float64'
+
+
+async def test_sharded_backfill_stages_and_merges(test_db, test_session_factory, tmp_path, monkeypatch):
+    market = SyntheticMarket(10, 0.25, seed=4)
+    test_db.add_all([Stock(ts_code=code, name=code) for code in market.codes])
+    test_db.commit()
+    monkeypatch.setattr(settings, 'TUSHARE_CALLS_PER_MINUTE', 6000)
+
+    service = StockService(session_factory=test_session_factory)
+    service.ts_api = service.calendar.ts_api = CachingProApi(FakeProApi(market), mode='off')
+    service.columnar_store = ColumnarStore(str(tmp_path / 'columnar'))
+    service.SINGLE_QUERY_LIMIT = 50
+
+    async def skip_derived(changed_since):
+        pass
+    service._refresh_derived = skip_derived
+
+    backfill = ShardedBackfill(service, workers=2, staging_dir=str(tmp_path / 'staging'),
+                               api_factory=partial(synthetic_pro_api, 10, 0.25, seed=4),
+                               flush_rows=100)
+    summary = await backfill.run(market.dates[0], market.dates[-1])
+
+    assert summary['shards'] == 2 and summary['units_failed'] == 0
+    assert summary['units_done'] == summary['units_total'] == summary['api_calls']
+    assert summary['rows_staged'] == summary['rows_merged'] == market.n_rows
+    assert summary['invalid_rows'] == 0 and summary['staging_dir'] is None
+    assert test_db.query(DailyData).count() == market.n_rows
+    assert test_db.query(DailyWatermark).count() == len(market.codes)
+    assert not any((tmp_path / 'staging').iterdir())
+
+    # 合并中途出错：manifest 已在合并前写入，并记录了已导入的文件
+    merge = service._batch_update_daily_data
+    calls = []
+
+    async def failing(df, *args, **kwargs):
+        calls.append(len(df))
+        if len(calls) == 2:
+            raise RuntimeError('disk full')
+        return await merge(df, *args, **kwargs)
+    service._batch_update_daily_data = failing
+    with pytest.raises(RuntimeError):
+        await backfill.run(market.dates[0], market.dates[-1])
+    staging, = (tmp_path / 'staging').iterdir()
+    manifest = json.loads((staging / 'manifest.json').read_text(encoding='utf-8'))
+    assert manifest['status'] == 'merge_failed' and manifest['error'] == 'disk full'
+    assert manifest['merged_files'] == manifest['files'][:1] and len(manifest['files']) > 2
+
@@ -0,0 +1,66 @@
+# tests/test_stock_basic_sync.py
+import pandas as pd
+from sqlalchemy import event
+
+from app.models.stock import Stock
+from app.services.stock_basic_sync import StockBasicSync
+from app.services.stock_service import StockService
+from app.services.tushare_client import CachingProApi
+
+
+def _basics(n, industry='银行'):
+    return pd.DataFrame({
+        'ts_code': [f'{i:06d}.SZ' for i in range(n)],
+        'symbol': [f'{i:06d}' for i in range(n)],
+        'name': [f'股票{i}' for i in range(n)],
+        'area': ['深圳'] * n,
+        'industry': [industry] * n,
+        'list_date': ['19910403'] * n,
+    })
+
+
+class StockBasicApi:
+    def __init__(self, df):
+        self.df = df
+        self.calls = 0
+
+    def query(self, api_name, **params):
+        self.calls += 1
+        return self.df.copy()
+
+
+def test_only_changed_rows_are_written(test_db):
+    sync = StockBasicSync()
+    df = _basics(100)
+    df.loc[0, 'industry'] = None
+    stats = sync.apply(test_db, df)
+    test_db.commit()
+    assert (stats.inserted, stats.updated, stats.unchanged) == (100, 0, 0)
+
+    # 空值与 NULL 视为相同，无变化时不写库
+    statements = []
+    engine = test_db.get_bind()
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, 'before_cursor_execute', listener)
+    stats = sync.apply(test_db, df)
+    event.remove(engine, 'before_cursor_execute', listener)
+    assert (stats.inserted, stats.updated, stats.unchanged) == (0, 0, 100)
+    assert [s for s in statements if not s.lstrip().upper().startswith('SELECT')] == []
+
+    df.loc[5, 'name'] = '新名称'
+    df = pd.concat([df, _basics(101).tail(1)])
+    stats = sync.apply(test_db, df)
+    test_db.commit()
+    assert (stats.inserted, stats.updated, stats.unchanged) == (1, 1, 99)
+    assert test_db.get(Stock, '000005.SZ').name == '新名称'
+    assert test_db.query(Stock).count() == 101
+
+
+async def test_update_stock_basics_bypasses_response_cache(test_db, test_session_factory, tmp_path):
+    service = StockService(session_factory=test_session_factory)
+    api = StockBasicApi(_basics(3))
+    service.ts_api = CachingProApi(api, cache_dir=str(tmp_path), mode='readwrite')
+
+    assert (await service.update_stock_basics()).inserted == 3
+    stats = await service.update_stock_basics()
+    assert api.calls == 2 and stats.changed == 0
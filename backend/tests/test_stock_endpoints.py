@@ -0,0 +1,155 @@
+# tests/test_stock_endpoints.py
+import asyncio
+import io
+import json
+
+import httpx
+import pyarrow as pa
+import pytest
+from fastapi import FastAPI
+
+from app.api.v1.endpoints import stocks
+from app.core.cache import TTLCache, reference_cache
+from app.models.stock import Stock
+from app.services.bulk_upsert import DailyDataUpserter
+from app.services.columnar_store import ColumnarStore
+from app.services.daily_query import DailyQueryService
+from app.services.screener import Screener
+from app.services.stock_service import StockService
+from tests.test_bulk_upsert import make_daily_frame
+
+
+@pytest.fixture
+async def client(test_db, test_session_factory, monkeypatch, tmp_path):
+    test_db.add_all([Stock(ts_code='000001.SZ', name='平安银行', industry='银行'),
+                     Stock(ts_code='000002.SZ', name='万科A', industry='全国地产')])
+    test_db.commit()
+    monkeypatch.setattr(stocks, 'stock_service', StockService(session_factory=test_session_factory))
+    monkeypatch.setattr(stocks, 'daily_query_service', DailyQueryService(test_session_factory))
+    store = ColumnarStore(str(tmp_path / 'columnar'))
+    monkeypatch.setattr(stocks, 'screener', Screener(store, test_session_factory))
+    reference_cache.invalidate()
+
+    app = FastAPI()
+    app.include_router(stocks.router)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://test') as c:
+        yield c
+    reference_cache.invalidate()
+
+
+async def test_ttl_cache_discards_loads_overlapping_invalidation():
+    cache = TTLCache(ttl=60)
+    started, release = asyncio.Event(), asyncio.Event()
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        started.set()
+        await release.wait()
+        return len(calls)
+
+    # 加载期间数据更新并失效：旧结果只返回给调用方，不写入缓存
+    first = asyncio.create_task(cache.get_or_load('k', loader))
+    waiter = asyncio.create_task(cache.get_or_load('k', loader))
+    await started.wait()
+    cache.invalidate()
+    release.set()
+    assert await first == 1
+    assert await waiter == 2
+    assert cache.get('k') == 2 and len(calls) == 2
+    # 锁在无人使用后释放
+    assert not cache._locks
+
+
+async def test_stock_list_is_cached_with_conditional_responses(client, test_db):
+    response = await client.get('/stocks/')
+    assert response.status_code == 200
+    assert {s['ts_code'] for s in response.json()} == {'000001.SZ', '000002.SZ'}
+    etag = response.headers['etag']
+    assert 'last-modified' not in response.headers
+
+    assert (await client.get('/stocks/', headers={'If-None-Match': etag})).status_code == 304
+    # 只按 ETag 判断，If-Modified-Since 不会得到 304
+    assert (await client.get('/stocks/', headers={
+        'If-Modified-Since': 'Fri, 01 Jan 2100 00:00:00 GMT'})).status_code == 200
+
+    # 缓存命中时不访问数据库
+    test_db.add(Stock(ts_code='000003.SZ', name='测试'))
+    test_db.commit()
+    assert len((await client.get('/stocks/')).json()) == 2
+
+    # 失效后重新加载，ETag 随内容变化
+    reference_cache.invalidate()
+    response = await client.get('/stocks/', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert len(response.json()) == 3
+    assert response.headers['etag'] != etag
+
+
+async def test_single_stock_and_not_found(client):
+    response = await client.get('/stocks/000001.SZ')
+    assert response.status_code == 200
+    assert response.json()['name'] == '平安银行'
+    assert (await client.get('/stocks/999999.SZ')).status_code == 404
+
+
+DATES = ['20240102', '20240103', '20240104', '20240105', '20240108']
+
+
+async def test_daily_range_with_projection_and_keyset_pages(client, test_db):
+    DailyDataUpserter().upsert(test_db, make_daily_frame(['000001.SZ', '000002.SZ'], DATES))
+
+    response = await client.get('/stocks/000001.SZ/daily', params={
+        'start_date': '20240103', 'columns': 'close,volume', 'limit': 2})
+    body = response.json()
+    assert body['columns'] == ['stock_code', 'trade_date', 'close', 'volume']
+    assert [row['trade_date'] for row in body['data']] == ['20240103', '20240104']
+    assert body['next_cursor'] == '000001.SZ:20240104'
+
+    body = (await client.get('/stocks/000001.SZ/daily', params={
+        'start_date': '20240103', 'limit': 2, 'after': body['next_cursor']})).json()
+    assert [row['trade_date'] for row in body['data']] == ['20240105', '20240108']
+
+    assert (await client.get('/stocks/000001.SZ/daily', params={'columns': 'pe'})).status_code == 400
+
+
+async def test_multi_code_streaming_formats(client, test_db):
+    DailyDataUpserter().upsert(test_db, make_daily_frame(['000001.SZ', '000002.SZ'], DATES))
+    params = {'codes': '000002.SZ,000001.SZ', 'end_date': '20240104', 'limit': 2}
+
+    response = await client.get('/stocks/daily', params={**params, 'format': 'ndjson'})
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [(r['stock_code'], r['trade_date']) for r in rows] == [
+        ('000001.SZ', '20240102'), ('000001.SZ', '20240103'), ('000001.SZ', '20240104'),
+        ('000002.SZ', '20240102'), ('000002.SZ', '20240103'), ('000002.SZ', '20240104')]
+
+    response = await client.get('/stocks/daily', params={**params, 'format': 'arrow', 'columns': 'close'})
+    table = pa.ipc.open_stream(io.BytesIO(response.content)).read_all()
+    assert table.column_names == ['stock_code', 'trade_date', 'close']
+    assert table.num_rows == 6
+
+
+async def test_screen_latest_cross_section(client):
+    store = stocks.screener.store
+    store.write_frame(make_daily_frame(['000001.SZ', '000002.SZ'], DATES[:-1], close=10.0))
+    last = make_daily_frame(['000001.SZ', '000002.SZ'], DATES[-1:], close=11.0)
+    last.loc[last['ts_code'] == '000001.SZ', 'vol'] = 5000.0
+    store.write_frame(last)
+
+    response = await client.post('/stocks/screen', json={
+        'expression': "close > prev_close and vol > 2 * avg_vol_5", 'fields': ['name', 'pct_chg']})
+    body = response.json()
+    assert body['date'] == '20240108' and body['total'] == 1
+    assert body['items'] == [{'ts_code': '000001.SZ', 'name': '平安银行', 'pct_chg': pytest.approx(10.0)}]
+
+    body = (await client.post('/stocks/screen', json={
+        'expression': "industry in ['银行', '全国地产']", 'date': '20240103',
+        'sort_by': 'ts_code', 'descending': False})).json()
+    assert [item['ts_code'] for item in body['items']] == ['000001.SZ', '000002.SZ']
+
+    for expression in ["__import__('os').system('id')", "close.real > 1", "close + 1",
+                       "close > 9 ** 9 ** 9", "name == 'x' * 100000000",
+                       "name * 1000000000 == 'x'", "close ** vol > 1",
+                       "industry in ['银行'] * 100000000"]:
+        response = await client.post('/stocks/screen', json={'expression': expression})
+        assert response.status_code == 400
@@ -0,0 +1,68 @@
+# tests/test_tushare_client.py
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+
+from app.core.exceptions import DataFetchError
+from app.services.tushare_client import CachingProApi
+
+
+class CountingApi:
+    """记录调用次数的假 pro_api"""
+
+    def __init__(self):
+        self.calls = []
+
+    def query(self, api_name, **params):
+        self.calls.append((api_name, params))
+        return pd.DataFrame({'ts_code': ['000001.SZ'], 'close': [10.5], 'calls': [len(self.calls)]})
+
+
+def test_cache_ttl_by_data_age_and_replay(tmp_path):
+    fake = CountingApi()
+    api = CachingProApi(fake, cache_dir=str(tmp_path), mode='readwrite', recent_ttl=0)
+
+    # 历史数据：参数顺序与 fields 空白不影响缓存键，再次请求不访问接口
+    first = api.daily(trade_date='20240102', fields='ts_code, close')
+    again = api.daily(fields='ts_code,close', trade_date='20240102')
+    pd.testing.assert_frame_equal(first, again)
+    assert len(fake.calls) == 1 and api.stats.hits == 1
+
+    # 包含今天的数据立即过期（recent_ttl=0），每次重新请求
+    today = datetime.now().strftime('%Y%m%d')
+    api.daily(ts_code='000001.SZ', start_date='20240101', end_date=today)
+    api.daily(ts_code='000001.SZ', start_date='20240101', end_date=today)
+    assert len(fake.calls) == 3
+
+    # 回放模式不需要真实客户端，忽略过期时间，未记录的请求报错
+    replay = CachingProApi(None, cache_dir=str(tmp_path), mode='replay')
+    assert replay.daily(trade_date='20240102', fields='ts_code,close')['calls'].tolist() == [1]
+    assert replay.daily(ts_code='000001.SZ', start_date='20240101', end_date=today)['calls'].tolist() == [3]
+    tomorrow = (datetime.now() + timedelta(days=1)).strftime('%Y%m%d')
+    with pytest.raises(DataFetchError):
+        replay.daily(trade_date=tomorrow)
+    assert len(fake.calls) == 3
+
+
+def test_empty_responses_expire_and_prune(tmp_path):
+    class EmptyApi(CountingApi):
+        def query(self, api_name, **params):
+            super().query(api_name, **params)
+            return pd.DataFrame()
+
+    fake = EmptyApi()
+    api = CachingProApi(fake, cache_dir=str(tmp_path), mode='readwrite', recent_ttl=0)
+    # 历史日期的空响应可能只是数据尚未发布，不永久缓存
+    api.daily(trade_date='20240102')
+    api.daily(trade_date='20240102')
+    assert len(fake.calls) == 2
+    # 请求结束后不保留按键的锁
+    assert api._locks == {}
+
+    api = CachingProApi(CountingApi(), cache_dir=str(tmp_path), mode='readwrite')
+    for day in ('20240103', '20240104', '20240105'):
+        api.daily(trade_date=day)
+    # 空响应已过期被删除；超过总大小上限时先删最旧的文件
+    assert api.prune(max_mb=0)['removed'] == 1
+    assert api.prune(max_mb=1e-9) == {'removed': 3, 'remaining': 0, 'bytes': 0}
@@ -0,0 +1,55 @@
+# tests/test_watermark.py
+from app.models.stock import DailyWatermark
+from app.services.bulk_upsert import DailyDataUpserter
+from app.services.ingest_pipeline import FetchUnit
+from app.services.watermark import WatermarkService, WatermarkTracker
+from tests.test_bulk_upsert import make_daily_frame
+
+
+def test_watermarks_seed_advance_and_group(test_db):
+    service = WatermarkService()
+    DailyDataUpserter().upsert(test_db, make_daily_frame(['000001.SZ'], ['20240102', '20240103']))
+
+    # 水位表为空时从 daily_data 补齐
+    watermarks = service.load(test_db, ['000001.SZ', '000002.SZ'])
+    assert watermarks == {'000001.SZ': '20240103', '000002.SZ': None}
+
+    service.advance(test_db, make_daily_frame(['000001.SZ', '000002.SZ'], ['20240104']))
+    # 回补旧数据不会回退水位
+    service.advance(test_db, make_daily_frame(['000001.SZ'], ['20231229']))
+    test_db.commit()
+    assert dict(test_db.query(DailyWatermark.stock_code, DailyWatermark.last_trade_date).all()) == {
+        '000001.SZ': '20240104', '000002.SZ': '20240104'}
+
+    groups = service.group_by_gap(
+        {'000001.SZ': '20240104', '000002.SZ': '20240104', '000003.SZ': None, '000004.SZ': '20240110'},
+        default_start='20230110', end_date='20240110')
+    assert groups == {'20240105': ['000001.SZ', '000002.SZ'], '20230110': ['000003.SZ']}
+
+
+def test_tracker_holds_watermark_below_unfinished_units(test_db):
+    service = WatermarkService()
+    early = FetchUnit(('000001.SZ', '000002.SZ'), '20240102', '20240103')
+    late = FetchUnit(('000001.SZ', '000002.SZ'), '20240104', '20240105')
+    tracker = WatermarkTracker([early, late])
+
+    def write(df, unit):
+        service.advance(test_db, df, tracker, unit)
+        test_db.commit()
+        tracker.commit(df, unit)
+        return dict(test_db.query(DailyWatermark.stock_code, DailyWatermark.last_trade_date).all())
+
+    # 较晚的时间片先完成：水位停在较早单元之前，不越过可能失败的缺口
+    assert write(make_daily_frame(['000001.SZ', '000002.SZ'], ['20240104', '20240105']), late) == {
+        '000001.SZ': '20240101', '000002.SZ': '20240101'}
+    # 较早的单元完成后推进到已写入的最新日期；停牌股票没有数据也算完成
+    assert write(make_daily_frame(['000001.SZ'], ['20240102', '20240103']), early) == {
+        '000001.SZ': '20240105', '000002.SZ': '20240105'}
+    # 派生数据从实际写入的最早交易日重算，空单元不计入
+    assert tracker.earliest_written == '20240102'
+    tracker.commit(None, FetchUnit(('000003.SZ',), '20230101', '20240105'))
+    assert tracker.earliest_written == '20240102'
+
+    # 失败的单元一直压住水位
+    assert WatermarkTracker([early]).resolve(make_daily_frame(['000001.SZ'], ['20240105'])) == {
+        '000001.SZ': '20240101'}